@@ -1,10 +1,28 @@
 """
+Format original behavioral files for analysis
 
+By default, only session files that are new or have changed since the last
+run are formatted (using a manifest of the files formatted for each ferret,
+identified by content hash). New sessions are merged with existing data for
+each ferret from the trial store, sessions are numbered in chronological
+order, and the formatted csv files, trial store and count cube are updated.
+Ferrets without a manifest are formatted from scratch.
+
+Usage:
+    python Analysis/Main/Data/format_data.py                # Format new or changed files
+    python Analysis/Main/Data/format_data.py --full         # Format all files
+    python Analysis/Main/Data/format_data.py --watch 600    # Check for new files every 10 minutes
+
+Updated:
+    2026-10-18: Incremental and watch modes
 
 """
 
+import argparse
 import os
 import sys
+import time
+import traceback
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -15,50 +33,280 @@ import seaborn as sns
 sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../../..')))
 from Analysis import ferrets
 from Analysis import cf_behavior as cf
+from Analysis import cf_catalog as ccat
+from Analysis import cf_counts as cfc
+from Analysis import cf_store as cfs
 
 
 original_data = Path('Analysis/Main/Data/Original')
+catalog_path = Path('Analysis/Main/Data/catalog.sqlite')   # Index of original files (see cf_catalog), updated incrementally
+cache_dir = Path('Analysis/Main/Data/Cache')     # Parsed versions of original files, reused if files are unchanged
+trial_store = Path('Analysis/Main/Data/Trials')   # Columnar (parquet) copy of formatted data
+count_cube = Path('Analysis/Main/Data/Counts/counts.parquet')  # Trial counts for each combination of conditions
+manifest_path = Path('Analysis/Main/Data/manifest.csv')    # Original files included in formatted data
 save_summary = False
 
+MANIFEST_COLUMNS = ['ferret', 'file', 'sha1', 'SessionDate', 'nTrials']
+
+
+def format_behavior(behavior, ferret):
+    """
+    Add timing and angular data to behavioral data, and select test trials
+
+    Parameters:
+    ----------
+    behavior : pandas dataframe
+        Trials loaded from original files (see cf_behavior.load_behavioral_files)
+    ferret : dict
+        Subject info (task and valid locations)
+
+    Returns:
+    --------
+    test_data : pandas dataframe
+        Formatted test trials, with probe trials flagged
+    """
+
+    # Add columns with timing and angular data
+    behavior = cf.add_timing_columns(behavior)
+    behavior = cf.format_angular_values(behavior)
+
+    behavior['Response'] = (behavior['Response'] - 3) / 6  # convert to binary (2021-07-04: Confirmed this was used for all animals regardless of training/task)
+
+    # Exclude correction trials and trials with multiple stimuli
+    test_data = cf.remove_correction_trials(behavior)
+    test_data = cf.remove_repeatStim_trials(test_data)
+    print(f"Test data: {test_data.shape[0]} / {behavior.shape[0]} trials")
+
+    # Identify probe data
+    test_data = cf.flag_probe_trials(test_data, ferret['task'], ferret['valid_loc'])
+    test_data['not_probe'] = test_data['not_probe'].astype(int)
+
+    return test_data
+
+
+def load_manifest(file_path):
+    """ Load list of original files included in formatted data (empty if not created yet) """
+
+    if not Path(file_path).exists():
+        return pd.DataFrame(columns=MANIFEST_COLUMNS).astype({'SessionDate': 'datetime64[ns]'})
+
+    return pd.read_csv(file_path, parse_dates=['SessionDate'])
+
+
+def find_changes(files, manifest):
+    """
+    Compare original files with those already formatted
+
+    Parameters:
+    ----------
+    files : pandas dataframe
+        Catalog entries for original files of one ferret (see cf_catalog.load_sessions),
+        with file name relative to the ferret's directory
+    manifest : pandas dataframe
+        Files already formatted for the same ferret
+
+    Returns:
+    --------
+    changed : pandas dataframe
+        Catalog entries for files that are new or whose contents have changed
+    stale : pandas dataframe
+        Sessions (ferret and SessionDate) to replace or remove from formatted data
+    """
+
+    previous = files.merge(manifest[['file','sha1']], on='file', how='left', suffixes=('', '_formatted'))
+    changed = previous[previous['sha1'] != previous['sha1_formatted']]
+
+    is_stale = manifest['file'].isin(changed['file']) | ~manifest['file'].isin(files['file'])
+
+    stale = pd.concat([
+        manifest.loc[is_stale, ['ferret','SessionDate']],
+        changed[['ferret','session_dt']].rename(columns={'session_dt': 'SessionDate'})
+        ]).drop_duplicates()
+
+    return changed, stale
+
+
+def write_formatted_data(test_data, ferret_name):
+    """ Save formatted data for one ferret as csv and in the trial store """
+
+    formatted_path = original_data.parent / 'Formatted' / f"{ferret_name}.csv"
+    test_data.to_csv( formatted_path)
+
+    cfs.write_trial_store(test_data, trial_store, ferret_name)
+
+
+def update_ferret(ferret, manifest, counts, full=False):
+    """
+    Format new or changed files for one ferret, and merge with existing data
+
+    Parameters:
+    ----------
+    ferret : dict
+        Subject info
+    manifest : pandas dataframe
+        Files already formatted (for all ferrets)
+    counts : pandas dataframe
+        Count table (for all ferrets)
+    full : bool, optional
+        Whether to format all files, regardless of the manifest
+
+    Returns:
+    --------
+    manifest : pandas dataframe
+        Updated list of formatted files
+    counts : pandas dataframe
+        Updated count table
+    """
+
+    ferret_name = f"F{ferret['num']}_{ferret['name']}"
+    ferret['original_path'] = original_data / ferret_name
+
+    # Get files with test results (but not training results from earlier levels)
+    all_files = cf.list_files(ferret['original_path'], catalog_path)
+    print(f"{ferret['name']}: Found {len(all_files)} files")
+
+    files = ccat.load_sessions(catalog_path, root=ferret['original_path'], levels=ccat.TEST_LEVELS)
+    files['file'] = [Path(x).relative_to(ferret['original_path']).as_posix() for x in files['path']]
+    files['ferret'] = ferret_name
+
+    is_ferret = manifest['ferret'] == ferret_name
+    existing = cfs.list_ferrets(trial_store) if trial_store.exists() else []
+
+    # Reformat everything if requested or if we don't know which files have been formatted
+    if full or not is_ferret.any() or ferret_name not in existing:
+        changed, stale = files, manifest.loc[is_ferret, ['ferret','SessionDate']]
+        previous = None
+
+        if counts is not None:
+            stale = pd.concat([stale, counts.loc[counts['ferret'] == ferret_name, cfc.SESSION_DIMS]])
+    else:
+        changed, stale = find_changes(files, manifest[is_ferret])
+
+        if changed.shape[0] == 0 and stale.shape[0] == 0:
+            print(f"{ferret['name']}: Up to date")
+            return manifest, counts
+
+        previous = cfs.load_trials(trial_store, ferrets=[ferret_name]).drop(columns='ferret')
+
+    print(f"{ferret['name']}: Formatting {changed.shape[0]} files")
+
+    # Load data but do minimal formatting
+    behavior = cf.load_behavioral_files(changed['path'].to_list(), cache_dir=cache_dir)
+    print(f"Loaded {behavior.shape[0]} trials")
+
+    # Files that could not be read keep their old manifest entry and trials, so they are retried on the next run
+    failed = changed[changed['path'].isin([x['file'] for x in behavior.attrs.get('bad_files', [])])]
+
+    if failed.shape[0] > 0:
+        print(f"{ferret['name']}: Will retry {failed.shape[0]} files that could not be read:")
+        for file in failed['file']:
+            print(f"\t{file}")
+
+        failed_dates = pd.concat([failed['session_dt'], manifest.loc[is_ferret & manifest['file'].isin(failed['file']), 'SessionDate']])
+
+        changed = changed[~changed['path'].isin(failed['path'])]
+        stale = stale[~stale['SessionDate'].isin(failed_dates)]
+
+    if previous is not None:
+        previous = previous[~previous['SessionDate'].isin(stale['SessionDate'])]
+
+    # Optional save
+    if save_summary and full:
+        summary_path = original_data.parent / 'Summary' / (ferret['name'] + '.csv')
+        behavior.to_csv(summary_path)
+
+    test_data = format_behavior(behavior, ferret) if behavior.shape[0] > 0 else None
+
+    # Merge with existing sessions and number sessions chronologically
+    if previous is not None:
+        new_data = test_data.reset_index() if test_data is not None else None
+        test_data = pd.concat([previous, new_data], ignore_index=True).set_index('Trial')
+
+    if test_data is None:
+        print(f"{ferret['name']}: No test data")
+        return manifest, counts
+
+    test_data = cf.renumber_sessions(test_data)
+    test_data = test_data.sort_values(by=['SessionDate', 'StartDateTime'], kind='stable')
+
+    # Save formatted data
+    write_formatted_data(test_data, ferret_name)
+
+    # Update derived data
+    new_trials = test_data[test_data['SessionDate'].isin(changed['session_dt'])].assign(ferret=ferret_name)
+    stale = pd.concat([stale, new_trials[['ferret','SessionDate']]]).drop_duplicates()
+
+    counts = cfc.update_count_cube(counts, new_trials, sessions=stale)
+
+    n_trials = new_trials.groupby('SessionDate').size().rename('nTrials').reset_index()
+    formatted = changed[['ferret','file','sha1','session_dt']].rename(columns={'session_dt': 'SessionDate'})
+    formatted = formatted.merge(n_trials, on='SessionDate', how='left').fillna({'nTrials': 0})
+
+    is_current = is_ferret & manifest['file'].isin(files['file']) & ~manifest['file'].isin(changed['file'])
+
+    if previous is None:        # Formatted from scratch, so trials from files that failed are no longer included
+        is_current &= ~manifest['file'].isin(failed['file'])
+
+    manifest = pd.concat([manifest[~is_ferret | is_current], formatted], ignore_index=True)
+
+    return manifest, counts
+
+
+def update(full=False):
+    """
+    Format new or changed files for all ferrets, and update derived data
+
+    Parameters:
+    ----------
+    full : bool, optional
+        Whether to format all files (and rebuild the count cube)
+    """
+
+    manifest = load_manifest(manifest_path)
+    counts = None if full or not count_cube.exists() else cfc.load_count_cube(count_cube)
 
-def main():
-    
     for ferret in ferrets:
+        manifest, counts = update_ferret(ferret, manifest, counts, full=full)
+
+    manifest.sort_values(by=['ferret','SessionDate'], ignore_index=True).to_csv(manifest_path, index=False)
 
-        ferret['original_path'] = original_data / f"F{ferret['num']}_{ferret['name']}"
+    # Summarize trial counts across all subjects (rebuilding from the trial store
+    # in full mode, so that ferrets without original files are kept)
+    if full or counts is None:
+        counts = cfc.build_count_cube(trial_store)
 
-        # Get files with test results (but not training results from earlier levels)
-        all_files = cf.list_files(ferret['original_path'] )
-        print(f"{ferret['name']}: Found {len(all_files)} files")
+    cfc.write_count_cube(counts, count_cube)
 
-        # Load data but do minimal formatting
-        behavior = cf.load_behavioral_files(all_files)      
-        print(f"Loaded {behavior.shape[0]} trials")
 
-        # Optional save
-        if save_summary:            
-            summary_path = original_data.parent / 'Summary' / (ferret['name'] + '.csv')
-            behavior.to_csv(summary_path)
+def watch(interval):
+    """ Check for new or changed files at regular intervals (in seconds), until interrupted """
 
-        # Add columns with timing and angular data
-        behavior = cf.add_timing_columns(behavior)
-        behavior = cf.format_angular_values(behavior)
+    try:
+        while True:
+            try:
+                update()
+            except Exception:       # Keep watching, and try again at the next check
+                print("Update failed:")
+                traceback.print_exc()
 
-        behavior['Response'] = (behavior['Response'] - 3) / 6  # convert to binary (2021-07-04: Confirmed this was used for all animals regardless of training/task)
+            print(f"Next check in {interval} s (ctrl+c to stop)")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching for new files")
 
-        # Exclude correction trials and trials with multiple stimuli
-        test_data = cf.remove_correction_trials(behavior)
-        test_data = cf.remove_repeatStim_trials(test_data)
-        print(f"Test data: {test_data.shape[0]} / {behavior.shape[0]} trials")
 
-        # Identify probe data 
-        test_data = cf.flag_probe_trials(test_data, ferret['task'], ferret['valid_loc'])
-        test_data['not_probe'] = test_data['not_probe'].astype(int)
+def main():
+
+    parser = argparse.ArgumentParser(description='Format original behavioral files for analysis')
+    parser.add_argument('--full', action='store_true', help='Format all files, rather than only new or changed files')
+    parser.add_argument('--watch', type=float, default=None, metavar='SECONDS', help='Check for new files at this interval')
+    args = parser.parse_args()
 
-        # Save formatted data
-        formatted_path = original_data.parent / 'Formatted' / f"F{ferret['num']}_{ferret['name']}.csv"
-        test_data.to_csv( formatted_path) 
+    if args.watch is not None:
+        watch(args.watch)
+    else:
+        update(full=args.full)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -30,15 +30,15 @@ import sys
 
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
+from pathlib import Path
 
 sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../..')))
 from Analysis import ferrets
-from Analysis import cf_analysis as cfa
+from Analysis import cf_counts as cfc
 from Analysis import cf_plot as cfp
 
 # Define paths and files
-file_path = 'Analysis/Main/Data/Formatted'
+count_cube = Path('Analysis/Main/Data/Counts/counts.parquet')
 save_path = 'Analysis/Main/images'
 
 
@@ -59,8 +59,8 @@ def main():
     for ferret in ferrets:
 
         # Load source data
-        file_name = f"F{ferret['num']}_{ferret['name']}.csv"
-        df = pd.read_csv(os.path.join(file_path, file_name))
+        ferret_name = f"F{ferret['num']}_{ferret['name']}"
+        df = cfc.load_count_cube(count_cube, ferrets=[ferret_name])
 
         # Create figures for plotting
         fss['fNum'] = f"F{ferret['num']}"
@@ -79,7 +79,7 @@ def main():
         ax_joint_P  = fig.add_axes( cfp.cm2norm([1.3, 2, 1.725, 1.725], fig_size))
 
         # Task performance (% correct)
-        pCorrect = cfa.get_percent_correct(df, sample_size=400, nIterations=100)        
+        pCorrect = cfc.get_percent_correct(df, sample_size=400, nIterations=100)        
 
         print(f"F{ferret['num']}: {pCorrect['mean'].min():.1f} to {pCorrect['mean'].max():.1f} % correct, mean = {pCorrect['mean'].mean():.1f}")
         
@@ -97,7 +97,7 @@ def main():
         ax_pCorrect.set_title(f"F{ferret['num']}", c=ferret['color'], fontsize=fss['font_size']+2, fontweight='bold')
 
         # Head vs world centered response probability
-        result = cfa.get_joint_responseP(df, sample_size=3, nIterations=100)        
+        result = cfc.get_joint_responseP(df, sample_size=3, nIterations=100)        
         
         cfp.plot_joint_responseP(fss, ax_joint_P, result) 
 
@@ -136,7 +136,7 @@ def main():
 
         # Save or show
         # plt.show()
-        # save_name = file_name.replace(".csv", ".png")
+        # save_name = f"{ferret_name}.png"
         # plt.savefig( os.path.join(save_path, save_name), dpi=300)
         plt.close()
 
@@ -30,15 +30,16 @@ import sys
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+from pathlib import Path
 import seaborn as sns
 
 sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../..')))
 from Analysis import ferrets
-from Analysis import cf_analysis as cfa
+from Analysis import cf_counts as cfc
 from Analysis import cf_plot as cfp
 
 # Define paths and files
-file_path = 'Analysis/Main/Data/Formatted'
+count_cube = Path('Analysis/Main/Data/Counts/counts.parquet')
 save_path = 'Analysis/Main/images'
 
 
@@ -55,16 +56,11 @@ def combine_data_across_subjects(members):
     Returns:
     --------
     df : pandas dataframe
-        Data from multiple members
+        Trial counts from multiple members
     """
-    df = []
-    for _, ferret in members.iterrows():
-
-        file_name = f"F{ferret['num']}_{ferret['name']}.csv"
-        tmp = pd.read_csv(os.path.join(file_path, file_name))
-        df.append(tmp) 
+    names = [f"F{ferret['num']}_{ferret['name']}" for _, ferret in members.iterrows()]
     
-    return pd.concat(df)
+    return cfc.load_count_cube(count_cube, ferrets=names)
 
 
 def analysis(fss, ax, ferrets, task, training):
@@ -102,7 +98,7 @@ def analysis(fss, ax, ferrets, task, training):
     # Plot response prob as joint function of sound angle in platform and world space
     fss['fNum'] = f'{task}-centered'
 
-    result = cfa.get_joint_responseP(df, sample_size=9, nIterations=100)        
+    result = cfc.get_joint_responseP(df, sample_size=9, nIterations=100)        
     
     cfp.plot_joint_responseP(fss, ax, result) 
 
@@ -5,6 +5,9 @@ animals were first tested with probe sounds.
 
 Note that we might not want all blocks, if we consider the possibility that animals learn not to 
 go to null spouts with experience (and we're interested in maximising sensitivity here)
+
+Updated:
+    2026-10-18: Block names are looked up in the session catalog (cf_catalog)
 """
 
 from pathlib import Path
@@ -15,6 +18,7 @@ import pandas as pd
 
 
 sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../../..')))
+from Analysis import cf_catalog as ccat
 
 
 
@@ -71,29 +75,17 @@ def get_probe_trial_times(data_path: str, sessions: pd.DataFrame) -> pd.DataFram
 
 
 
-def get_block_name(data_path: str, sessions: pd.DataFrame) -> pd.DataFrame:
-    ''' '''
-
-    # Preassign
-    sessions['block'] = 'Unknown'
-
-    # For each session
-    for idx, row in sessions.iterrows():
+def get_block_name(data_path: str, sessions: pd.DataFrame, catalog_path=ccat.CATALOG_PATH) -> pd.DataFrame:
+    ''' Look up the block for each session in the catalog of original behavioral files '''
 
-        # Search for behavioral file (which contains block name)
-        session_path = data_path / row['ferret']
-        assert session_path.exists()
+    ccat.update_sessions(data_path, catalog_path)
 
-        search_str = row['SessionDate'].strftime('%d_%m_%Y * %H_%M*.txt')
-        files = session_path.glob(search_str)
+    catalog = ccat.load_sessions(catalog_path, root=data_path, ferrets=sessions['ferret'].unique())
+    catalog = catalog[['ferret','session_dt','block']].rename(columns={'session_dt': 'SessionDate'})
 
-        file_list = [f for f in files]
-        assert len(file_list) == 1
-        session_file = file_list[0]
-
-        [_, _, _, block] = session_file.stem.split(' ')
-        
-        sessions['block'].loc[idx] = block
+    # Each session should have one behavioral file (which contains block name)
+    sessions = sessions.merge(catalog, on=['ferret','SessionDate'], how='left', validate='one_to_one')
+    assert sessions['block'].notna().all()
 
     sessions.set_index('SessionDate', inplace=True)
 
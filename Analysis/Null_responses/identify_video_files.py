@@ -2,14 +2,19 @@
 Identify video files associated with each behavioral session in which probe trials have been flagged for investigation
 
 2021-12-18: Created by Stephen Town
+2026-10-18: Video files are looked up in the session catalog (cf_catalog), rather than searching each block
 '''
 
+import os, sys
 from pathlib import Path
 from shutil import copy2
 
 import pandas as pd
 from pandas._libs import missing
 
+sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../..')))
+from Analysis import cf_catalog as ccat
+
 # Read in the metadata listing the blocks to look for
 repo_dir = Path(r'Analysis\Null_responses')
 summary_file = repo_dir / 'First_10_sessions.csv'
@@ -19,7 +24,8 @@ df = pd.read_csv(summary_file)
 blocks = df[['ferret','block']].drop_duplicates()
 
 # Check that the path to each block exists on this machine
-blocks['path'] = Path(r'G:\UCL_Behaving')
+data_root = Path(r'G:\UCL_Behaving')
+blocks['path'] = data_root
 blocks['path'] = blocks['path'] / blocks['ferret'] / blocks['block']
 blocks['path_exists'] = blocks['path'].apply(Path.exists)
 
@@ -28,12 +34,21 @@ if not all(blocks['path_exists']):
     missing_blocks = blocks[blocks['path_exists']==False]
     print(missing_blocks)
 
-# Find avi files within blocks
-def find_avi(x:Path):
-    files = x.glob('*.avi')
-    return next(files)
+# Find avi files within blocks (taking the first video in each block)
+def find_avi(blocks:pd.DataFrame, root:Path) -> pd.Series:
+    ccat.update_media(root, 'video', [f"{x.ferret}/{x.block}/*.avi" for x in blocks.itertuples()])
+    videos = ccat.load_media('video', root=root).drop_duplicates(subset=['ferret','block'])
+
+    videos = blocks.merge(videos[['ferret','block','path']], on=['ferret','block'], how='left', suffixes=('', '_video'))
+    return videos['path_video'].map(Path, na_action='ignore').set_axis(blocks.index)
+
+blocks['video'] = find_avi(blocks, data_root)
 
-blocks['video'] = blocks['path'].apply(find_avi)
+# Flag and leave out any blocks without video
+if blocks['video'].isna().any():
+    missing_videos = blocks[blocks['video'].isna()]
+    print(missing_videos)
+    blocks = blocks.dropna(subset=['video'])
 
 # Save list of video files
 output_file = repo_dir / 'video_files.csv'
@@ -10,56 +10,51 @@ This approach uses the variable duration between stimulus and response triggers
 
 Version History
     Created: 2021-12-?? by Stephen Town
+    Updated: 2026-10-18 - Read head positions from parquet files saved by get_head_positions.py
+    Updated: 2026-10-18 - Tracking files for each block are looked up in the session catalog (cf_catalog)
 
 """
 
 from dataclasses import dataclass
 import json
+import os, sys
 from pathlib import Path
 
-import numpy as np
 import pandas as pd
 
+sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../../..')))
+from Analysis import cf_catalog as ccat
+from Analysis import cf_tracking as cft
 
 
-def load_tracking_data(file_path: Path) -> pd.DataFrame:
-    ''' Load tracking data for one or more landmarks from h5 file'''
 
-    df = pd.read_hdf(file_path)
-    scorer = df.columns.get_level_values(0)[0] #you can read out the header to get the scorer name!
-    return df[scorer]
+def load_head_positions(file_path: Path) -> pd.DataFrame:
+    ''' Load head positions saved by get_head_positions.py (parquet, or csv from earlier versions) '''
 
+    file_path = Path(file_path)
 
-def load_frame_samples(file_path: Path, tracking_file: str) -> pd.DataFrame:
-    ''' Load frame samples from tab delimited files with same datetime prefix as tracking file '''
+    if file_path.suffix == '.parquet':
+        return cft.load_tracking(file_path, bodypart='head')
     
-    file_path = file_path / f"{tracking_file}.txt"
-    return pd.read_csv(file_path, delimiter='\t')
+    return pd.read_csv(file_path)
 
 
-def join_frame_times(df, ft) -> pd.DataFrame:
-    ''' Add frame time as an extra column to tracking data '''
-
-    # Check that the two files have the same number of frames
-    assert df.shape[0] == ft.shape[0]
-    
-    df.index = ft['TDT_time']
-    return df
-
-
-def get_blocks_for_tracking_files(data_dir: str, video_info: str) -> pd.DataFrame:
+def get_blocks_for_tracking_files(data_dir: str, video_info: str, catalog_path=ccat.CATALOG_PATH) -> pd.DataFrame:
     ''' Create a dataframe containing the path of tracking results for each block'''
 
     # Load and reformat video data 
     vidf = pd.read_csv( Path(video_info), skipinitialspace=True, usecols=['ferret','block','video'])
     vidf['video'] = vidf['video'].apply(lambda x: x.split('\\')[-1].replace('.avi',''))
 
-    # Assign tracking files to relevant blocks (or empty if tracking not complete)
-    vidf['tracking'] = np.nan
+    # Look up tracking files for each video in the catalog (parquet files replace csv files with the same name)
+    ccat.update_media(Path(data_dir), 'tracking', ['*.csv', '*.parquet'], catalog_path)
+
+    tracking = ccat.load_media('tracking', catalog_path, root=Path(data_dir))
+    tracking = tracking.sort_values(by='path', key=lambda x: x.str.endswith('.parquet')).drop_duplicates(subset='video', keep='last')
 
-    for tracking_file in Path(data_dir).glob('*.csv'):
-        idx = vidf[vidf['video'] == tracking_file.stem.split('DLC')[0]].index
-        vidf.loc[idx, 'tracking'] = tracking_file
+    # Assign tracking files to relevant blocks (or empty if tracking not complete)
+    vidf = vidf.merge(tracking[['video','path']].rename(columns={'path': 'tracking'}), on='video', how='left')
+    vidf['tracking'] = vidf['tracking'].map(Path, na_action='ignore')
 
     blocks = vidf.dropna()
 
@@ -72,21 +67,19 @@ def get_blocks_for_tracking_files(data_dir: str, video_info: str) -> pd.DataFram
 def get_trial_tracks(tracking: pd.DataFrame, trial_data: pd.DataFrame, buffer_frames) -> pd.DataFrame:
     ''' Select tracking data that occurs between start and response time'''
 
-    trial_paths = []
-    
-    for _, trial in trial_data.iterrows():
-    
-        start_idx = tracking[tracking['TDT_time'] < trial['StartTime']].index.max()
-        end_idx = tracking[tracking['TDT_time'] < trial['RespTime']].index.max()
-
-        idx = list(range(start_idx-buffer_frames, end_idx+buffer_frames))
-
-        track = tracking.iloc[idx].copy()
-        track['trial'] = trial['Trial']        
-
-        trial_paths.append( track)
+    # Frames run from the last frame before the start time to the frame before the last 
+    # frame before response time, with buffer_frames either side
+    trial_paths, _ = cft.extract_windows(
+        tracking, 'TDT_time', 
+        trial_data['StartTime'], 
+        trial_data['RespTime'],
+        labels = trial_data['Trial'],
+        label_col = 'trial',
+        before = buffer_frames + 1,
+        after = buffer_frames - 1
+        )
         
-    return pd.concat(trial_paths)
+    return trial_paths
 
 
 
@@ -112,7 +105,7 @@ def main():
     for _, block in blocks.iterrows():
 
         # Load head positions
-        tracking = pd.read_csv(block['tracking'])
+        tracking = load_head_positions(block['tracking'])
 
         # Filter behavioral data for block
         trial_data = trials[(trials['ferret'] == block['ferret']) & (trials['block'] == block['block'])]
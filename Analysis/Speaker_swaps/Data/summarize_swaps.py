@@ -4,17 +4,19 @@ before and after swapping speakers
 
 Created: 
     2021-07-05: Stephen Town
+Updated:
+    2026-10-18: File names are parsed by cf_catalog
 
 """
 
 import os, sys
 
-from datetime import datetime
 import pandas as pd
 from pathlib import Path
 
 sys.path.insert(0, os.path.abspath( os.path.join( os.path.dirname(__file__), '../../..')))
 from Analysis import cf_behavior as cf
+from Analysis import cf_catalog as ccat
 from Analysis.Speaker_swaps import ferrets
 
 data_dir = Path('Analysis/Speaker_swaps/Data')
@@ -35,10 +37,7 @@ def get_session_datetime(file):
         Datetime that session began
     """
     
-    [f_date, level, f_time, block] = file.split()
-    date_string = f_date + ' ' + f_time[0:8]
-    
-    return datetime.strptime(date_string, '%d_%m_%Y %H_%M_%S')
+    return ccat.parse_file_name(file)['session_dt']
     
 
 def get_performance(file, task, valid_locations):
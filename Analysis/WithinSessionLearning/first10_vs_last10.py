@@ -1,13 +1,18 @@
 """
 
 This function takes in the whole dataset for each animal, and runs through each
-session, selecting the first and last 10 trials, and then saving the output for
-later analysis
+session, selecting the first and last 10 trials, and then plotting performance
+in each subset
 
 
 Created:
     2021-07-17 - Stephen Town
 
+Updated:
+    2026-10-18: Trials are tagged with their position in each session (and since
+    the last platform rotation) so that performance can be measured for all K 
+    at once as a learning curve, without writing intermediate files
+
 
 Notes:
 A small number of sessions (e.g. 8/184 for Eclair) began with multiple stimulus 
@@ -18,109 +23,70 @@ consequence, we can't rely on trial numbers starting at 1.
 import os, sys
 
 import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
+from pathlib import Path
 
 sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../..')))
 from Analysis import ferrets
 from Analysis import cf_analysis as cfa
 from Analysis import cf_plot as cfp
+from Analysis import cf_store as cfs
 
-file_path = 'Analysis/Main/Data/Formatted'
-filtered_data = 'Analysis/WithinSessionLearning/Data_After_Rotation'
+trial_store = Path('Analysis/Main/Data/Trials')
 img_path = 'Analysis/WithinSessionLearning/images'
 
 K = 10      # K = Number of trials to consider at start / end
-regenerate_filtered_data = False
+K_range = np.arange(1, 51)      # Values of K for learning curves
 
 
-def require_platform_change(df):
+def load_data():
     """
-    Description
-    
-    Parameters:
-    ----------
-    df : pandas dataframe
-        Data for all sessions from one ferret
+    Load data from all ferrets, with the position of each trial in its session
     
     Returns:
     --------
     df : pandas dataframe
-        Subset of input data, but only containing sessions after platform rotation
+        Test trials (excluding probes) from sessions after platform rotation
     """
 
-    df.sort_values(by=['SessionDate', 'Trial'], inplace=True)   
-
-    count = 0
-    new_data = []
+    df = cfs.load_trials(trial_store, filters=[('not_probe', '==', 1)])
+    df = cfa.tag_trial_positions(df)
 
-    for session, sData in df.groupby('SessionDate'):
+    return df[df['session_rotated']]
 
-        current_angle = sData['CenterSpoutRotation'].unique()
 
-        if len(current_angle) > 1:                      
-            print(f"Skipping rotation within session")      # Ignore rare cases of rotation within session
-            continue
-        
-        if count > 0:                                   # Ignore the first session
-            if current_angle != previous_angle:         # If the platform angle has changed since the previous session, keep that data
-                new_data.append(sData) 
-                    
-        previous_angle = current_angle                  # Update value for next loop
-        count += 1
-
-    return pd.concat(new_data)    
-
-
-def filter_for_K_trials(K):
+def select_K_trials(df, K, position_col):
     """
-    Reduces the dataset to 
+    Select the first or last K trials in each session
     
     Parameters:
     ----------
+    df : pandas dataframe
+        Trials tagged with position in each session (see cf_analysis.tag_trial_positions)
     K : int
         Number of trials to sample from each session
-    
-    Output:
-    --------
-    CSV files containing datasets for each ferret from first or last K trials
-    in each session
+    position_col : str
+        Position of trial from start (trials_from_start) or end (trials_to_end) of session
+
+    Notes:
+    ------
+    For the sharpest contrast, sessions with K trials or fewer are not 
+    included (as these are both the first and last trials)
 
     Returns:
     --------
-    None
+    df : pandas dataframe
+        Subset of trials
     """
 
-    # For each ferret
-    for ferret in ferrets:
-
-        # Load source data
-        file_name = f"F{ferret['num']}_{ferret['name']}.csv"
-        df = pd.read_csv(os.path.join(file_path, file_name))
-
-        df = df[df['not_probe'] == 1]
-        df = require_platform_change(df)
-
-        first_trials = df.copy()  
-        last_trials = df.copy()              # I know we don't need this copy, but for dev purposes I'll keep the original
-
-        for session, sData in df.groupby(by='SessionDate'):            
-            if sData.shape[0] > K:                                                          # <==== THIS SHOULD PROBABLY BY > (2*K)
-                first_trials.drop( sData.iloc[K:].index, inplace=True)
-                last_trials.drop( sData.iloc[:-K:].index, inplace=True)
-            else:
-                first_trials.drop( sData.index, inplace=True)   # For the sharpest contrast, don't include sessions with <K datapoints (which are both the first and last trials)
-                last_trials.drop( sData.index, inplace=True)
-
-        # Write data
-        file_name = f"F{ferret['num']}_{ferret['name']}_first{K}.csv"
-        first_trials.to_csv( os.path.join(filtered_data, file_name))
+    session_length = df['trials_from_start'] + df['trials_to_end'] + 1
 
-        file_name = f"F{ferret['num']}_{ferret['name']}_last{K}.csv"
-        last_trials.to_csv( os.path.join(filtered_data, file_name))        
+    return df[(df[position_col] < K) & (session_length > K)]         # <==== THIS SHOULD PROBABLY BY > (2*K)
             
 
-def get_behavior(groupstr):
+def get_behavior(df, groupstr):
     """
+        df -- pandas dataframe, trials from first or last K trials of each session
         groupstr -- str, ammendment to file name for first or last K trials
     """
 
@@ -136,9 +102,12 @@ def get_behavior(groupstr):
         if ferret['task'] == 'Head':        # Only interested in this for world-centred animals
             continue
 
-        # Load source data
-        file_name = f"F{ferret['num']}_{ferret['name']}_{groupstr}.csv"
-        df = pd.read_csv(os.path.join(filtered_data, file_name))
+        # Select data
+        file_name = f"F{ferret['num']}_{ferret['name']}_{groupstr}.png"
+        fData = df[df['ferret'] == f"F{ferret['num']}_{ferret['name']}"]
+
+        if fData.shape[0] == 0:
+            continue
 
         # Create figures for plotting
         fss['fNum'] = f"F{ferret['num']}"
@@ -154,7 +123,7 @@ def get_behavior(groupstr):
         ax_pCorrect = fig.add_axes( cfp.cm2norm([1.3, 2, 1.725, 1.725], fig_size))
 
         # Task performance (% correct)
-        pCorrect = cfa.get_percent_correct(df, sample_size=50, nIterations=100)        
+        pCorrect = cfa.get_percent_correct(fData, sample_size=50, nIterations=100)        
 
         print(f"F{ferret['num']}: {pCorrect['mean'].min():.1f} to {pCorrect['mean'].max():.1f} % correct")
         
@@ -172,20 +141,59 @@ def get_behavior(groupstr):
         
         # Save or show
         # plt.show()
-        save_name = file_name.replace(".csv", ".png")
-        plt.savefig( os.path.join(img_path, save_name), dpi=300)
+        plt.savefig( os.path.join(img_path, file_name), dpi=300)
         plt.close()
 
 
+def plot_learning_curves(df):
+    """
+    Plot performance across the first / last K trials of each session, and 
+    across trials since platform rotation, for all values of K
+    
+    Parameters:
+    ----------
+    df : pandas dataframe
+        Trials tagged with position in each session (see cf_analysis.tag_trial_positions)
+    """
+
+    positions = {
+        'trials_from_start': 'First K trials',
+        'trials_to_end': 'Last K trials',
+        'trials_since_rotation': 'First K trials after rotation'
+        }
+
+    colors = {f"F{f['num']}_{f['name']}": f['color'] for f in ferrets}
+
+    fig, axs = plt.subplots(1, len(positions), figsize=(9, 3), sharey=True)
+
+    for ax, (position_col, title) in zip(axs, positions.items()):
+
+        curves = cfa.get_learning_curve(df, position_col, K=K_range, rng=0)
+
+        for ferret, curve in curves.groupby('ferret', observed=True):
+            ax.fill_between(curve['K'], curve['ci_lower'], curve['ci_upper'], color=colors[ferret], alpha=0.2, lw=0)
+            ax.plot(curve['K'], curve['pCorrect'], color=colors[ferret], label=ferret)
+
+        ax.axhline(50, color='k', ls='--', lw=0.5)
+        ax.set_title(title)
+        ax.set_xlabel('K')
+
+    axs[0].set_ylabel('% Correct')
+    axs[-1].legend(fontsize=6)
+
+    plt.tight_layout()
+    plt.savefig( os.path.join(img_path, 'learning_curves.png'), dpi=300)
+    plt.close()
+
+
 def main():
     
-    if regenerate_filtered_data:
-        filter_for_K_trials(K)       
+    df = load_data()
+
+    get_behavior( select_K_trials(df, K, 'trials_from_start'), f"first{K}")
+    get_behavior( select_K_trials(df, K, 'trials_to_end'), f"last{K}")
 
-    get_behavior(f"first{K}")
-    get_behavior(f"last{K}")
+    plot_learning_curves(df)
 
 if __name__ == '__main__':
     main()
-
-
@@ -9,6 +9,8 @@ import pandas as pd
 import numpy as np
 from scipy import stats
 
+from Analysis import cf_angles as cang
+
 def wrap_data(df, colname, filter_val=-180, delta=360):
     """
     Description
@@ -30,13 +32,166 @@ def wrap_data(df, colname, filter_val=-180, delta=360):
         Dataframe with wrapped value
     """
 
-    wrap_data = df[df[colname] == filter_val].copy()
-    wrap_data[colname] = wrap_data[colname] + delta
-        
-    return pd.concat([df, wrap_data])
+    return cang.duplicate_wrapped_values(df, colname, filter_val, delta)
+
+
+def index_strata(codes):
+    """
+    Index observations by group (stratum), so that samples can be drawn from
+    every group at once
+
+    Parameters:
+    ----------
+    codes : numpy array
+        1D array of integer group codes (0 to n_groups-1) for each observation
+
+    Notes:
+    ------
+    Observations are sorted by group once, after which the observations in 
+    each group are a contiguous block starting at group_start, and samples from
+    every group can be drawn as random offsets from the start of each group.
+
+    Returns:
+    --------
+    order : numpy array
+        Indices that sort observations by group
+    group_start : numpy array
+        Position of the first observation in each group (in sorted order)
+    group_size : numpy array
+        Number of observations in each group
+
+    >>> index_strata(np.array([1, 0, 1, 2, 0]))
+    (array([1, 4, 0, 2, 3]), array([0, 2, 4]), array([2, 2, 1]))
+    """
+
+    codes = np.asarray(codes)
+
+    order = np.argsort(codes, kind='stable')
+    group_size = np.bincount(codes)
+    group_start = np.concatenate(([0], np.cumsum(group_size)[:-1]))
+
+    return order, group_start, group_size
+
+
+def draw_stratified_samples(codes, sample_size, nIterations=1, replace=True, rng=None, strata=None, max_block_size=2**22):
+    """
+    Draw equal numbers of observations from each group, for all groups and 
+    iterations at once
+
+    Parameters:
+    ----------
+    codes : numpy array
+        1D array of integer group codes (0 to n_groups-1) for each observation
+    sample_size : int
+        Number of observations to draw from each group on each iteration
+    nIterations : int, optional
+        Number of independent samples (replicates) to draw from each group
+    replace : bool, optional
+        Whether to draw with replacement
+    rng : numpy random generator or int, optional
+        Generator (or seed for a generator) used to draw samples
+    strata : tuple, optional
+        Result of index_strata(codes), if already computed
+    max_block_size : int, optional
+        Maximum number of random keys to hold in memory at once when drawing
+        without replacement
+
+    Notes:
+    ------
+    With replacement, samples are random integer offsets from the start of
+    each group. Without replacement, each observation is assigned a random key
+    for each iteration, and the observations with the smallest keys in each 
+    group form a sample (i.e. a random permutation truncated at the sample size). 
+    Groups are padded to the size of the largest group with infinite keys, so 
+    that they're never drawn. Keys are generated for blocks of iterations to 
+    limit memory use.
+
+    Returns:
+    --------
+    idx : numpy array
+        3D array (groups x iterations x sample size) of indices into the 
+        original observations
+    """
+
+    rng = np.random.default_rng(rng)
+
+    order, group_start, group_size = index_strata(codes) if strata is None else strata
+    n_groups = group_size.size
+
+    if replace:
+        offset = rng.integers(0, group_size[:, np.newaxis, np.newaxis], size=(n_groups, nIterations, sample_size))
+
+    else:
+        if np.any(group_size < sample_size):
+            raise ValueError(f"Sample size ({sample_size}) is larger than the smallest group ({group_size.min()})")
+
+        max_size = group_size.max()
+        is_padding = np.arange(max_size) >= group_size[:, np.newaxis, np.newaxis]
+
+        offset = np.empty((n_groups, nIterations, sample_size), dtype=np.intp)
+        block_iterations = max(1, max_block_size // max(n_groups * max_size, 1))
+
+        for block_start in range(0, nIterations, block_iterations):
 
+            block = slice(block_start, min(block_start + block_iterations, nIterations))
 
-def get_joint_responseP(df, sample_size=3, nIterations=100):
+            keys = rng.random((n_groups, block.stop - block.start, max_size), dtype=np.float32)
+            np.copyto(keys, np.inf, where=is_padding)
+
+            offset[:, block] = np.argpartition(keys, sample_size-1, axis=2)[:, :, :sample_size]
+    
+    return order[offset + group_start[:, np.newaxis, np.newaxis]]
+
+
+def draw_bootstrap_sums(values, codes, n_draws, rng=None, max_block_size=2**22):
+    """
+    Sum values drawn with replacement from each group of observations, for all 
+    groups at once
+
+    Parameters:
+    ----------
+    values : numpy array
+        1D array of observations (e.g. responses on each trial)
+    codes : numpy array
+        1D array of integer group codes (0 to n_groups-1) for each observation
+    n_draws : int
+        Number of observations to draw (with replacement) from each group
+    rng : numpy random generator or int, optional
+        Generator (or seed for a generator) used to draw samples
+    max_block_size : int, optional
+        Maximum number of indices to hold in memory at once
+
+    Notes:
+    ------
+    Samples are drawn using draw_stratified_samples. For large numbers of 
+    draws, indices are generated in blocks to limit memory use.
+
+    Returns:
+    --------
+    sums : numpy array
+        1D array with the sum of drawn values for each group
+    """
+
+    rng = np.random.default_rng(rng)
+    values = np.asarray(values)
+
+    strata = index_strata(codes)
+    n_groups = strata[2].size
+
+    sums = np.zeros(n_groups, dtype=values.dtype if values.dtype.kind == 'f' else np.int64)
+    block_draws = max(1, min(n_draws, max_block_size // max(n_groups, 1)))
+
+    for block_start in range(0, n_draws, block_draws):
+
+        n_block = min(block_draws, n_draws - block_start)
+        idx = draw_stratified_samples(codes, n_block, rng=rng, strata=strata)
+
+        sums += values[idx].sum(axis=(1, 2))
+
+    return sums
+
+
+def get_joint_responseP(df, sample_size=3, nIterations=100, rng=None):
     """
     Get the probability of making a response for each combination of 
     sound angles in head and world-centred space.
@@ -56,46 +211,83 @@ def get_joint_responseP(df, sample_size=3, nIterations=100):
         (Note this is small because most data comes from probe tests)
     nIterations : int
         Number of bootstrap resamples
+    rng : numpy random generator or int, optional
+        Generator (or seed) for resampling, to make results reproducible
     
     Returns:
     --------
-    stim_platf : numpy array
-        1D array of sound angles relative to platform
-    stim_world : numpy array
-        1D array of sound angles in the world
-    pResp : numpy array
-        2D array of response probabilities for each combination of sound angles
+    result : pandas dataframe
+        Dataframe with sound angles relative to platform (stim_platf) and the
+        world (stim_world), with the number of responses (nResp) and trials 
+        (nTrial) sampled, and the response probability (pResp) for each 
+        combination of sound angles
     """
 
-    # Group by stimulus angle and get performance
-    n_response, n_trial, stim_platf, stim_world = [], [], [], []
+    # Group by stimulus angle 
+    grouped = df.groupby(['speaker_angle_world','speaker_angle_platform'], sort=True)
+    codes = grouped.ngroup().to_numpy()
+    angle_combos = grouped.size().index
 
-    for angle_combo, group_data in df.groupby(['speaker_angle_world','speaker_angle_platform']):
-
-        stim_world.append(angle_combo[0])
-        stim_platf.append(angle_combo[1])
-        
-        response_count, trial_count = 0, 0
-
-        for i in range(0, nIterations):
-            sampled_data = group_data.sample(sample_size, replace=True)
-            response_count = response_count + sampled_data['Response'].sum()
-            trial_count = trial_count + sampled_data.shape[0]
-
-        n_response.append(response_count)
-        n_trial.append(trial_count)
+    # Sample all iterations for all combinations at once
+    n_draws = sample_size * nIterations
+    n_response = draw_bootstrap_sums(df['Response'].to_numpy(), codes, n_draws, rng=rng)
         
     # Return as dataframe
-    result = list(zip(stim_platf, stim_world, n_response, n_trial))
-    result = pd.DataFrame( result, columns=['stim_platf','stim_world','nResp','nTrial'])
+    result = pd.DataFrame({
+        'stim_platf': angle_combos.get_level_values('speaker_angle_platform'),
+        'stim_world': angle_combos.get_level_values('speaker_angle_world'),
+        'nResp': n_response,
+        'nTrial': n_draws
+        })
 
     result['pResp'] = result['nResp'] / result['nTrial']
 
     return result
 
 
+def binom_test(k, n, p=0.5):
+    """
+    Exact two-sided binomial test for many observations at once
+
+    Equivalent to scipy.stats.binomtest(k, n, p).pvalue (two-sided), which 
+    only accepts single values
+    
+    Parameters:
+    ----------
+    k : int or array of ints
+        Number of successes
+    n : int or array of ints
+        Number of trials
+    p : float, optional
+        Hypothesised probability of success
+
+    Notes:
+    ------
+    The p-value is the total probability of all outcomes that are no more 
+    likely than the observed outcome (with the same relative tolerance used
+    by scipy)
+
+    Returns:
+    --------
+    pval : numpy array
+        P-values for each observation
+
+    >>> binom_test([3, 7, 5], 10).round(4)
+    array([0.3438, 0.3438, 1.    ])
+    """
+
+    k, n = np.broadcast_arrays(np.atleast_1d(k), np.atleast_1d(n))
+
+    outcomes = np.arange(n.max() + 1)
+    pmf = stats.binom.pmf(outcomes, n[:, np.newaxis], p)
+    pmf_k = stats.binom.pmf(k, n, p)
 
-def get_percent_correct(df, sample_size=400, nIterations=100):
+    pval = np.sum(pmf * (pmf <= pmf_k[:, np.newaxis] * (1 + 1e-7)), axis=1)
+
+    return np.minimum(pval, 1.0)
+
+
+def get_percent_correct(df, sample_size=400, nIterations=100, ci=95, rng=None):
     """
     Get task performance (% correct) for each platform angle, using 
     fixed sample sizes with bootstrap resampling.
@@ -109,9 +301,10 @@ def get_percent_correct(df, sample_size=400, nIterations=100):
         Number of trials over which to measure task performance at each platform angle
     nIterations : int
         Number of bootstrap iterations over which to ensure consistency of measurement
-
-    TO DO:        
-        Think about random state of sampling more critically
+    ci : float, optional
+        Width (%) of bootstrap confidence interval
+    rng : numpy random generator or int, optional
+        Generator (or seed) for resampling, to make results reproducible
 
     Notes:
     ------
@@ -122,54 +315,252 @@ def get_percent_correct(df, sample_size=400, nIterations=100):
     Returns:
     --------
     result : pandas dataframe
-        Dataframe with performance (% correct) for each platform angle
+        Dataframe with performance (% correct) for each platform angle, including
+        the mean, standard deviation and confidence interval across bootstrap 
+        iterations, and the p-value of a binomial test on the mean number of
+        trials correct
     """
 
     # Remove probe sounds
     df = df[df.not_probe == 1]
    
-    # Group by Platform Angle and get performance    
-    angle_n = df['CenterSpoutRotation'].value_counts()
-    n_angles = len(angle_n)
+    # Group by Platform Angle and sample all iterations at once    
+    grouped = df.groupby('CenterSpoutRotation', sort=True)
+    codes = grouped.ngroup().to_numpy()
+    platform_angles = grouped.size().index.to_numpy()
 
-    pCorrect = np.zeros((n_angles, nIterations))
-    platform_angles = []
-    k = 0
+    idx = draw_stratified_samples(codes, sample_size, nIterations, replace=False, rng=rng)
 
-    for cs_angle, group_data in df.groupby('CenterSpoutRotation'):
+    nCorrect = df['Correct'].to_numpy()[idx].sum(axis=2)
+    pCorrect = nCorrect / float(sample_size)
 
-        nCorrect = np.zeros(nIterations)
+    # Run binomial test on mean number of correct trials
+    pBinom = binom_test(np.round(nCorrect.mean(axis=1)).astype(int), n=sample_size, p=0.5)
 
-        for i in range(0, nIterations):
-            sampled_data = group_data.sample(sample_size)
-            pCorrect[k,i] = sampled_data['Correct'].sum() / float(sample_size)
-            nCorrect[i] = sampled_data['Correct'].sum()
+    for cs_angle, p in zip(platform_angles, pBinom):
+        print(f"\t\tPlatform = {cs_angle}°, p = {p}")
 
-        platform_angles.append(cs_angle)
-        k += 1
+    # Return as dataframe
+    ci_tail = (100 - ci) / 2
 
-        # Run binomial test on mean number of correct trials
-        nCorrect = round(np.mean(nCorrect))
-        pBinom = stats.binom_test(nCorrect, n=sample_size, p=0.5, alternative='two-sided')
+    result = pd.DataFrame({
+        'PlatformAngle': platform_angles,
+        'mean': np.mean(pCorrect, axis=1) * 100,
+        'std_dev': np.std(pCorrect, axis=1),
+        'ci_lower': np.percentile(pCorrect, ci_tail, axis=1) * 100,
+        'ci_upper': np.percentile(pCorrect, 100 - ci_tail, axis=1) * 100,
+        'pBinom': pBinom
+        })
 
-        print(f"\t\tPlatform = {cs_angle}°, p = {pBinom}")
+    # Wrap around circle (i.e. make a datapoint at -180 that corresponds to +180)   
+    result = wrap_data(result, 'PlatformAngle', filter_val=180, delta=-360)
+    result.sort_values(by='PlatformAngle', inplace=True)
+    result.set_index('PlatformAngle', inplace=True)
+    
+    return result
 
 
-    mean_pCorrect = np.mean(pCorrect, axis=1) * 100
-    std_pCorrect = np.std(pCorrect, axis=1)
+def tag_trial_positions(df, group_col='ferret', session_col='SessionDate', order_col='Trial'):
+    """
+    Label each trial with its position relative to the start and end of its 
+    session, and to the most recent change in platform angle
+    
+    Parameters:
+    ----------
+    df : pandas dataframe
+        Trials from one or more subjects, with platform angle (CenterSpoutRotation)
+    group_col : str, optional
+        Column identifying independent subjects
+    session_col : str, optional
+        Column identifying test sessions (in chronological order)
+    order_col : str, optional
+        Column giving the order of trials within each session
 
+    Notes:
+    ------
+    Positions count the number of trials before (or after) each trial, so 
+    that the first trial in a session has trials_from_start = 0. Positions 
+    depend on which trials are included, and so should be tagged after 
+    filtering (e.g. for probe trials).
     
+    A change in platform angle is any trial at a different angle to the 
+    previous trial from the same subject (including changes between sessions). 
+    trials_since_rotation is NaN before the first observed change for each 
+    subject. A session is marked as rotated if the platform angle differs 
+    from the final angle of the previous session, and is constant throughout 
+    the session.
 
-    # Return as dataframe
-    result = list(zip(platform_angles, mean_pCorrect, std_pCorrect))
-    result = pd.DataFrame( result, columns=['PlatformAngle','mean', 'std_dev'])
+    Returns:
+    --------
+    df : pandas dataframe
+        Copy of input data sorted by subject, session and trial, with 
+        columns added for:
+        - trials_from_start: trials since the start of the session
+        - trials_to_end: trials until the end of the session
+        - trials_since_rotation: trials since the last change in platform angle
+        - session_rotated: whether the session followed a change in platform angle
+        - session_idx / rotation_idx: integer codes for each session and each 
+          run of trials at the same platform angle
+    """
 
-    # Wrap around circle (i.e. make a datapoint at -180 that corresponds to +180)   
-    result = wrap_data(result, 'PlatformAngle', filter_val=180, delta=-360)
-    result.sort_values(by='PlatformAngle', inplace=True)
-    result.set_index('PlatformAngle', inplace=True)
+    df = df.sort_values(by=[group_col, session_col, order_col], kind='stable')
+
+    session = df.groupby([group_col, session_col], sort=False, observed=True)
+
+    df['trials_from_start'] = session.cumcount()
+    df['trials_to_end'] = session.cumcount(ascending=False)
+    df['session_idx'] = session.ngroup()
+
+    # Changes in platform angle (with the start of each subject beginning a new run)
+    rotation = df['CenterSpoutRotation'].to_numpy()
+    group = df[group_col].to_numpy()
+
+    is_start = np.ones(rotation.size, dtype=bool)
+    is_start[1:] = group[1:] != group[:-1]
+
+    is_change = np.zeros(rotation.size, dtype=bool)
+    is_change[1:] = (rotation[1:] != rotation[:-1]) & ~is_start[1:]
+
+    df['rotation_idx'] = np.cumsum(is_start | is_change) - 1
+
+    # Trials since the start of each run, unless the run is the first for that subject
+    since_rotation = df.groupby('rotation_idx', sort=False).cumcount().astype(float)
+    first_run = df.groupby(group_col, sort=False, observed=True)['rotation_idx'].transform('min')
+
+    df['trials_since_rotation'] = since_rotation.where(df['rotation_idx'] != first_run)
+
+    # Sessions that start with a new angle and don't change
+    session_start = df['trials_from_start'].to_numpy() == 0
+    constant = session['CenterSpoutRotation'].transform('nunique') == 1
+    rotated = pd.Series(is_change & session_start, index=df.index)
+
+    df['session_rotated'] = rotated.groupby(df['session_idx']).transform('any') & constant
+
+    return df
+
+
+def get_learning_curve(df, position_col='trials_from_start', K=np.arange(1, 51), window=None, 
+                       unit_col=None, group_col='ferret', exclude_short=True, nIterations=1000, ci=95, rng=None):
+    """
+    Get task performance (% correct) as a function of trial position, for 
+    all positions at once, with bootstrap confidence bands
     
-    return result
+    Parameters:
+    ----------
+    df : pandas dataframe
+        Trials tagged using tag_trial_positions, with correct scoring (0=error, 1=correct)
+    position_col : str, optional
+        Trial position to measure performance against (trials_from_start, 
+        trials_to_end or trials_since_rotation)
+    K : list or numpy array, optional
+        Number of trials at which to measure performance
+    window : int, optional
+        If None, performance is measured across the first K trials after the
+        reference point (i.e. positions 0 to K-1). Otherwise, performance is 
+        measured in a sliding window of positions K-window to K-1.
+    unit_col : str, optional
+        Column identifying units resampled during bootstrapping (defaults to 
+        rotation_idx for trials_since_rotation, and session_idx otherwise)
+    group_col : str, optional
+        Column identifying subjects, for which separate curves are calculated
+    exclude_short : bool, optional
+        Only include units with more than K trials in the measurement at K
+        (so that short sessions don't contribute the same trials to the start 
+        and end of sessions)
+    nIterations : int, optional
+        Number of bootstrap iterations
+    ci : float, optional
+        Width (%) of bootstrap confidence interval
+    rng : numpy random generator or int, optional
+        Generator (or seed) for resampling, to make results reproducible
+
+    Notes:
+    ------
+    Trials are counted into a matrix of units (e.g. sessions) by position, 
+    and cumulative sums across positions give the number of trials and correct
+    trials for every value of K. Bootstrap iterations resample units with 
+    replacement, so that trials from the same session are kept together, and 
+    are computed as a product of the resampling counts with the count matrix.
+
+    Returns:
+    --------
+    result : pandas dataframe
+        Dataframe with the number of units, trials and correct trials, and 
+        performance (% correct) for each subject and value of K, with the
+        standard deviation and confidence interval across bootstrap iterations
+    """
+
+    rng = np.random.default_rng(rng)
+    K = np.asarray(K, dtype=int)
+    nK = K.max() + 1
+
+    if unit_col is None:
+        unit_col = 'rotation_idx' if position_col == 'trials_since_rotation' else 'session_idx'
+
+    # Only positions up to the largest K are counted
+    position = df[position_col].to_numpy()
+    include = position < nK                                 # False for NaN positions
+    
+    units = df.loc[include, unit_col].to_numpy()
+    unit_codes, unit_idx = np.unique(units, return_inverse=True)
+    nUnits = unit_codes.size
+
+    bins = unit_idx * nK + position[include].astype(int)
+
+    nTrials = np.bincount(bins, minlength=nUnits*nK).reshape(nUnits, nK)
+    nCorrect = np.bincount(bins, weights=df.loc[include, 'Correct'].to_numpy(), minlength=nUnits*nK).reshape(nUnits, nK)
+
+    # Counts for each K (units x K)
+    cum_trials = np.concatenate((np.zeros((nUnits, 1)), np.cumsum(nTrials, axis=1)), axis=1)
+    cum_correct = np.concatenate((np.zeros((nUnits, 1)), np.cumsum(nCorrect, axis=1)), axis=1)
+
+    lower = np.zeros_like(K) if window is None else np.maximum(K - window, 0)
+
+    unit_trials = cum_trials[:, K] - cum_trials[:, lower]
+    unit_correct = cum_correct[:, K] - cum_correct[:, lower]
+
+    if exclude_short:
+        unit_length = df.groupby(unit_col)[position_col].size().reindex(unit_codes).to_numpy()
+        keep = unit_length[:, np.newaxis] > K
+        unit_trials, unit_correct = unit_trials * keep, unit_correct * keep
+    else:
+        keep = unit_trials > 0
+
+    # Subject of each unit
+    unit_group = df.loc[include].groupby(unit_col, observed=True)[group_col].first().reindex(unit_codes)
+
+    ci_tail = (100 - ci) / 2
+    results = []
+
+    for group, members in pd.Series(np.arange(nUnits)).groupby(unit_group.to_numpy(), observed=True):
+
+        members = members.to_numpy()
+
+        # Resampling counts for each unit on each iteration (iterations x units)
+        weights = rng.multinomial(members.size, np.full(members.size, 1 / members.size), size=nIterations)
+
+        boot_trials = weights @ unit_trials[members]
+        boot_correct = weights @ unit_correct[members]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pBoot = boot_correct / boot_trials * 100
+
+        n = unit_trials[members].sum(axis=0)
+        nC = unit_correct[members].sum(axis=0)
+
+        results.append(pd.DataFrame({
+            group_col: group,
+            'K': K,
+            'nUnits': keep[members].sum(axis=0),
+            'nTrials': n.astype(int),
+            'nCorrect': nC.astype(int),
+            'pCorrect': np.divide(nC, n, out=np.full(n.shape, np.nan), where=n > 0) * 100,
+            'std_dev': np.nanstd(pBoot, axis=0),
+            'ci_lower': np.nanpercentile(pBoot, ci_tail, axis=0),
+            'ci_upper': np.nanpercentile(pBoot, 100 - ci_tail, axis=0)
+            }))
+
+    return pd.concat(results, ignore_index=True)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,153 @@
+"""
+Transformations between coordinate frames
+
+Sound and response locations are recorded as indices on a clock face
+(1 to 12) in the world, and converted into angles in the world and relative
+to the platform (putative head) on which the animal is positioned:
+
+    clock index <-> world angle <-> platform angle
+
+All functions operate on scalars, numpy arrays or pandas series (keeping the
+index of series), without looping over values.
+
+Conventions:
+    - World angles: clock index 6 = 0°, 9 = -90° (West), 12 = -180°
+    - Platform angle = world angle - center spout rotation
+    - Angles are wrapped to -180 <= x < 180 (unless stated otherwise)
+
+Created:
+    2026-10-18
+
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _as_scalar(x, wrapped):
+    """ Return python scalar if input was a scalar """
+    return wrapped.item() if np.ndim(x) == 0 and not isinstance(x, pd.Series) else wrapped
+
+
+def _widen(x):
+    """ Promote 8-bit integers (e.g. clock indices stored as int8) so that angles don't overflow """
+    dtype = getattr(x, 'dtype', None)
+    return x.astype('int16') if dtype is not None and dtype.kind in 'iu' and dtype.itemsize < 2 else x
+
+
+def wrap_to_180(x, include_upper=False):
+    """
+    Wrap angles to the range ±180 degrees
+
+    Parameters:
+    ----------
+    x : float, numpy array or pandas series
+        Angular values in degrees
+    include_upper : bool, optional
+        Wrap to -180 < x <= 180 rather than -180 <= x < 180
+
+    >>> wrap_to_180(np.array([-270, 335, 180, -180, 540]))
+    array([  90,  -25, -180, -180, -180])
+    >>> wrap_to_180(-180, include_upper=True)
+    180
+
+    Returns:
+    --------
+    x : float, numpy array or pandas series
+        Wrapped angles
+    """
+
+    if include_upper:
+        wrapped = 180 - np.mod(np.subtract(180, x), 360)
+    else:
+        wrapped = np.mod(np.add(x, 180), 360) - 180
+
+    return _as_scalar(x, wrapped)
+
+
+def clock_to_world(idx):
+    """
+    Convert clock-face indices (1 to 12) to angles in the world (150 to -180°)
+
+    >>> clock_to_world(np.array([1, 3, 6, 9, 12]))
+    array([ 150,   90,    0,  -90, -180])
+    >>> clock_to_world(np.array([3, 9], dtype='int8'))
+    array([ 90, -90], dtype=int16)
+    """
+    return 180 - 30 * _widen(idx)
+
+
+def world_to_clock(angle):
+    """
+    Convert angles in the world to (fractional) clock-face indices
+
+    >>> world_to_clock(np.array([150, 90, 0, -90, -180, 180, -75]))
+    array([ 1. ,  3. ,  6. ,  9. , 12. , 12. ,  8.5])
+    """
+    return (180 - wrap_to_180(angle)) / 30
+
+
+def world_to_platform(angle, rotation):
+    """
+    Convert angles in the world to angles relative to the platform
+
+    Parameters:
+    ----------
+    angle : float, numpy array or pandas series
+        Angles in the world (degrees)
+    rotation : float, numpy array or pandas series
+        Rotation of the platform (CenterSpoutRotation; degrees)
+
+    >>> world_to_platform(np.array([0, -90, 150]), np.array([180, 90, -60]))
+    array([-180, -180, -150])
+    """
+    return wrap_to_180(_widen(angle) - _widen(rotation))
+
+
+def platform_to_world(angle, rotation):
+    """
+    Convert angles relative to the platform to angles in the world
+
+    Parameters:
+    ----------
+    angle : float, numpy array or pandas series
+        Angles relative to the platform (degrees)
+    rotation : float, numpy array or pandas series
+        Rotation of the platform (CenterSpoutRotation; degrees)
+
+    >>> platform_to_world(np.array([-180, -180, -150]), np.array([180, 90, -60]))
+    array([  0, -90, 150])
+    """
+    return wrap_to_180(_widen(angle) + _widen(rotation))
+
+
+def duplicate_wrapped_values(df, columns, filter_val=-180, delta=360):
+    """
+    Duplicate rows at the edge of the circle so that plots cover both -180 and 180°
+
+    Parameters:
+    ----------
+    df : pandas dataframe
+        Data with angular values
+    columns : str or list
+        Column(s) containing values to wrap (e.g. platform angle); rows are
+        duplicated for each column in turn
+    filter_val : float, optional
+        Value to identify data to be wrapped (e.g. -180)
+    delta : float, optional
+        Change to create new value (e.g. -180 + 360 = 180)
+
+    Returns:
+    --------
+    df : pandas dataframe
+        Dataframe with wrapped values added
+    """
+
+    if isinstance(columns, str):
+        columns = [columns]
+
+    for col in columns:
+        extra = df[df[col] == filter_val]
+        df = pd.concat([df, extra.assign(**{col: extra[col] + delta})])
+
+    return df
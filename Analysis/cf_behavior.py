@@ -17,17 +17,47 @@ Updated
     2021 June (ST): 
         Added documentation
         Removed unnecessary functions
+    2026 Oct:
+        Parallel loading of behavioral files with caching of parsed results
+        Angular transformations use vectorised functions in cf_angles
+        Vectorised counting of trials after changes in platform angle
+        Behavioral files can be listed from the session catalog (cf_catalog)
+        Behavioral files are parsed with compact data types, using the header to select columns
+        Sessions can be renumbered in chronological order
+        Probe performance for all combinations of speaker and platform angle counted with one crosstab
             
 """
 
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+import hashlib
+import io
+import os
 
 import numpy as np
 import pandas as pd
 from pathlib import Path
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
+from Analysis import cf_angles as cang
+from Analysis import cf_catalog as ccat
+from Analysis import cf_store as cfs
 
-def list_files(file_path):
+
+CACHE_VERSION = 2       # Increment to invalidate cached files if the normalisation of behavioral files changes
+
+# Column names used in earlier versions of behavioral files, and columns not used in analysis
+COLUMN_NAMES = {
+    'CorrectionTrial?': 'CorrectionTrial',
+    'CenterReward?': 'CenterReward',
+    'Speaker_Location': 'Speaker Location',
+    'LED_Location': 'LED Location'
+}
+IGNORED_COLUMNS = ['CenterPixelVal']
+
+
+def list_files(file_path, catalog_path=None, update=True):
     """
     Gets a list of text files that include the relevant task
     levels in the file name
@@ -36,8 +66,12 @@ def list_files(file_path):
     ----------
     file_path : pathlib Path
         Directory containing subdirectories for each ferret
-    ferret : str
-        Full name of subject (e.g. "F1701_Pendleton")
+    catalog_path : pathlib Path, optional
+        Session catalog (see cf_catalog) in which to look up files, rather 
+        than searching directories
+    update : bool, optional
+        Whether to add new or changed files under file_path to the catalog 
+        before looking up files (ignored if catalog_path is None)
     
     Returns:
     --------
@@ -45,6 +79,13 @@ def list_files(file_path):
         List of text files for ferret
     """
 
+    if catalog_path is not None:
+        if update:
+            ccat.update_sessions(file_path, catalog_path)
+
+        sessions = ccat.load_sessions(catalog_path, root=file_path, levels=ccat.TEST_LEVELS)
+        return [Path(x) for x in sessions['path']]
+
     # file_path = file_path / ferret
     types = ('*level53*.txt', '*level54*.txt', '*level55*.txt')
     all_files = []
@@ -76,12 +117,7 @@ def append_session_datetime(file, df=None):
     datetime.datetime(2018, 3, 2, 14, 12, 10)
     """
 
-    if isinstance(file, Path):
-        file = file.stem
-
-    [f_date, level, f_time, block] = file.split()
-    date_string = f_date + ' ' + f_time[0:8]
-    session_dt = datetime.strptime(date_string, '%d_%m_%Y %H_%M_%S')
+    session_dt = ccat.parse_file_name(file)['session_dt']
 
     if df is None:
         return session_dt
@@ -90,7 +126,201 @@ def append_session_datetime(file, df=None):
         return df
 
 
-def load_behavioral_files(all_files):
+@lru_cache(maxsize=None)
+def get_parser_spec(header):
+    """
+    Get the columns and data types with which to read a behavioral file, 
+    based on its header line
+
+    Parameters:
+    ----------
+    header : str
+        First line of behavioral file (tab delimited column names)
+
+    Notes:
+    ------
+    Specs are cached, so each version of the header (schema era) is only 
+    interpreted once.
+
+    Returns:
+    --------
+    spec : dict or None
+        Schema era (see cf_catalog.get_schema_era), columns to read, names 
+        to which they should be renamed and compact data types, or None if 
+        the file doesn't include data about the center spout
+
+    >>> get_parser_spec('Trial\\tCorrectionTrial?\\tCenterSpoutRotation\\tCenterPixelVal\\t')['rename']
+    {'Trial': 'Trial', 'CorrectionTrial?': 'CorrectionTrial', 'CenterSpoutRotation': 'CenterSpoutRotation'}
+    >>> get_parser_spec('Trial\\tCorrectionTrial\\tResponse') is None
+    True
+    """
+
+    columns = [x for x in header.rstrip('\r\n').split('\t') if x != '']
+    era = ccat.get_schema_era(columns)
+
+    if era == 'pre_rotation':
+        return None
+
+    usecols = [x for x in columns if x not in IGNORED_COLUMNS]
+    rename = {x: COLUMN_NAMES.get(x, x) for x in usecols}
+    dtype = {x: np.dtype(cfs.TRIAL_DTYPES[rename[x]]) for x in usecols if rename[x] in cfs.TRIAL_DTYPES}
+
+    convert_options = pacsv.ConvertOptions(
+        include_columns = usecols,
+        column_types = {x: pa.from_numpy_dtype(v) for (x, v) in dtype.items()}
+        )
+
+    return dict(era=era, usecols=usecols, rename=rename, dtype=dtype, convert_options=convert_options)
+
+
+def parse_behavioral_file(content, spec):
+    """
+    Read trials from the contents of a behavioral file with compact data types
+
+    Parameters:
+    ----------
+    content : bytes
+        Contents of behavioral file
+    spec : dict
+        Columns and data types for the file header (see get_parser_spec)
+
+    Returns:
+    --------
+    df : pandas dataframe
+        Trials with consistent column names, indexed by trial number. A 
+        ValueError is raised if values can't be stored with the data type for 
+        their column (e.g. missing values in integer columns)
+    """
+
+    table = pacsv.read_csv(io.BytesIO(content),
+        read_options = pacsv.ReadOptions(encoding='latin1'),
+        parse_options = pacsv.ParseOptions(delimiter='\t'),
+        convert_options = spec['convert_options']
+        )
+
+    if any(table.column(x).null_count > 0 for (x, v) in spec['dtype'].items() if v.kind == 'i'):
+        raise ValueError("Missing values in integer columns")
+
+    df = table.to_pandas().rename(columns=spec['rename'])
+
+    return df.set_index('Trial')
+
+
+def normalize_behavioral_file(df):
+    """
+    Harmonise the columns of one behavioral file across data collection methods
+    used over the course of the project (e.g. updates to column names to remove 
+    white space, addition of center pixel values)
+
+    Parameters:
+    ----------
+    df : pandas dataframe
+        Trials from one behavioral file, as read from disk
+
+    Notes:
+    ------
+    Files are usually read using the parser spec for their header (see 
+    get_parser_spec), which selects and renames columns while reading. This
+    function is used for files that can't be read with compact data types
+    (e.g. with missing values).
+
+    Returns:
+    --------
+    df : pandas dataframe or None
+        Trials with consistent column names, or None if the file doesn't include
+        data about the center spout (we don't care about old data lacking this)
+    """
+
+    if 'CenterSpoutRotation' not in df.columns:
+        return None
+
+    # Pad Center Pixel Value if not included (only started late in project) -  do this first
+    df = df.drop(columns=[x for x in IGNORED_COLUMNS if x in df])
+
+    # Drop unnamed columns (occurs when each line terminates with tab, which can be read as the start of a new column)            
+    df = df.drop(columns=[x for x in df.columns if 'Unnamed' in x])
+
+    # Correct for early column headers that included "?"
+    df = df.rename(columns=COLUMN_NAMES)
+
+    return df
+
+
+def load_behavioral_file(file, cache_dir=None):
+    """
+    Loads and normalises a single behavioral file, reusing a cached copy of the
+    result if the file contents have been seen before
+
+    Parameters:
+    ----------
+    file : pathlib Path
+        Path to behavioral file
+    cache_dir : pathlib Path, optional
+        Directory in which normalised dataframes are cached, keyed by a hash
+        of the file contents (no caching if None)
+
+    Notes:
+    ------
+    The header is read first, so that files without center spout data are 
+    rejected without reading the rest of the file. Other files are read with
+    the columns and data types for their header (see get_parser_spec), or 
+    with inferred data types if that fails. Cache files that can't be read
+    are ignored and replaced.
+
+    Returns:
+    --------
+    df : pandas dataframe or None
+        Normalised trials (or None if the file predates center spout rotation)
+    error : str or None
+        Description of why the file could not be loaded (None if successful)
+    """
+
+    try:
+        with open(file, 'rb') as f:
+            header = f.readline()
+            spec = get_parser_spec(header.decode('latin1'))
+
+            if spec is None:
+                return None, None
+
+            content = header + f.read()
+    except OSError as err:
+        return None, str(err)
+
+    # Look for previous results from the same file contents
+    if cache_dir is not None:
+        file_hash = hashlib.sha1(content).hexdigest()
+        cache_file = Path(cache_dir) / f"{file_hash}_v{CACHE_VERSION}.pkl"
+
+        if cache_file.exists():
+            try:
+                return pd.read_pickle(cache_file), None
+            except Exception:
+                pass        # Incomplete or corrupt cache file: parse again and replace it
+
+    # Read file in
+    try:
+        df = parse_behavioral_file(content, spec)
+    except (ValueError, KeyError, pa.ArrowException):
+        try:
+            df = pd.read_csv(io.BytesIO(content), sep='\t', encoding='latin1', index_col='Trial')
+        except Exception as err:
+            return None, str(err)
+
+        df = normalize_behavioral_file(df)
+
+    # Write to a temporary file first, so that parallel workers never read incomplete cache files
+    if cache_dir is not None:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        pd.to_pickle(df, tmp_file)
+        os.replace(tmp_file, cache_file)
+
+    return df, None
+
+
+def load_behavioral_files(all_files, n_jobs=None, cache_dir=None):
     """
     Loads many behavioral files (usually)
     
@@ -102,66 +332,102 @@ def load_behavioral_files(all_files):
     ----------
     all_files : list
         List containing strings of paths to behavioral files
+    n_jobs : int, optional
+        Number of processes over which to parse files (defaults to number of CPUs)
+    cache_dir : pathlib Path, optional
+        Directory in which to cache parsed files, so that files that haven't 
+        changed since the last run are not parsed again
 
     Notes:
     -----
     Behavioral files here are the original tab-delimited text files recorded during  
     experiments, rather than any formatted or concatenated version generated later.
 
+    Files that can't be read are reported and skipped, rather than stopping the
+    loading of subsequent files. Names of the skipped files and the reason for 
+    failure are available in the 'bad_files' attribute of the output (df.attrs)
+
+    Sessions are numbered (SessionID) in the order in which files are listed; 
+    use renumber_sessions to number sessions in chronological order. If no 
+    files contain test data, an empty dataframe is returned.
+
     Returns:
     --------
     unnamed : pandas dataframe
         Concatenated dataframe containing rows (trials) from multiple test sessions
     """
 
+    all_files = [Path(file) for file in all_files]
+
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    load_file = partial(load_behavioral_file, cache_dir=cache_dir)
+
+    # Parse files (in parallel where it's worth starting processes)
+    if n_jobs > 1 and len(all_files) > 1:
+        chunk_size = max(1, len(all_files) // (n_jobs * 4))
+
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(load_file, all_files, chunksize=chunk_size))
+    else:
+        results = [load_file(file) for file in all_files]
 
     # Preassign
     list_ = []
+    bad_files = []
     count = 0
 
-    # For each file
-    for file in all_files:
+    # For each file (in the original order, so that session numbers are reproducible)
+    for file, (df, error) in zip(all_files, results):
 
-        # Read file in
-        try:
-            df = pd.read_csv(file, sep='\t', encoding='latin1', index_col='Trial')
-        except:
-            print(f"Could not load {file}")
-            break
+        if error is not None:
+            print(f"Could not load {file}: {error}")
+            bad_files.append(dict(file=str(file), error=error))
+            continue
+
+        # If the file includes data about the center spout
+        if df is None:
+            continue
+
+        # Get datetime for this file from file name                
+        df['SessionDate'] = append_session_datetime(file)
 
-        # If the file includes data about the center spout (we don't care about old data lacking this)
-        if 'CenterSpoutRotation' in df.columns:
+        # Add session number
+        count = count + 1
+        df['SessionID'] = count
 
-            # Pad Center Pixel Value if not included (only started late in project) -  do this first
-            if 'CenterPixelVal' in df:
-                df.drop(columns=['CenterPixelVal'], inplace=True)
+        # Add to list
+        list_.append(df)
 
-            # Drop unnamed columns (occurs when each line terminates with tab, which can be read as the start of a new column)            
-            df.drop(columns=[x for x in df.columns if 'Unnamed' in x], inplace=True)
+    if len(bad_files) > 0:
+        print(f"Skipped {len(bad_files)} of {len(all_files)} files that could not be loaded")
 
-            # Correct for early column headers that included "?"
-            df = df.rename(columns={'CorrectionTrial?': 'CorrectionTrial',
-                                    'CenterReward?': 'CenterReward',
-                                    'Speaker_Location': 'Speaker Location',                                    
-                                    'LED_Location': 'LED Location'})
+    behavior = pd.concat(list_, sort=False) if len(list_) > 0 else pd.DataFrame()
+    behavior.attrs['bad_files'] = bad_files
 
-            # Get datetime for this file from file name                
-            [f_date, level, f_time, block] = file.stem.split()
-            date_string = f_date + ' ' + f_time[0:8]
-            session_dt = datetime.strptime(date_string, '%d_%m_%Y %H_%M_%S')
-            df['SessionDate'] = session_dt
+    return behavior     
 
-            # Add session number
-            count = count + 1
-            df['SessionID'] = count
 
-            # if count > 100:
-                # print('s')
+def renumber_sessions(frame):
+    """
+    Number sessions (SessionID) in chronological order, so that numbers 
+    don't depend on the order in which files were loaded
+
+    Parameters:
+    ----------
+    frame : pandas dataframe
+        Dataframe containing trials from one subject, with session datetime
+
+    Returns:
+    --------
+    frame : pandas dataframe
+        Dataframe with SessionID running from 1 to the number of sessions
+    """
 
-            # Add to list
-            list_.append(df)
+    frame['SessionID'] = frame['SessionDate'].rank(method='dense').astype('int32')
 
-    return pd.concat(list_, sort=False)     
+    return frame
 
 
 def add_timing_columns(frame):
@@ -204,12 +470,12 @@ def wrap_to_180(x):
     
     Parameters:
     ----------
-    x : float
-        Angular value in degrees
+    x : float, numpy array or pandas series
+        Angular value(s) in degrees
     
     Returns:
     --------
-    x : float
+    x : float, numpy array or pandas series
         Angle wrapped to -180 <= x < 180
 
     >>> wrap_to_180(-270)
@@ -222,11 +488,7 @@ def wrap_to_180(x):
     -180
 
     """
-    if x < -180:
-        x += 360
-    elif x >= 180:
-        x -= 360
-    return x
+    return cang.wrap_to_180(x)
 
 
 def format_angular_values(frame):
@@ -248,16 +510,14 @@ def format_angular_values(frame):
         Dataframe with spatial variables also in degrees
     """
     
-    frame['response_angle_world'] = [180 + (i * -30) for i in frame['Response']]
-    frame['speaker_angle_world'] = [180 + (i * -30) for i in frame['Speaker Location']]
+    frame['response_angle_world'] = cang.clock_to_world(frame['Response'])
+    frame['speaker_angle_world'] = cang.clock_to_world(frame['Speaker Location'])
 
     # Calculate speaker angle relative to platform (putative head) coordinate frame
-    frame['speaker_angle_platform'] = frame['speaker_angle_world'] - frame['CenterSpoutRotation']
-    frame['speaker_angle_platform'] = frame['speaker_angle_platform'].apply(wrap_to_180)
+    frame['speaker_angle_platform'] = cang.world_to_platform(frame['speaker_angle_world'], frame['CenterSpoutRotation'])
 
     # Calculate response angle relative to platform
-    frame['response_angle_platform'] = frame['response_angle_world'] - frame['CenterSpoutRotation']
-    frame['response_angle_platform'] = frame['response_angle_platform'].apply(wrap_to_180)
+    frame['response_angle_platform'] = cang.world_to_platform(frame['response_angle_world'], frame['CenterSpoutRotation'])
 
     return frame
 
@@ -337,66 +597,115 @@ def report_by_angle(test_data):
 
 
 
-def id_center_spout_changes(test_data):
+def count_rotation_transitions(test_data, n_after=1, group_col=None, angles=None):
     """
-    Get the number of times the center platform has changed position between 
-    two angles, while ignoring times that the platform remained in a constant
-    direction.
+    Count trials after each change in center platform angle, for every 
+    combination of previous and next angle.
     
     Parameters:
     ----------
     test_data : pandas dataframe
         Dataframe containing center platform angles (CenterSpoutRotation),
         animal behavior (Correct) and a column to order test sessions
-        (SessionID)
+        (SessionID), ordered by date
+    n_after : int, optional
+        Number of trials after each change to include
+    group_col : str, optional
+        Column identifying independent sequences of sessions (e.g. 'ferret'), 
+        so that changes between groups are not counted
+    angles : list or numpy array, optional
+        Platform angles to include in matrices (defaults to all angles in data;
+        must include every angle in the data)
+
+    Notes:
+    ------
+    As with changes in platform angle, the start of each session counts as a 
+    change (from the final angle of the previous session). Runs of trials 
+    shorter than n_after only contribute the trials available before the 
+    next change.
     
     Returns:
     --------
     ~ : dict
-        Dictionary with the number of trials as a 2D numpy array, with the 
-        previous angle as column (x) and the next angle as row (y). Also 
-        includes whether the first trial was performed correctly.
+        Dictionary with the number of trials (nTrials) and number of correct 
+        trials (nCorrect) as 3D numpy arrays (trial after change x next angle 
+        x previous angle), with previous angle as column (x), next angle as 
+        row (y) and trial position after the change (trial; 1 = first trial)
     """
 
+    rotation = test_data['CenterSpoutRotation'].to_numpy()
+    session = test_data['SessionID'].to_numpy()
+    correct = test_data['Correct'].to_numpy()
 
-    # Get unique angles
-    angles = test_data.CenterSpoutRotation.unique()
-    angles = angles.tolist()
-    angles.sort()
+    if angles is None:
+        angles = np.unique(rotation)
+
+    angles = np.sort(np.asarray(angles))
+
+    if not np.isin(rotation, angles).all():
+        raise ValueError(f"Platform angles {np.setdiff1d(rotation, angles)} are not in angles")
 
-    # Preassign matrix in which we will count each change in rotation
-    nAngles = len(angles)
-    nTrials = np.zeros((nAngles, nAngles), dtype=int)
-    nCorrect = np.zeros((nAngles, nAngles), dtype=int)
+    angle_idx = np.searchsorted(angles, rotation)
 
-    # # Intialize
-    rotation_value = test_data['CenterSpoutRotation'][0:1].values
-    rotation_value = rotation_value[0]
+    # Identify trials where angle or session differs from the previous trial
+    is_change = np.zeros(rotation.size, dtype=bool)
+    is_change[1:] = (rotation[1:] != rotation[:-1]) | (session[1:] != session[:-1])
 
-    session_id = test_data['SessionID'][0:1].values
-    session_id = session_id[0]
+    # The first trial in the data (or in each group) has no previous angle
+    is_start = np.zeros(rotation.size, dtype=bool)
+    is_start[:1] = True
 
-    # For each row
-    for index, row in test_data.iterrows():
+    if group_col is not None:
+        group = test_data[group_col].to_numpy()
+        is_start[1:] = group[1:] != group[:-1]
+        is_change &= ~is_start
 
-        # If the current value has changed
-        if rotation_value != row['CenterSpoutRotation'] or session_id != row['SessionID']:
+    # Position of each trial in its run of trials at the same angle, and the angle before the run
+    run_start = np.flatnonzero(is_change | is_start)
+    run_id = np.cumsum(is_change | is_start) - 1
 
-            # Get row and column indices for count matrix
-            row_index = angles.index(row['CenterSpoutRotation'])
-            col_index = angles.index(rotation_value)
+    position = np.arange(rotation.size) - run_start[run_id]
+    previous = angle_idx[np.maximum(run_start - 1, 0)][run_id]
 
-            # Add one to count value
-            nTrials[row_index, col_index] += 1
+    include = is_change[run_start][run_id] & (position < n_after)
 
-            # Add an additional trial if the animal performed correctly
-            nCorrect[row_index, col_index] = nCorrect[row_index, col_index] + row['Correct']
+    # Accumulate counts
+    shape = (n_after, angles.size, angles.size)
+    idx = (position[include], angle_idx[include], previous[include])
+
+    nTrials = np.zeros(shape, dtype=int)
+    nCorrect = np.zeros(shape, dtype=int)
+
+    np.add.at(nTrials, idx, 1)
+    np.add.at(nCorrect, idx, correct[include])
+
+    return {'nTrials': nTrials, 'nCorrect': nCorrect, 'x': angles.tolist(), 'y': angles.tolist(), 'trial': np.arange(1, n_after+1)}
+
+
+def id_center_spout_changes(test_data):
+    """
+    Get the number of times the center platform has changed position between 
+    two angles, while ignoring times that the platform remained in a constant
+    direction.
+    
+    Parameters:
+    ----------
+    test_data : pandas dataframe
+        Dataframe containing center platform angles (CenterSpoutRotation),
+        animal behavior (Correct) and a column to order test sessions
+        (SessionID)
+    
+    Returns:
+    --------
+    ~ : dict
+        Dictionary with the number of trials as a 2D numpy array, with the 
+        previous angle as column (x) and the next angle as row (y). Also 
+        includes whether the first trial was performed correctly.
+    """
 
-            # Update rotation and session id
-            rotation_value = row['CenterSpoutRotation']
-            session_id = row['SessionID']   
+    transitions = count_rotation_transitions(test_data, n_after=1)
 
-    return {'nTrials': nTrials, 'nCorrect':nCorrect, 'x': angles, 'y': angles}
+    return {'nTrials': transitions['nTrials'][0], 'nCorrect': transitions['nCorrect'][0], 'x': transitions['x'], 'y': transitions['y']}
 
 
 def get_angle_changes(angles):
@@ -408,30 +717,66 @@ def get_angle_changes(angles):
     angles : list or numpy array
         List of angles with n elements
     
-    To Do:
-    -----
-    This function may be defunct - check if can be removed
-
     Returns:
     --------
     delta_angle : numpy array
-        2D array of distances with n-by-n elements
+        2D array of unsigned distances (wrapped around the circle) with n-by-n elements
+
+    >>> get_angle_changes([-150, 0, 180])
+    array([[  0, 150,  30],
+           [150,   0, 180],
+           [ 30, 180,   0]])
     """
 
-    # Create angle difference map
-    nAngles = len(angles)
-    delta_angle = np.zeros((nAngles, nAngles), dtype=int)
+    angles = np.asarray(angles)
+    delta_angle = np.abs(angles[:, np.newaxis] - angles[np.newaxis, :])
 
-    for i in range(0, nAngles):  # For each index of angle
-        for j in range(0, nAngles):
-            delta_ij = abs(angles[i] - angles[j])   # Get the unsigned difference
+    return np.where(delta_angle > 180, 360 - delta_angle, delta_angle).astype(int)
 
-            if delta_ij > 180:  # Wrap around circle (if required)
-                delta_ij = 360 - delta_ij
 
-            delta_angle[i, j] = delta_ij
+def sum_by_angle_change(nTrials, nCorrect, delta_angles):
+    """
+    Combine trial counts across all rotations with the same angular distance
+    
+    Parameters:
+    ----------
+    nTrials : numpy array 
+        Number of *total* trials for each change in center spout rotation 
+        from angle x to angle y (the last two dimensions), optionally with 
+        leading dimensions (e.g. trial after change)
+    nCorrect : numpy array
+        Number of *correct* trials, with the same shape as nTrials
+    delta_angles : 2D numpy array
+        Matrix with the angular distance for each change in center
+        spout rotation from angle x to angle y
+    
+    Returns:
+    --------
+    unique_changes : numpy array
+        Angular distances
+    nTrials_total : numpy array
+        Number of trials for each distance (and leading dimension)
+    nCorrect_total : numpy array
+        Number of correct trials for each distance (and leading dimension)
+    """
+
+    assert nTrials.shape == nCorrect.shape
+    assert nTrials.shape[-2:] == delta_angles.shape
+
+    unique_changes, inverse = np.unique(delta_angles, return_inverse=True)
+    nChanges = unique_changes.size
+
+    lead_shape = nTrials.shape[:-2]
+    nLead = int(np.prod(lead_shape))
+
+    # Offset bins for each leading index so that all sums are made with one bincount
+    bins = (inverse.ravel()[np.newaxis, :] + nChanges * np.arange(nLead)[:, np.newaxis]).ravel()
 
-    return delta_angle
+    def total(x):
+        x = np.bincount(bins, weights=x.reshape(nLead, -1).ravel(), minlength=nLead*nChanges)
+        return x.reshape(lead_shape + (nChanges,)).astype(int)
+
+    return unique_changes, total(nTrials), total(nCorrect)
 
 
 def get_pCorrect_with_angle_changes(nTrials, nCorrect, delta_angles):
@@ -466,34 +811,9 @@ def get_pCorrect_with_angle_changes(nTrials, nCorrect, delta_angles):
         - bar plot of number of trials correct
     """
 
-    # Check the input sizes are the same
-    assert nTrials.shape == nCorrect.shape
-    assert nTrials.shape == delta_angles.shape
-    
-    # Flatten arrays
-    nTrials = nTrials.flatten()
-    nCorrect = nCorrect.flatten()
-    delta_angles = delta_angles.flatten()
-
-    # Get unique changes in angle value
-    unique_changes = np.unique(delta_angles)
-    unique_changes = unique_changes.tolist()
-    unique_changes.sort()
-
-    # Preassign list of
-    nChanges = len(unique_changes)
-    nTrials_total = np.zeros(nChanges, dtype=int)
-    nCorrect_total = np.zeros(nChanges, dtype=int)
-
-    # For each cell in the matrix
-    for input_idx, angle_delta in np.ndenumerate(delta_angles):
+    import plotly.graph_objects as go
 
-        # Get index of change
-        output_idx = unique_changes.index(angle_delta)
-
-        # Add numbers to vectors
-        nTrials_total[output_idx] = nTrials_total[output_idx] + nTrials[input_idx]
-        nCorrect_total[output_idx] = nCorrect_total[output_idx] + nCorrect[input_idx]
+    unique_changes, nTrials_total, nCorrect_total = sum_by_angle_change(nTrials, nCorrect, delta_angles)
 
     # Get percent correct
     pCorrect_total = nCorrect_total / nTrials_total * 100
@@ -529,124 +849,144 @@ def get_pCorrect_with_angle_changes(nTrials, nCorrect, delta_angles):
     return data
 
 
-def get_probe_performance(test_data, np, pd, ferret):
-
-    from math import pi
-
-    # Get rid of white space in column names
-    test_data.columns = test_data.columns.str.replace(' ', '')
-
-    # # Get unique center spout and speaker angles
-    speakers = test_data.SpeakerLocation.unique()   # e.g. speakers 1-12
-    CS_angles = test_data.CenterSpoutRotation.unique()  # e.g. -150 to 180 in 30° steps
-
-    # Convert speaker index into angle
-    speaker_angle = -30 * speakers
-    speaker_angle = speaker_angle + 180
+def count_probe_responses(test_data, group_cols=None, spouts=(3, 9)):
+    """
+    Count responses at each spout for every combination of speaker and 
+    platform angle, for one or more subjects at once
+    
+    Parameters:
+    ----------
+    test_data : pandas dataframe
+        Trials with speaker location (Speaker Location or SpeakerLocation), 
+        platform angle (CenterSpoutRotation) and response
+    group_cols : list, optional
+        Columns identifying groups (e.g. ['ferret']) for which counts are made
+        separately
+    spouts : tuple, optional
+        Response values for spout 3 and spout 9 (e.g. (0, 1) for formatted data)
 
-    # Preassign
-    my_list = list()
+    Notes:
+    ------
+    Counts are made with a single crosstab, and filled with zeros for every 
+    combination of the speakers and platform angles tested with each group.
+    Trials with other responses are not counted.
 
-    # For each speaker location (i.e. world angle)
-    for speaker in speakers:
+    Returns:
+    --------
+    table : pandas dataframe
+        Number of trials (nTrials) and responses at each spout (nSpout3, nSpout9),
+        proportion of responses at spout 3 (pRight), and speaker angle in the
+        world and relative to the platform (wrapped to -180 < x <= 180) in degrees
+    """
 
-        # Filter for data
-        speaker_data = test_data[test_data['SpeakerLocation'] == speaker]
+    group_cols = [] if group_cols is None else list(group_cols)
+    speaker_col = 'Speaker Location' if 'Speaker Location' in test_data else 'SpeakerLocation'
 
-        # For each center spout angle
-        for CS_angle in CS_angles:
+    keys = [test_data[c] for c in group_cols] + [test_data[speaker_col], test_data['CenterSpoutRotation']]
+    names = group_cols + ['Speaker_Idx', 'Platform_Angle']
 
-            # Filter for data
-            flt_data = speaker_data[speaker_data['CenterSpoutRotation'] == CS_angle]
+    table = pd.crosstab(keys, test_data['Response'], rownames=names)
+    table = table.reindex(columns=list(spouts), fill_value=0)
+    table.columns = ['nSpout3', 'nSpout9']
 
-            # Get number of trials
-            nTrials = sum(flt_data['Response'] == 3) + sum(flt_data['Response'] == 9)
+    # Include all combinations of speakers and platform angles tested with each group
+    tested = table.index.to_frame(index=False)
+    speakers = tested[group_cols + ['Speaker_Idx']].drop_duplicates()
+    angles = tested[group_cols + ['Platform_Angle']].drop_duplicates()
 
-            # If this combination of speaker index and center spout angle was tested
-            if flt_data.shape[0] > 0:
-                nResponse = sum(flt_data['Response'] == 3)  # Get number of instances of each response type
-            else:
-                nResponse = 0
+    if len(group_cols) > 0:
+        grid = speakers.merge(angles, on=group_cols)
+    else:
+        grid = speakers.merge(angles, how='cross')
 
-            # Write results to text file
-            my_list.append({'Speaker_Idx': speaker, 'Platform_Angle': CS_angle, 'nTrials': nTrials, 'nSpout3': nResponse})
+    table = table.reindex(pd.MultiIndex.from_frame(grid), fill_value=0).reset_index()
+    table = table.sort_values(by=names, ignore_index=True)
 
-    # Convert to pandas dataframe
-    df = pd.DataFrame(my_list)
+    table['nTrials'] = table['nSpout3'] + table['nSpout9']
+    table['pRight'] = table['nSpout3'] / table['nTrials'].where(table['nTrials'] > 0)
 
-    # Convert platform angles from degrees to radians
-    df.Platform_Angle = df.Platform_Angle / 180 * pi     # Convert to radians
+    # Add Speaker Location in the world, and relative to platform (wrapped to -180 < x <= 180)
+    table['SpeakerAngleWorld'] = cang.clock_to_world(table['Speaker_Idx'])
+    table['platform_speaker_angle'] = cang.wrap_to_180(table['SpeakerAngleWorld'] - table['Platform_Angle'], include_upper=True)
 
-    # Add Speaker Location in the world (in radians)
-    def index2world(idx):
-        return pi + idx * -(pi / 6)
+    return table
 
-    df['SpeakerAngleWorld'] = index2world(df['Speaker_Idx'])
 
-    # Calculate Speaker angles relative to platform
-    df['platform_speaker_angle'] = df['SpeakerAngleWorld'] - df['Platform_Angle']
-    df['platform_speaker_angle'] = df['platform_speaker_angle'].apply(lambda x: x - (2 * pi) if x > pi else x)  # Wrap to ± pi
-    df['platform_speaker_angle'] = df['platform_speaker_angle'].apply(lambda x: x + (2 * pi) if x <= (0.01 - pi) else x)
+def get_probe_maps(table, group_cols=None):
+    """
+    Arrange counts of probe responses as arrays for heatmaps
+    
+    Parameters:
+    ----------
+    table : pandas dataframe
+        Counts for each speaker and platform angle (see count_probe_responses)
+    group_cols : list, optional
+        Columns identifying groups in table
 
-    # Return data frame
-    return df
+    Returns:
+    --------
+    maps : dict
+        Speakers, platform angles (and groups), with arrays of nTrials, 
+        nSpout3, nSpout9 and pRight with dimensions speaker x platform angle 
+        (or group x speaker x platform angle if group_cols are given)
+    """
 
+    group_cols = [] if group_cols is None else list(group_cols)
 
-def draw_probe_performance(test_data, np, go, py, ferret, notebook=False):
+    speakers, speaker_idx = np.unique(table['Speaker_Idx'], return_inverse=True)
+    angles, angle_idx = np.unique(table['Platform_Angle'], return_inverse=True)
 
-    # Get rid of white space in column names
-    test_data.columns = test_data.columns.str.replace(' ', '')
+    if len(group_cols) == 1:
+        group_idx, groups = table[group_cols[0]].factorize()
+    elif len(group_cols) > 1:
+        group_idx, groups = pd.MultiIndex.from_frame(table[group_cols]).factorize()
+    else:
+        group_idx, groups = np.zeros(table.shape[0], dtype=int), None
 
-    # # Get unique center spout and speaker angles
-    speakers = test_data.SpeakerLocation.unique()   # e.g. speakers 1-12
-    CS_angles = test_data.CenterSpoutRotation.unique()  # e.g. -150 to 180 in 30° steps
+    maps = dict(speakers=speakers, angles=angles, groups=groups)
+    shape = (1 if groups is None else len(groups), speakers.size, angles.size)
 
-    # Sort
-    CS_angles.sort()
-    speakers.sort()
+    for var in ['nTrials', 'nSpout3', 'nSpout9']:
+        maps[var] = np.zeros(shape, dtype=int)
+        maps[var][group_idx, speaker_idx, angle_idx] = table[var].to_numpy()
 
-    # Convert speaker index into angle
-    speaker_angle = -30 * speakers
-    speaker_angle = speaker_angle + 180
+    with np.errstate(divide='ignore', invalid='ignore'):
+        maps['pRight'] = maps['nSpout3'] / maps['nTrials']
 
-    # Count unique cases
-    nSpeakers = len(speakers)
-    nCS_Angles = len(CS_angles)
+    if len(group_cols) == 0:
+        for var in ['nTrials', 'nSpout3', 'nSpout9', 'pRight']:
+            maps[var] = maps[var][0]
 
-    # Create results space
-    nRight = np.zeros((nSpeakers, nCS_Angles), dtype=int)
-    nTrials = np.zeros((nSpeakers, nCS_Angles), dtype=int)
+    return maps
 
-    # For each speaker location (i.e. world angle)
-    for spkr_idx, speaker in enumerate(speakers):
 
-        # Filter for data
-        speaker_data = test_data[test_data['SpeakerLocation'] == speaker]
+def get_probe_performance(test_data, np, pd, ferret):
+    """
+    Count responses at each spout for every combination of speaker and platform
+    angle, with angles in radians (see count_probe_responses)
+    """
 
-        # For each center spout angle
-        for CS_idx, CS_angle in enumerate(CS_angles):
+    df = count_probe_responses(test_data)
 
-            # Filter for data
-            flt_data = speaker_data[speaker_data['CenterSpoutRotation'] == CS_angle]
+    # Convert from degrees to radians
+    for col in ['Platform_Angle', 'SpeakerAngleWorld', 'platform_speaker_angle']:
+        df[col] = np.radians(df[col])
 
-            # Get number of trials
-            nTrials[spkr_idx, CS_idx] = sum(flt_data['Response'] == 3) + sum(flt_data['Response'] == 9)
+    # Return data frame
+    return df
 
-            # If data exists for this combination of speaker index and center spout angle
-            if flt_data.shape[0] > 0:
 
-                # Get number of instances of each response type
-                nResponses = sum(flt_data['Response'] == 3)
+def draw_probe_performance(test_data, np, go, py, ferret, notebook=False):
 
-                # Append to lists
-                nRight[spkr_idx, CS_idx] = nResponses
+    # Count responses for each combination of speaker and center spout angle
+    maps = get_probe_maps( count_probe_responses(test_data))
 
-            else:
-                f'No data: Platform @ {CS_angle}, Speaker {speaker}'
+    CS_angles = maps['angles']      # e.g. -150 to 180 in 30° steps
+    speakers = maps['speakers']     # e.g. speakers 1-12
 
-    # Calculate percent correct in each cell
-    np.seterr(divide='ignore', invalid='ignore')  # ignore divide by zero (data still being collected for these areas)
-    pRight = nRight / nTrials
+    nTrials = maps['nTrials']
+    nRight = maps['nSpout3']
+    pRight = maps['pRight']
 
     ####################################################################
     # Analyze marginals
@@ -0,0 +1,435 @@
+"""
+Catalog of original data files
+
+Metadata for each behavioral file (subject, level, session datetime and
+block) is otherwise rediscovered by globbing directories and splitting file
+names every time it's needed, which is slow when data are on network drives.
+Here, file names are parsed once and stored with file sizes, modification
+times, content hashes, trial counts and header information in an SQLite
+database, together with the video, frame time and tracking files associated
+with each block.
+
+The catalog is updated incrementally: files are only read again if their
+size or modification time changes, and files that no longer exist are
+removed. Once updated, lookups (e.g. the block for a session, or the video
+for a block) are indexed queries.
+
+Tables:
+    sessions - one row per behavioral file (keyed by path)
+    media - one row per video, frame time or tracking file (keyed by path)
+
+Created:
+    2026-10-18
+
+"""
+
+from contextlib import closing
+from datetime import datetime
+import hashlib
+from pathlib import Path
+import re
+import sqlite3
+
+import pandas as pd
+
+
+CATALOG_PATH = Path('Analysis/Main/Data/catalog.sqlite')
+CATALOG_VERSION = 1         # Increment to rebuild catalogs if the tables change
+
+TEST_LEVELS = (53, 54, 55)  # Levels with center platform rotation (test sessions)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    path TEXT PRIMARY KEY,
+    root TEXT,
+    ferret TEXT,
+    subject TEXT,
+    level INTEGER,
+    session_dt TEXT,
+    block TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha1 TEXT,
+    n_trials INTEGER,
+    header_hash TEXT,
+    schema_era TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_datetime ON sessions (ferret, session_dt);
+CREATE INDEX IF NOT EXISTS sessions_block ON sessions (ferret, block);
+CREATE INDEX IF NOT EXISTS sessions_level ON sessions (root, level);
+
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    root TEXT,
+    kind TEXT,
+    video TEXT,
+    ferret TEXT,
+    block TEXT,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS media_video ON media (kind, video);
+CREATE INDEX IF NOT EXISTS media_block ON media (kind, ferret, block);
+"""
+
+
+def parse_file_name(file):
+    """
+    Get session information from the name of a behavioral file
+
+    Parameters:
+    ----------
+    file : path or str
+        Path to behavioral file (or file stem)
+
+    Returns:
+    --------
+    info : dict
+        Subject name, level, session datetime and block
+
+    >>> info = parse_file_name('02_03_2018 level53_Pendleton 14_12_10.516 Block_J5-90.txt')
+    >>> info['level'], info['subject'], info['session_dt'], info['block']
+    (53, 'Pendleton', datetime.datetime(2018, 3, 2, 14, 12, 10), 'Block_J5-90')
+    """
+
+    file = Path(file).name
+    if file.endswith('.txt'):
+        file = file[:-4]
+
+    [f_date, level, f_time, block] = file.split()
+    [level, subject] = level.split('_', 1)
+
+    return dict(
+        subject = subject,
+        level = int(level.replace('level', '')),
+        session_dt = datetime.strptime(f_date + ' ' + f_time[0:8], '%d_%m_%Y %H_%M_%S'),
+        block = block
+    )
+
+
+def get_schema_era(columns):
+    """
+    Identify the version of data collection from the columns of a behavioral file
+
+    Parameters:
+    ----------
+    columns : list
+        Column names in header of behavioral file
+
+    Returns:
+    --------
+    era : str
+        One of 'pre_rotation' (no center spout data), 'question_marks' (early
+        column names ending in '?'), 'center_pixel' (later files with center 
+        pixel values and underscores in column names) or 'standard'
+    """
+
+    if 'CenterSpoutRotation' not in columns:
+        return 'pre_rotation'
+    elif any(x.endswith('?') for x in columns):
+        return 'question_marks'
+    elif 'CenterPixelVal' in columns:
+        return 'center_pixel'
+    else:
+        return 'standard'
+
+
+def read_file_info(file):
+    """
+    Read the contents of a behavioral file to get its hash, header and number of trials
+
+    Parameters:
+    ----------
+    file : pathlib Path
+        Path to behavioral file
+
+    Returns:
+    --------
+    info : dict
+        Content hash (sha1), header hash, schema era and number of trials
+    """
+
+    with open(file, 'rb') as f:
+        content = f.read()
+
+    lines = content.splitlines()
+    header = lines[0].decode('latin1') if len(lines) > 0 else ''
+    columns = [x.strip() for x in header.split('\t') if x.strip() != '']
+
+    return dict(
+        sha1 = hashlib.sha1(content).hexdigest(),
+        n_trials = sum(1 for x in lines[1:] if x.strip() != b''),
+        header_hash = hashlib.sha1('\t'.join(columns).encode()).hexdigest()[:12],
+        schema_era = get_schema_era(columns)
+    )
+
+
+def connect(catalog_path=CATALOG_PATH):
+    """
+    Open the catalog, creating tables if required (or rebuilding them if the
+    catalog was created by an earlier version of this module)
+    """
+
+    catalog_path = Path(catalog_path)
+    catalog_path.parent.mkdir(parents=True, exist_ok=True)
+
+    con = sqlite3.connect(catalog_path)
+
+    if con.execute('PRAGMA user_version').fetchone()[0] != CATALOG_VERSION:
+        con.executescript('DROP TABLE IF EXISTS sessions; DROP TABLE IF EXISTS media;')
+        con.execute(f'PRAGMA user_version = {CATALOG_VERSION}')
+
+    con.executescript(SCHEMA)
+
+    return con
+
+
+def get_block_info(path):
+    """ Subject (e.g. F1701_Pendleton) and block from the directories containing a file (if present) """
+
+    parts = Path(path).parent.parts[::-1]
+
+    ferret = next((x for x in parts if re.fullmatch(r'F\d{4}_\w+', x)), None)
+    block = next((x for x in parts if x.startswith('Block_')), None)
+
+    return ferret, block
+
+
+def get_known_files(con, table, root, kind=None):
+    """ Size and modification time of files in catalog, by path """
+
+    query = f"SELECT path, size, mtime_ns FROM {table} WHERE root = ?"
+    params = [str(root)]
+
+    if kind is not None:
+        query += " AND kind = ?"
+        params.append(kind)
+
+    return {path: (size, mtime) for (path, size, mtime) in con.execute(query, params)}
+
+
+def remove_missing(con, table, known, found, root=None, patterns=None):
+    """ Delete rows for files that are no longer present (and match patterns searched, if given) """
+
+    missing = set(known) - set(found)
+
+    if patterns is not None:
+        missing = [x for x in missing if any(Path(x).relative_to(root).match(p) for p in patterns)]
+
+    con.executemany(f"DELETE FROM {table} WHERE path = ?", [(x,) for x in missing])
+
+    return len(missing)
+
+
+def update_sessions(root, catalog_path=CATALOG_PATH, pattern='*level*.txt'):
+    """
+    Add new or changed behavioral files under a directory to the catalog
+
+    Parameters:
+    ----------
+    root : pathlib Path
+        Directory containing subdirectories for each ferret (e.g. Analysis/Main/Data/Original)
+    catalog_path : pathlib Path, optional
+        SQLite database
+    pattern : str, optional
+        Pattern matching names of behavioral files (searched recursively)
+
+    Notes:
+    ------
+    Files are only read if they're not in the catalog, or their size or
+    modification time has changed. Files with names that can't be parsed are
+    ignored.
+
+    Returns:
+    --------
+    summary : dict
+        Number of files added or updated, unchanged and removed
+    """
+
+    root = Path(root)
+    summary = dict(updated=0, unchanged=0, removed=0)
+
+    with closing(connect(catalog_path)) as con, con:
+
+        known = get_known_files(con, 'sessions', root)
+        found = []
+
+        for file in root.rglob(pattern):
+
+            try:
+                info = parse_file_name(file)
+            except ValueError:
+                continue
+
+            stat = file.stat()
+            found.append(str(file))
+
+            if known.get(str(file)) == (stat.st_size, stat.st_mtime_ns):
+                summary['unchanged'] += 1
+                continue
+
+            ferret, _ = get_block_info(file)
+
+            info.update(read_file_info(file))
+            info.update(
+                path = str(file),
+                root = str(root),
+                ferret = ferret if ferret is not None else info['subject'],
+                session_dt = info['session_dt'].isoformat(sep=' '),
+                size = stat.st_size,
+                mtime_ns = stat.st_mtime_ns
+            )
+
+            columns = list(info.keys())
+            con.execute(
+                f"INSERT OR REPLACE INTO sessions ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [info[x] for x in columns]
+            )
+            summary['updated'] += 1
+
+        summary['removed'] = remove_missing(con, 'sessions', known, found)
+
+    return summary
+
+
+def update_media(root, kind, patterns, catalog_path=CATALOG_PATH):
+    """
+    Add video, frame time or tracking files under a directory to the catalog
+
+    Parameters:
+    ----------
+    root : pathlib Path
+        Directory to search
+    kind : str
+        Type of file (e.g. 'video', 'frames', 'dlc' or 'tracking')
+    patterns : str or list
+        Pattern(s) matching files relative to root (e.g. '*/Block_*/*.avi')
+    catalog_path : pathlib Path, optional
+        SQLite database
+
+    Notes:
+    ------
+    Files are linked to videos by the start of their name (before 'DLC' for
+    tracking results), and to ferrets and blocks by the directories in which
+    they're saved (if available). Only files matching the patterns searched
+    are removed if missing, so specific blocks can be updated without 
+    searching the whole directory.
+
+    Returns:
+    --------
+    summary : dict
+        Number of files added or updated, unchanged and removed
+    """
+
+    root = Path(root)
+    summary = dict(updated=0, unchanged=0, removed=0)
+
+    if isinstance(patterns, str):
+        patterns = [patterns]
+
+    with closing(connect(catalog_path)) as con, con:
+
+        known = get_known_files(con, 'media', root, kind)
+        found = []
+
+        for pattern in patterns:
+            for file in sorted(root.glob(pattern)):
+
+                stat = file.stat()
+                found.append(str(file))
+
+                if known.get(str(file)) == (stat.st_size, stat.st_mtime_ns):
+                    summary['unchanged'] += 1
+                    continue
+
+                ferret, block = get_block_info(file)
+
+                con.execute(
+                    "INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [str(file), str(root), kind, file.stem.split('DLC')[0], ferret, block, stat.st_size, stat.st_mtime_ns]
+                )
+                summary['updated'] += 1
+
+        summary['removed'] = remove_missing(con, 'media', known, found, root, patterns)
+
+    return summary
+
+
+def query(sql, params=(), catalog_path=CATALOG_PATH):
+    """ Run a query on the catalog and return the result as a dataframe """
+
+    with closing(connect(catalog_path)) as con:
+        return pd.read_sql_query(sql, con, params=params)
+
+
+def load_sessions(catalog_path=CATALOG_PATH, root=None, ferrets=None, levels=None):
+    """
+    Get catalog entries for behavioral files
+
+    Parameters:
+    ----------
+    catalog_path : pathlib Path, optional
+        SQLite database
+    root : pathlib Path, optional
+        Only include files under this directory (as passed to update_sessions)
+    ferrets : list, optional
+        Subjects to include (e.g. ['F1701_Pendleton'])
+    levels : list, optional
+        Task levels to include (e.g. TEST_LEVELS)
+
+    Returns:
+    --------
+    sessions : pandas dataframe
+        One row per file, ordered by level and path, with session datetime as
+        a datetime column
+    """
+
+    conditions, params = [], []
+
+    if root is not None:
+        conditions.append("root = ?")
+        params.append(str(Path(root)))
+
+    for column, values in (('ferret', ferrets), ('level', levels)):
+        if values is not None:
+            values = list(values)
+            conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+
+    sql = "SELECT * FROM sessions"
+    if len(conditions) > 0:
+        sql += " WHERE " + " AND ".join(conditions)
+
+    sessions = query(sql + " ORDER BY level, path", params, catalog_path)
+    sessions['session_dt'] = pd.to_datetime(sessions['session_dt'])
+
+    return sessions
+
+
+def load_media(kind, catalog_path=CATALOG_PATH, root=None):
+    """
+    Get catalog entries for video, frame time or tracking files
+
+    Parameters:
+    ----------
+    kind : str
+        Type of file (as passed to update_media)
+    catalog_path : pathlib Path, optional
+        SQLite database
+    root : pathlib Path, optional
+        Only include files under this directory
+
+    Returns:
+    --------
+    media : pandas dataframe
+        One row per file, with the video, ferret and block to which it belongs
+    """
+
+    sql = "SELECT * FROM media WHERE kind = ?"
+    params = [kind]
+
+    if root is not None:
+        sql += " AND root = ?"
+        params.append(str(Path(root)))
+
+    return query(sql + " ORDER BY path", params, catalog_path)
@@ -0,0 +1,433 @@
+"""
+Trial counts for each combination of experimental conditions and behavior
+
+Most analyses depend only on the number of trials with each combination of
+sound angle, platform angle, trial type and response, rather than on
+individual trials. Here trials are reduced once to a table of counts (a sparse
+count cube) with one row for each observed combination of:
+
+    ferret, SessionDate, CenterSpoutRotation, speaker_angle_world,
+    speaker_angle_platform, not_probe, Response, Correct
+
+and the number of trials (n). The count cube is saved in parquet format,
+and can be updated one session at a time as new data are formatted.
+
+Analyses (including bootstrap resampling) then scale with the number of
+cells, rather than the number of trials.
+
+Created:
+    2026-10-18
+
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from Analysis import cf_analysis as cfa
+from Analysis import cf_store as cfs
+
+
+COUNT_DIMS = ['ferret', 'SessionDate', 'CenterSpoutRotation', 'speaker_angle_world',
+              'speaker_angle_platform', 'not_probe', 'Response', 'Correct']
+
+SESSION_DIMS = ['ferret', 'SessionDate']
+
+
+def count_trials(df, dims=None):
+    """
+    Count trials for each combination of values in several columns
+
+    Parameters:
+    ----------
+    df : pandas dataframe
+        Trial data (e.g. from cf_store.load_trials)
+    dims : list, optional
+        Columns to count over (defaults to all of COUNT_DIMS in df)
+
+    Returns:
+    --------
+    counts : pandas dataframe
+        Counts (n) for each observed combination of values
+    """
+
+    if dims is None:
+        dims = [x for x in COUNT_DIMS if x in df.columns]
+
+    counts = df.groupby(dims, observed=True, sort=True).size()
+
+    return counts.rename('n').astype('int32').reset_index()
+
+
+def as_counts(df, dims):
+    """
+    Get counts over dims from either trial data or an existing count table
+
+    Parameters:
+    ----------
+    df : pandas dataframe
+        Trial data, or counts with an 'n' column
+    dims : list
+        Columns to count over
+
+    Returns:
+    --------
+    counts : pandas dataframe
+        Counts (n) for each observed combination of values
+    """
+
+    if 'n' in df.columns:
+        return marginalise(df, dims)
+
+    return count_trials(df, dims)
+
+
+def marginalise(counts, dims):
+    """
+    Sum counts over all columns except dims
+
+    >>> counts = pd.DataFrame({'Response': [0, 1, 1], 'Correct': [1, 0, 1], 'n': [2, 3, 4]})
+    >>> marginalise(counts, ['Response'])
+       Response  n
+    0         0  2
+    1         1  7
+    """
+
+    return counts.groupby(dims, observed=True, sort=True)['n'].sum().reset_index()
+
+
+def select(counts, **conditions):
+    """
+    Select cells with specific values (or lists of values)
+
+    Parameters:
+    ----------
+    counts : pandas dataframe
+        Count table
+    **conditions : optional
+        Values required in each column (e.g. not_probe=1, ferret=['F1701_Pendleton'])
+
+    Returns:
+    --------
+    counts : pandas dataframe
+        Cells matching all conditions
+    """
+
+    mask = np.ones(counts.shape[0], dtype=bool)
+
+    for (col, value) in conditions.items():
+        if isinstance(value, (list, tuple, set, np.ndarray, pd.Index)):
+            mask &= counts[col].isin(value).to_numpy()
+        else:
+            mask &= (counts[col] == value).to_numpy()
+
+    return counts[mask]
+
+
+def to_dense(counts, dims):
+    """
+    Convert counts into a dense N-dimensional array
+
+    Parameters:
+    ----------
+    counts : pandas dataframe
+        Count table
+    dims : list
+        Columns used as dimensions of the array (other columns are summed over)
+
+    Returns:
+    --------
+    cube : numpy array
+        Counts with one axis per dimension (zero for combinations not observed)
+    coords : dict
+        Values along each axis
+    """
+
+    counts = marginalise(counts, dims)
+    coords = {d: np.sort(counts[d].unique()) for d in dims}
+
+    cube = np.zeros([len(v) for v in coords.values()], dtype='int64')
+    idx = tuple(np.searchsorted(coords[d], counts[d].to_numpy()) for d in dims)
+
+    np.add.at(cube, idx, counts['n'].to_numpy())
+
+    return cube, coords
+
+
+def resample_counts(n, codes, sample_size, nIterations=100, replace=True, rng=None):
+    """
+    Bootstrap resampling of trials, using only the number of trials in each cell
+
+    Parameters:
+    ----------
+    n : numpy array
+        Number of trials in each cell
+    codes : numpy array
+        Group (0 to nGroups-1) of each cell; trials are sampled within groups
+    sample_size : int
+        Number of trials sampled from each group on each iteration
+    nIterations : int, optional
+        Number of bootstrap iterations
+    replace : bool, optional
+        Whether trials are sampled with replacement (multinomial) or without
+        replacement (multivariate hypergeometric)
+    rng : numpy random generator or int, optional
+        Generator (or seed) for sampling
+
+    Notes:
+    ------
+    Sampling trials with replacement from a group is equivalent to drawing
+    counts for each cell in the group from a multinomial distribution, so
+    draws for all groups and iterations are made at once.
+
+    Returns:
+    --------
+    sampled : numpy array
+        Number of trials sampled from each cell (cells x iterations)
+    """
+
+    rng = np.random.default_rng(rng)
+
+    n = np.asarray(n, dtype='int64')
+    codes = np.asarray(codes)
+
+    group_size = np.bincount(codes, weights=n).astype('int64')
+
+    if not replace and np.any(group_size < sample_size):
+        raise ValueError(f"Sample size ({sample_size}) is larger than the smallest group ({group_size.min()})")
+
+    # Arrange cells in padded array (groups x cells in group)
+    order = np.argsort(codes, kind='stable')
+    cells_per_group = np.bincount(codes)
+    group_start = np.concatenate(([0], np.cumsum(cells_per_group)[:-1]))
+    position = np.arange(codes.size) - group_start[codes[order]]
+
+    padded = np.zeros((cells_per_group.size, cells_per_group.max()), dtype='int64')
+    padded[codes[order], position] = n[order]
+
+    if replace:
+        sampled = rng.multinomial(sample_size, padded / group_size[:, np.newaxis], size=(nIterations, padded.shape[0]))
+    else:
+        sampled = np.stack([rng.multivariate_hypergeometric(x, sample_size, size=nIterations) for x in padded], axis=1)
+
+    result = np.empty((codes.size, nIterations), dtype='int64')
+    result[order] = sampled[:, codes[order], position].T
+
+    return result
+
+
+def get_joint_responseP(counts, sample_size=3, nIterations=100, rng=None):
+    """
+    Get the probability of making a response for each combination of
+    sound angles in head and world-centred space (as cf_analysis.get_joint_responseP)
+
+    Parameters:
+    ----------
+    counts : pandas dataframe
+        Count table (or trial data) with sound angles and responses
+    sample_size : int
+        Number of samples required for each combination of head and world coordinates
+    nIterations : int
+        Number of bootstrap resamples
+    rng : numpy random generator or int, optional
+        Generator (or seed) for resampling
+
+    Returns:
+    --------
+    result : pandas dataframe
+        Sound angles relative to platform (stim_platf) and the world (stim_world),
+        with the number of responses (nResp) and trials (nTrial) sampled, and the
+        response probability (pResp)
+    """
+
+    counts = as_counts(counts, ['speaker_angle_world', 'speaker_angle_platform', 'Response'])
+    codes = counts.groupby(['speaker_angle_world', 'speaker_angle_platform'], sort=True).ngroup().to_numpy()
+
+    sampled = resample_counts(counts['n'], codes, sample_size, nIterations, replace=True, rng=rng)
+
+    counts['nResp'] = sampled.sum(axis=1) * counts['Response'].to_numpy()
+    counts['nTrial'] = sample_size * nIterations
+
+    result = counts.groupby(['speaker_angle_world', 'speaker_angle_platform'], sort=True).agg(
+        nResp = ('nResp', 'sum'),
+        nTrial = ('nTrial', 'first')
+    ).reset_index()
+
+    result = result.rename(columns={'speaker_angle_platform': 'stim_platf', 'speaker_angle_world': 'stim_world'})
+    result = result[['stim_platf', 'stim_world', 'nResp', 'nTrial']]
+    result['pResp'] = result['nResp'] / result['nTrial']
+
+    return result
+
+
+def get_percent_correct(counts, sample_size=400, nIterations=100, ci=95, rng=None):
+    """
+    Get task performance (% correct) for each platform angle, using fixed
+    sample sizes with bootstrap resampling (as cf_analysis.get_percent_correct)
+
+    Parameters:
+    ----------
+    counts : pandas dataframe
+        Count table (or trial data) with platform angle, trial type and correct scoring
+    sample_size : int
+        Number of trials over which to measure task performance at each platform angle
+    nIterations : int
+        Number of bootstrap iterations
+    ci : float, optional
+        Width (%) of bootstrap confidence interval
+    rng : numpy random generator or int, optional
+        Generator (or seed) for resampling
+
+    Returns:
+    --------
+    result : pandas dataframe
+        Performance (% correct) for each platform angle, including the mean, standard
+        deviation and confidence interval across bootstrap iterations, and the p-value
+        of a binomial test on the mean number of trials correct
+    """
+
+    counts = as_counts(counts, ['not_probe', 'CenterSpoutRotation', 'Correct'])
+    counts = select(counts, not_probe=1).reset_index(drop=True)
+
+    codes = counts.groupby('CenterSpoutRotation', sort=True).ngroup().to_numpy()
+    platform_angles = np.sort(counts['CenterSpoutRotation'].unique())
+
+    sampled = resample_counts(counts['n'], codes, sample_size, nIterations, replace=False, rng=rng)
+
+    nCorrect = np.zeros((platform_angles.size, nIterations), dtype='int64')
+    np.add.at(nCorrect, codes, sampled * counts['Correct'].to_numpy()[:, np.newaxis])
+
+    pCorrect = nCorrect / float(sample_size)
+
+    pBinom = cfa.binom_test(np.round(nCorrect.mean(axis=1)).astype(int), n=sample_size, p=0.5)
+
+    for cs_angle, p in zip(platform_angles, pBinom):
+        print(f"\t\tPlatform = {cs_angle}°, p = {p}")
+
+    ci_tail = (100 - ci) / 2
+
+    result = pd.DataFrame({
+        'PlatformAngle': platform_angles,
+        'mean': np.mean(pCorrect, axis=1) * 100,
+        'std_dev': np.std(pCorrect, axis=1),
+        'ci_lower': np.percentile(pCorrect, ci_tail, axis=1) * 100,
+        'ci_upper': np.percentile(pCorrect, 100 - ci_tail, axis=1) * 100,
+        'pBinom': pBinom
+        })
+
+    # Wrap around circle (i.e. make a datapoint at -180 that corresponds to +180)
+    result = cfa.wrap_data(result, 'PlatformAngle', filter_val=180, delta=-360)
+    result.sort_values(by='PlatformAngle', inplace=True)
+    result.set_index('PlatformAngle', inplace=True)
+
+    return result
+
+
+def build_count_cube(store_path, ferrets=None):
+    """
+    Count trials for all sessions in the trial store
+
+    Parameters:
+    ----------
+    store_path : pathlib Path
+        Root directory of trial store (see cf_store.py)
+    ferrets : list, optional
+        Full names of subjects to include (or all subjects if None)
+
+    Returns:
+    --------
+    counts : pandas dataframe
+        Count table
+    """
+
+    df = cfs.load_trials(store_path, ferrets=ferrets, columns=COUNT_DIMS[1:])
+    df['ferret'] = df['ferret'].astype(str)
+
+    return count_trials(df, COUNT_DIMS)
+
+
+def update_count_cube(counts, trials, sessions=None):
+    """
+    Replace counts for sessions in new trial data
+
+    Parameters:
+    ----------
+    counts : pandas dataframe
+        Existing count table (or None)
+    trials : pandas dataframe
+        Trial data for new (or re-formatted) sessions, with a ferret column
+    sessions : pandas dataframe, optional
+        Sessions to replace (ferret and SessionDate), if different from the 
+        sessions in trials (e.g. to remove sessions that no longer have any
+        trials)
+
+    Returns:
+    --------
+    counts : pandas dataframe
+        Count table with sessions in trials replaced (or added)
+    """
+
+    new_counts = count_trials(trials, COUNT_DIMS) if trials is not None and trials.shape[0] > 0 else None
+
+    if new_counts is None and sessions is None:
+        return counts
+
+    if sessions is None:
+        sessions = new_counts[SESSION_DIMS].drop_duplicates()
+
+    if counts is None or counts.shape[0] == 0:
+        return new_counts
+
+    sessions = pd.MultiIndex.from_frame(sessions[SESSION_DIMS].astype({'ferret': str}))
+    is_replaced = pd.MultiIndex.from_frame(counts[SESSION_DIMS].astype({'ferret': str})).isin(sessions)
+
+    counts = pd.concat([counts[~is_replaced], new_counts], ignore_index=True)
+
+    return counts.sort_values(by=COUNT_DIMS, ignore_index=True)
+
+
+def write_count_cube(counts, file_path):
+    """ Save count table in parquet format """
+
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    counts = cfs.compact_trials(counts)
+    counts.to_parquet(file_path, index=False, compression='zstd')
+
+
+def load_count_cube(file_path, ferrets=None, **conditions):
+    """
+    Load count table
+
+    Parameters:
+    ----------
+    file_path : pathlib Path
+        Parquet file saved by write_count_cube
+    ferrets : list, optional
+        Full names of subjects to load (or all subjects if None)
+    **conditions : optional
+        Values required in other columns (see select)
+
+    Returns:
+    --------
+    counts : pandas dataframe
+        Count table
+
+    Notes:
+    ------
+    Raises ValueError if any of the requested subjects are not in the count
+    table (e.g. if their data have not been formatted).
+    """
+
+    filters = None if ferrets is None else [('ferret', 'in', list(ferrets))]
+
+    counts = pd.read_parquet(file_path, filters=filters)
+
+    if ferrets is not None:
+        missing = sorted(set(ferrets) - set(counts['ferret'].astype(str)))
+        if len(missing) > 0:
+            raise ValueError(f"No counts found for {missing} in {file_path}")
+
+    return select(counts, **conditions).reset_index(drop=True)
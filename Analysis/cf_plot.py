@@ -17,6 +17,9 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import seaborn as sns
 
+from Analysis import cf_angles as cang
+from Analysis import cf_behavior as cb
+
 ########################################################################################
 # Matplotlib functions
 #   - Developed for publications
@@ -244,10 +247,7 @@ def wrap_data(df, colname, filter_val=-180, delta=360):
         Dataframe with wrapped value
     """
 
-    wrap_data = df[df[colname] == filter_val].copy()
-    wrap_data[colname] = wrap_data[colname] + delta
-        
-    return pd.concat([df, wrap_data])
+    return cang.duplicate_wrapped_values(df, colname, filter_val, delta)
 
 
 def rotate_tick_labels(ax, dim, angle=45):
@@ -623,67 +623,14 @@ def id_center_spout_changes(test_data):
         to another(row y)
     """
 
-    # Get unique angles
-    angles = test_data.CenterSpoutRotation.unique()
-    angles = angles.tolist()
-    angles.sort()
-
-    # Preassign matrix in which we will count each change in rotation
-    nAngles = len(angles)
-    nTrials = np.zeros((nAngles, nAngles), dtype=int)
-    nCorrect = np.zeros((nAngles, nAngles), dtype=int)
-
-    # Intialize
-    rotation_value = test_data['CenterSpoutRotation'][0:1].values
-    rotation_value = rotation_value[0]
-
-    session_id = test_data['SessionID'][0:1].values
-    session_id = session_id[0]
-
-    # For each row
-    for index, row in test_data.iterrows():
-
-        # If the current value has changed
-        if rotation_value != row['CenterSpoutRotation'] or session_id != row['SessionID']:
-
-            # Get row and column indices for count matrix
-            row_index = angles.index(row['CenterSpoutRotation'])
-            col_index = angles.index(rotation_value)
-
-            # Add one to count value
-            nTrials[row_index, col_index] += 1
-
-            # Add an additional trial if the animal performed correctly
-            nCorrect[row_index, col_index] = nCorrect[row_index, col_index] + row['Correct']
-
-            # Update rotation and session id
-            rotation_value = row['CenterSpoutRotation']
-            session_id = row['SessionID']
-
-    output = {
-    'nTrials': nTrials, 'x': angles, 'y': angles}
-
-    return output
-
+    transitions = cb.count_rotation_transitions(test_data, n_after=1)
 
+    return {'nTrials': transitions['nTrials'][0], 'x': transitions['x'], 'y': transitions['y']}
 
 
 def get_angle_changes(np, angles):
-
-    # Create angle difference map
-    nAngles = len(angles)
-    delta_angle = np.zeros((nAngles, nAngles), dtype=int)
-
-    for i in range(0, nAngles):  # For each index of angle
-        for j in range(0, nAngles):
-            delta_ij = abs(angles[i] - angles[j])   # Get the unsigned difference
-
-            if delta_ij > 180:  # Wrap around circle (if required)
-                delta_ij = 360 - delta_ij
-
-            delta_angle[i, j] = delta_ij
-
-    return delta_angle
+    """ Difference matrix for a list of angles (see cf_behavior.get_angle_changes) """
+    return cb.get_angle_changes(angles)
 
 
 def plot_pCorrect_with_angle_changes(angle_change, nTrials, nCorrect, Fig=None):
@@ -771,164 +718,13 @@ def plot_pCorrect_with_angle_changes(angle_change, nTrials, nCorrect, Fig=None):
 
 
 def get_probe_performance(test_data, np, pd, ferret):
-
-    from math import pi
-
-    # Get rid of white space in column names
-    test_data.columns = test_data.columns.str.replace(' ', '')
-
-    # # Get unique center spout and speaker angles
-    speakers = test_data.SpeakerLocation.unique()   # e.g. speakers 1-12
-    CS_angles = test_data.CenterSpoutRotation.unique()  # e.g. -150 to 180 in 30° steps
-
-    # Convert speaker index into angle
-    speaker_angle = -30 * speakers
-    speaker_angle = speaker_angle + 180
-
-    # Preassign
-    my_list = list()
-
-    # For each speaker location (i.e. world angle)
-    for speaker in speakers:
-
-        # Filter for data
-        speaker_data = test_data[test_data['SpeakerLocation'] == speaker]
-
-        # For each center spout angle
-        for CS_angle in CS_angles:
-
-            # Filter for data
-            flt_data = speaker_data[speaker_data['CenterSpoutRotation'] == CS_angle]
-
-            # Get number of trials
-            nTrials = sum(flt_data['Response'] == 3) + sum(flt_data['Response'] == 9)
-
-            # If this combination of speaker index and center spout angle was tested
-            if flt_data.shape[0] > 0:
-                nResponse = sum(flt_data['Response'] == 3)  # Get number of instances of each response type
-            else:
-                nResponse = 0
-
-            # Write results to text file
-            my_list.append({'Speaker_Idx': speaker, 'Platform_Angle': CS_angle, 'nTrials': nTrials, 'nSpout3': nResponse})
-
-    # Convert to pandas dataframe
-    df = pd.DataFrame(my_list)
-
-    # Convert platform angles from degrees to radians
-    df.Platform_Angle = df.Platform_Angle / 180 * pi     # Convert to radians
-
-    # Add Speaker Location in the world (in radians)
-    def index2world(idx):
-        return pi + idx * -(pi / 6)
-
-    df['SpeakerAngleWorld'] = index2world(df['Speaker_Idx'])
-
-    # Calculate Speaker angles relative to platform
-    df['platform_speaker_angle'] = df['SpeakerAngleWorld'] - df['Platform_Angle']
-    df['platform_speaker_angle'] = df['platform_speaker_angle'].apply(lambda x: x - (2 * pi) if x > pi else x)  # Wrap to ± pi
-    df['platform_speaker_angle'] = df['platform_speaker_angle'].apply(lambda x: x + (2 * pi) if x <= (0.01 - pi) else x)
-
-    # Return data frame
-    return df
+    """ See cf_behavior.get_probe_performance """
+    return cb.get_probe_performance(test_data, np, pd, ferret)
 
 
 def draw_probe_performance(test_data, np, go, py, ferret, notebook=False):
-
-    # Get rid of white space in column names
-    test_data.columns = test_data.columns.str.replace(' ', '')
-
-    # # Get unique center spout and speaker angles
-    speakers = test_data.SpeakerLocation.unique()   # e.g. speakers 1-12
-    CS_angles = test_data.CenterSpoutRotation.unique()  # e.g. -150 to 180 in 30° steps
-
-    # Sort
-    CS_angles.sort()
-    speakers.sort()
-
-    # Convert speaker index into angle
-    speaker_angle = -30 * speakers
-    speaker_angle = speaker_angle + 180
-
-    # Count unique cases
-    nSpeakers = len(speakers)
-    nCS_Angles = len(CS_angles)
-
-    # Create results space
-    nRight = np.zeros((nSpeakers, nCS_Angles), dtype=int)
-    nTrials = np.zeros((nSpeakers, nCS_Angles), dtype=int)
-
-    # For each speaker location (i.e. world angle)
-    for spkr_idx, speaker in enumerate(speakers):
-
-        # Filter for data
-        speaker_data = test_data[test_data['SpeakerLocation'] == speaker]
-
-        # For each center spout angle
-        for CS_idx, CS_angle in enumerate(CS_angles):
-
-            # Filter for data
-            flt_data = speaker_data[speaker_data['CenterSpoutRotation'] == CS_angle]
-
-            # Get number of trials
-            nTrials[spkr_idx, CS_idx] = sum(flt_data['Response'] == 3) + sum(flt_data['Response'] == 9)
-
-            # If data exists for this combination of speaker index and center spout angle
-            if flt_data.shape[0] > 0:
-
-                # Get number of instances of each response type
-                nResponses = sum(flt_data['Response'] == 3)
-
-                # Append to lists
-                nRight[spkr_idx, CS_idx] = nResponses
-
-            else:
-                f'No data: Platform @ {CS_angle}, Speaker {speaker}'
-
-    # Calculate percent correct in each cell
-    np.seterr(divide='ignore', invalid='ignore')  # ignore divide by zero (data still being collected for these areas)
-    pRight = nRight / nTrials
-
-    ####################################################################
-    # Analyze marginals
-
-    ####################################################################
-    # Create graphics objects
-
-    trial_n_map = go.Heatmap(x=CS_angles, y=speakers, z=nTrials,    # Trial number
-                             colorscale='Greys',
-                             xaxis='x1', yaxis='y1')
-
-    trace1 = go.Heatmap(x=CS_angles, y=speakers, z=nRight,  # Number of trial correct
-                        colorscale='Greys',
-                        xaxis='x2', yaxis='y2')
-
-    trace2 = go.Heatmap(x=CS_angles, y=speakers, z=pRight,  # Trial number
-                        colorscale='Greys',
-                        xaxis='x3', yaxis='y3')
-
-    layout = go.Layout(title=ferret,
-                       xaxis=dict(title='Center Spout Angle (°)',  # bottom left
-                                  domain=[0, 0.3]),
-                       yaxis=dict(title='World Angle (°)',
-                                  domain=[0, 1]),
-                       xaxis2=dict(title='Center Spout Angle (°)', anchor='x2',  # bottom right
-                                   domain=[0.35, 0.65]),
-                       yaxis2=dict(domain=[0, 1],
-                                   anchor='y2'),
-                       xaxis3=dict(title='Center Spout Angle (°)', anchor='x3',  # top left
-                                   domain=[0.7, 1]),
-                       yaxis3=dict(domain=[0, 1],
-                                   anchor='y3'))
-
-    fig = go.Figure(data=[trial_n_map, trace1, trace2], layout=layout)
-
-    # Plot to file or notebook
-    if notebook:
-        py.iplot(fig, filename='jupyter_' + ferret)
-    else:
-        html_name = ferret + '_probe_count.html'
-        py.plot(fig, filename=html_name)
+    """ See cf_behavior.draw_probe_performance """
+    return cb.draw_probe_performance(test_data, np, go, py, ferret, notebook=notebook)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,187 @@
+"""
+Columnar storage of formatted trial data
+
+Formatted data for each ferret is also stored in parquet format, in a
+directory partitioned by ferret (e.g. Trials/ferret=F1701_Pendleton/trials.parquet).
+Compared to the formatted csv files, this has several benefits:
+    - Values are stored with compact data types (e.g. int8 for speaker
+      location), rather than being parsed from text each time
+    - Session and trial datetimes are stored as timestamps
+    - Only the columns and ferrets requested are read from disk
+
+Within each ferret, trials are stored in chronological order so that the
+statistics for each row group can be used to skip sessions that aren't
+requested (e.g. when filtering by SessionDate)
+
+Created:
+    2026-10-18
+
+"""
+
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Compact data types for columns in formatted data
+TRIAL_DTYPES = {
+    'Trial': 'int16',
+    'CorrectionTrial': 'int8',
+    'StartTime': 'float32',
+    'CenterReward': 'int8',
+    'CenterSpoutRotation': 'int16',
+    'nStimReps': 'int8',
+    'Duration': 'float32',
+    'Modality': 'int8',
+    'LED Location': 'int8',
+    'LED_trial_V': 'float32',
+    'LED_bgnd_V': 'float32',
+    'Speaker Location': 'int8',
+    'Speaker_trial_V': 'float32',
+    'Speaker_bgnd_V': 'float32',
+    'TargetSpout': 'int8',
+    'HoldTime': 'float32',
+    'Response': 'int8',
+    'RespTime': 'float32',
+    'ValveTime': 'float32',
+    'Correct': 'int8',
+    'SessionID': 'int32',
+    'StimulusTotalDuration': 'float32',
+    'response_angle_world': 'int16',
+    'speaker_angle_world': 'int16',
+    'speaker_angle_platform': 'int16',
+    'response_angle_platform': 'int16',
+    'not_probe': 'int8'
+}
+
+ROW_GROUP_SIZE = 2048       # Trials per row group (roughly 10-20 sessions)
+
+
+def compact_trials(df):
+    """
+    Convert columns of formatted trial data into compact data types
+
+    Parameters:
+    ----------
+    df : pandas dataframe
+        Formatted trial data (e.g. as saved by format_data.py)
+
+    Returns:
+    --------
+    df : pandas dataframe
+        Trial data with compact data types and datetimes as timestamps
+    """
+
+    df = df.copy()
+
+    if df.index.name == 'Trial':
+        df.reset_index(inplace=True)
+
+    for col in ['SessionDate', 'StartDateTime']:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+
+    dtypes = {k: v for (k, v) in TRIAL_DTYPES.items() if k in df.columns}
+
+    return df.astype(dtypes)
+
+
+def write_trial_store(df, store_path, ferret):
+    """
+    Write formatted trial data for one ferret to the trial store, replacing
+    any existing data for that ferret
+
+    Parameters:
+    ----------
+    df : pandas dataframe
+        Formatted trial data for one ferret
+    store_path : pathlib Path
+        Root directory of trial store
+    ferret : str
+        Full name of subject (e.g. "F1701_Pendleton")
+
+    Returns:
+    --------
+    save_path : pathlib Path
+        Path to parquet file containing trials for the ferret
+    """
+
+    df = compact_trials(df)
+    df = df.sort_values(by=['SessionDate', 'StartDateTime'], kind='stable')
+
+    save_dir = Path(store_path) / f"ferret={ferret}"
+    save_dir.mkdir(parents=True, exist_ok=True)
+    save_path = save_dir / 'trials.parquet'
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, save_path, row_group_size=ROW_GROUP_SIZE, compression='zstd')
+
+    return save_path
+
+
+def list_ferrets(store_path):
+    """
+    List subjects with data in the trial store
+
+    Parameters:
+    ----------
+    store_path : pathlib Path
+        Root directory of trial store
+
+    Returns:
+    --------
+    names : list
+        Full names of subjects (e.g. "F1701_Pendleton")
+    """
+    return sorted([x.name.replace('ferret=', '') for x in Path(store_path).glob('ferret=*')])
+
+
+def load_trials(store_path, ferrets=None, columns=None, filters=None):
+    """
+    Load formatted trial data from the trial store
+
+    Parameters:
+    ----------
+    store_path : pathlib Path
+        Root directory of trial store
+    ferrets : list, optional
+        Full names of subjects to load (e.g. ["F1701_Pendleton"]), or all
+        subjects in the store if None
+    columns : list, optional
+        Names of columns to load, or all columns if None
+    filters : list, optional
+        Additional conditions that trials must meet, given as (column, op, value)
+        tuples (e.g. [('not_probe', '==', 1)]). Conditions are combined with AND.
+
+    Notes:
+    ------
+    Filters are applied while reading, so that data from other ferrets (and
+    row groups that can't contain matching trials) are never loaded.
+
+    Returns:
+    --------
+    df : pandas dataframe
+        Trial data, with a categorical column identifying each ferret
+    """
+
+    conditions = [] if filters is None else list(filters)
+
+    if ferrets is not None:
+        conditions.append(('ferret', 'in', list(ferrets)))
+
+    if columns is not None:
+        columns = list(columns)
+
+        if 'ferret' not in columns:
+            columns.append('ferret')
+
+    table = pq.read_table(
+        store_path,
+        columns = columns,
+        filters = conditions if len(conditions) > 0 else None,
+        partitioning = 'hive'
+        )
+
+    return table.to_pandas()
@@ -0,0 +1,307 @@
+"""
+Storage of DeepLabCut tracking results with frame times
+
+DLC output (h5) is read in chunks and joined with the TDT sample of each
+camera frame (from frame_samps text files) as it is read, so that long
+sessions can be processed without loading the whole file into memory.
+
+Tracking data are saved as parquet files with one row per frame and
+columns for each landmark (e.g. head_x, head_y, head_likelihood), using
+compact data types:
+    - TDT_Sample: int64
+    - x / y coordinates: float32 (pixels)
+    - likelihood: float16
+
+Frames are stored in the order they were acquired, with each chunk written
+as a row group, so that loading a time window only reads the row groups
+that overlap that window.
+
+Created:
+    2026-10-18
+
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+TDT_FS = 48842.125              # TDT sample rate in Hz
+CHUNK_SIZE = 20000              # Frames per chunk (and row group)
+
+COORD_DTYPES = {'x': 'float32', 'y': 'float32', 'likelihood': 'float16'}
+
+
+def iter_tracking_chunks(file_path, chunksize=CHUNK_SIZE):
+    """
+    Read DLC tracking results in chunks of frames
+
+    Parameters:
+    ----------
+    file_path : pathlib Path
+        h5 file saved by DeepLabCut
+    chunksize : int, optional
+        Number of frames per chunk
+
+    Notes:
+    ------
+    Files saved by DLC in table format are read chunk by chunk; files in
+    fixed format can only be read whole, and so are split after reading.
+
+    Returns:
+    --------
+    chunks : generator
+        Dataframes with columns for each landmark and coordinate (e.g. head_x),
+        with the scorer level removed
+    """
+
+    with pd.HDFStore(file_path, mode='r') as store:
+
+        key = store.keys()[0]
+        storer = store.get_storer(key)
+
+        if storer.is_table:
+            nrows = storer.nrows
+            reader = (store.select(key, start=i, stop=i+chunksize) for i in range(0, nrows, chunksize))
+        else:
+            df = store.select(key)
+            reader = (df.iloc[i:i+chunksize] for i in range(0, df.shape[0], chunksize))
+
+        for chunk in reader:
+
+            chunk = chunk.droplevel('scorer', axis=1)
+            chunk.columns = [f"{bodypart}_{coord}" for (bodypart, coord) in chunk.columns]
+
+            yield chunk.astype({c: COORD_DTYPES[c.split('_')[-1]] for c in chunk.columns})
+
+
+def iter_frame_samples(file_path, chunksize=CHUNK_SIZE):
+    """
+    Read TDT samples of camera frames in chunks
+
+    Parameters:
+    ----------
+    file_path : pathlib Path
+        Tab delimited file with TDT_Sample column (e.g. frame_samps/2018-10-03_Track_09-22-10.txt)
+    chunksize : int, optional
+        Number of frames per chunk
+
+    Returns:
+    --------
+    chunks : generator
+        Numpy arrays of TDT samples
+    """
+
+    with pd.read_csv(file_path, delimiter='\t', usecols=['TDT_Sample'], dtype={'TDT_Sample': 'int64'}, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield chunk['TDT_Sample'].to_numpy()
+
+
+def ingest_tracking_file(tracking_file, frame_file, save_path, bodyparts=None, chunksize=CHUNK_SIZE):
+    """
+    Join tracking results with frame times and save in compact format
+
+    Parameters:
+    ----------
+    tracking_file : pathlib Path
+        h5 file saved by DeepLabCut
+    frame_file : pathlib Path
+        Tab delimited file with TDT sample for each frame
+    save_path : pathlib Path
+        Parquet file to save
+    bodyparts : list, optional
+        Landmarks to save (or all landmarks if None)
+    chunksize : int, optional
+        Number of frames read and written at once
+
+    Notes:
+    ------
+    Data are written to a temporary file that replaces save_path only when
+    the whole session has been processed. A ValueError is raised if tracking
+    results contain no frames, or if tracking results and frame samples 
+    contain different numbers of frames.
+
+    Returns:
+    --------
+    nFrames : int
+        Number of frames saved
+    """
+
+    save_path = Path(save_path)
+    tmp_path = save_path.with_suffix('.tmp')
+
+    tracking = iter_tracking_chunks(tracking_file, chunksize)
+    frames = iter_frame_samples(frame_file, chunksize)
+
+    writer, nFrames = None, 0
+
+    try:
+        for chunk in tracking:
+
+            samples = next(frames, np.array([], dtype='int64'))
+
+            if samples.size != chunk.shape[0]:
+                raise ValueError(f"Number of frames differs between {tracking_file} and {frame_file}")
+
+            if bodyparts is not None:
+                chunk = chunk[[c for c in chunk.columns if c.rsplit('_', 1)[0] in bodyparts]]
+
+            chunk.insert(0, 'TDT_Sample', samples)
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema, compression='zstd')
+
+            writer.write_table(table, row_group_size=chunksize)
+            nFrames += chunk.shape[0]
+
+        if writer is None:
+            raise ValueError(f"No tracked frames in {tracking_file}")
+
+        if next(frames, None) is not None:
+            raise ValueError(f"Number of frames differs between {tracking_file} and {frame_file}")
+
+    except Exception:
+        if writer is not None:
+            writer.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    writer.close()
+    tmp_path.replace(save_path)
+
+    return nFrames
+
+
+def load_tracking(file_path, bodypart=None, start_time=None, stop_time=None, fs=TDT_FS):
+    """
+    Load tracking data with frame times
+
+    Parameters:
+    ----------
+    file_path : pathlib Path
+        Parquet file saved by ingest_tracking_file
+    bodypart : str, optional
+        Landmark to load (e.g. 'head'), or all landmarks if None
+    start_time, stop_time : float, optional
+        Time window to load (seconds on TDT clock; start inclusive, stop exclusive)
+    fs : float, optional
+        TDT sample rate
+
+    Returns:
+    --------
+    df : pandas dataframe
+        Tracking data with TDT sample and time of each frame. If bodypart is
+        specified, coordinates are in columns x, y and likelihood.
+    """
+
+    columns = None
+    if bodypart is not None:
+        columns = ['TDT_Sample'] + [f"{bodypart}_{c}" for c in COORD_DTYPES]
+
+    filters = []
+    if start_time is not None:
+        filters.append(('TDT_Sample', '>=', int(np.ceil(start_time * fs))))
+    if stop_time is not None:
+        filters.append(('TDT_Sample', '<', int(np.ceil(stop_time * fs))))
+
+    df = pq.read_table(file_path, columns=columns, filters=filters if len(filters) > 0 else None).to_pandas()
+
+    df.insert(1, 'TDT_time', df['TDT_Sample'] / fs)
+
+    if bodypart is not None:
+        df.columns = [c.replace(f"{bodypart}_", '') for c in df.columns]
+
+    return df
+
+
+def get_window_indices(times, lower, upper, include_upper=False, before=0, after=0):
+    """
+    Find frames within time windows (e.g. around each trial)
+
+    Parameters:
+    ----------
+    times : numpy array
+        Time (or sample) of each frame, in ascending order
+    lower, upper : numpy array
+        Start and end of each window (same units as times)
+    include_upper : bool, optional
+        Whether frames at the end of the window are included
+    before, after : int, optional
+        Number of extra frames to include before / after each window
+
+    Notes:
+    ------
+    Windows for all trials are found with a binary search of frame times, and
+    are clipped to the frames available. Windows may overlap, in which case
+    frames are repeated.
+
+    >>> idx, offsets = get_window_indices(np.array([0, 1, 2, 3, 4]), [1, 3], [3, 10])
+    >>> idx, offsets
+    (array([1, 2, 3, 4]), array([0, 2, 4]))
+
+    Returns:
+    --------
+    idx : numpy array
+        Positions of frames in each window, concatenated across windows
+    offsets : numpy array
+        Start of each window in idx, such that window k is idx[offsets[k]:offsets[k+1]]
+    """
+
+    times = np.asarray(times)
+
+    if np.any(np.diff(times) < 0):
+        raise ValueError("Frame times must be in ascending order")
+
+    starts = np.searchsorted(times, lower, side='left') - before
+    stops = np.searchsorted(times, upper, side='right' if include_upper else 'left') + after
+
+    starts = np.clip(starts, 0, times.size)
+    stops = np.clip(stops, starts, times.size)
+
+    lengths = stops - starts
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+    idx = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - starts, lengths)
+
+    return idx, offsets
+
+
+def extract_windows(df, time_col, lower, upper, labels=None, label_col='trial', **kwargs):
+    """
+    Select rows of tracking data within time windows
+
+    Parameters:
+    ----------
+    df : pandas dataframe
+        Tracking data, sorted by time
+    time_col : str
+        Column containing time of each frame (e.g. 'TDT_time' or 'TDT_Sample')
+    lower, upper : array-like
+        Start and end of each window
+    labels : array-like, optional
+        Label for each window (e.g. trial number), added to output as label_col
+    label_col : str, optional
+        Name of column for labels
+    **kwargs : optional
+        Options for get_window_indices (include_upper, before, after)
+
+    Returns:
+    --------
+    windows : pandas dataframe
+        Rows within each window (in long format)
+    offsets : numpy array
+        Start of each window in rows of output
+    """
+
+    idx, offsets = get_window_indices(df[time_col].to_numpy(), np.asarray(lower), np.asarray(upper), **kwargs)
+
+    windows = df.iloc[idx].copy()
+
+    if labels is not None:
+        windows[label_col] = np.repeat(np.asarray(labels), np.diff(offsets))
+
+    return windows, offsets
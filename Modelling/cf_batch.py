@@ -0,0 +1,423 @@
+'''
+Batch model fitting across a process pool
+
+Every fit in cross-validation (each ferret, model, fold and random start) is
+independent, so here fits are run as separate tasks on a process pool, rather
+than sequentially as in Batch_test_CF8.m / Batch_test_Alt.m / cf_model.test_model.
+By default, all models in cf_model.models (CF8 and Alt models) are fitted.
+
+Each task has its own random seed, derived from the batch seed and the
+(ferret, model, fold, run) of the task, so results don't depend on the order
+in which tasks complete or the number of processes. Finished tasks are saved
+as checkpoints in the log directory, so that an interrupted batch can be resumed
+without refitting completed work. Settings and a hash of the trials used are saved
+in config.txt, and resuming fails if they have changed since the batch started.
+
+Results for each ferret and model are saved in the same format as cf_model.test_model
+(config.txt, param_contrast.csv and fold_performance.csv), in a subdirectory of the
+batch directory (e.g. logs/2026-10-18_12-00-00_Batch/F1701_Pendleton_TestModel_CF8_FullAllo_Theta)
+
+Usage:
+    python Modelling/cf_batch.py                    # Start new batch
+    python Modelling/cf_batch.py --resume <dir>     # Resume interrupted batch
+
+Created:
+    2026-10-18
+'''
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import hashlib
+import json
+import os, sys
+import zlib
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '..')))
+from Analysis import ferrets
+from Analysis import cf_store as cfs
+from Modelling import cf_model as cm
+
+
+# Codes identifying the purpose of random numbers drawn for each job
+SEED_FOLDS, SEED_FLATTEN, SEED_FIT, SEED_TEST = 0, 1, 2, 3
+
+# Settings in config.txt that must match for a batch to be resumed
+RESUME_KEYS = ['data_hash', 'fitfunc', 'include_probe_data', 'nFolds', 'nRuns', 'seed', 'stim_col', 'train_probe', 'train_trials']
+
+
+def get_task_rng(seed, job, purpose, fold=0, run=0):
+    """
+    Create a random number generator for one task in a batch
+
+    Parameters:
+    ----------
+    seed : int
+        Seed for the whole batch
+    job : str
+        Name of job (ferret and model, e.g. 'F1701_Pendleton_TestModel_CF8_FullAllo_Theta')
+    purpose : int
+        Code for what random numbers are used for (e.g. SEED_FIT)
+    fold : int, optional
+        Cross-validation fold
+    run : int, optional
+        Fitting run
+
+    Returns:
+    --------
+    rng : numpy random generator
+        Generator that is independent of generators for all other tasks
+    """
+
+    job_key = zlib.crc32(job.encode())
+    seed_seq = np.random.SeedSequence(seed, spawn_key=(job_key, purpose, fold, run))
+
+    return np.random.default_rng(seed_seq)
+
+
+def fit_task(model, counts, seed, job, fold, run):
+    """
+    Fit a model from one random start (runs on worker process)
+
+    Training data are passed as counts for each stimulus (see cf_model.get_cell_counts),
+    which are computed once per fold rather than for every run
+
+    Returns:
+    --------
+    row : dict
+        Initial and fitted parameters, negative log-likelihood, run and fold
+    """
+
+    fitfunc = cm.models[model]['fitfunc']
+    rng = get_task_rng(seed, job, SEED_FIT, fold, run)
+
+    Xfit, X0, NegLL = fitfunc(None, None, rng=rng, counts=counts)
+
+    row = cm.format_run_parameters(Xfit, X0, NegLL, run)
+    row['Fold'] = fold
+
+    return row
+
+
+def get_checkpoint_path(log_path, fold, run):
+    return log_path / 'checkpoints' / f"fold{fold:03d}_run{run:03d}.json"
+
+
+def save_checkpoint(log_path, row):
+    """ Save results of one task, writing to a temporary file first so that checkpoints are never incomplete """
+
+    save_path = get_checkpoint_path(log_path, row['Fold'], row['Run'])
+    save_path.parent.mkdir(exist_ok=True)
+
+    tmp_path = save_path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(row, f)
+
+    os.replace(tmp_path, save_path)
+
+
+def load_checkpoint(log_path, fold, run):
+    """ Load results of one task (or None if the task has not been completed) """
+
+    file_path = get_checkpoint_path(log_path, fold, run)
+
+    if not file_path.exists():
+        return None
+
+    with open(file_path) as f:
+        return json.load(f)
+
+
+def get_data_hash(data):
+    """ Hash of the trials used for fitting, to check that data haven't changed when resuming a batch """
+
+    row_hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()
+
+
+def check_resume(log_path, config):
+    """
+    Check that settings and data for a job match those of the interrupted batch
+
+    Parameters:
+    ----------
+    log_path : pathlib Path
+        Directory containing results for one ferret and model
+    config : dict
+        Configuration of the job being resumed
+
+    Notes:
+    ------
+    Raises ValueError if any setting in RESUME_KEYS differs from config.txt
+    in the log directory (e.g. a different seed, or trials added since the 
+    batch started), as checkpoints are matched to tasks using only the fold
+    and run.
+    """
+
+    previous = cm.read_config(log_path)
+    current = cm.format_config(config)
+
+    mismatched = [x for x in RESUME_KEYS if previous.get(x) != current.get(x)]
+
+    if len(mismatched) > 0:
+        details = ', '.join(f"{x} = {previous.get(x)} (now {current.get(x)})" for x in mismatched)
+        raise ValueError(f"Cannot resume {log_path}, as settings or data differ from the original batch: {details}")
+
+
+def prepare_job(ferret_name, model, batch_path, settings):
+    """
+    Load data, split into cross-validation folds and create log directory for
+    one ferret and model
+
+    Parameters:
+    ----------
+    ferret_name : str
+        Full name of subject (e.g. "F1701_Pendleton")
+    model : str
+        Name of model (key in cf_model.models)
+    batch_path : pathlib Path
+        Directory containing results for batch
+    settings : dict
+        Batch settings (nFolds, nRuns, train_trials, include_probe_data, seed, store_path)
+
+    Returns:
+    --------
+    job : dict
+        Job information, including log path, held out data for testing, and
+        training data (as counts for each stimulus) for each fold
+    """
+
+    mdl = cm.models[model]
+    name = f"{ferret_name}_TestModel_{model}"
+    seed = settings['seed']
+
+    data = cm.load_data(settings['store_path'], ferret_name, mdl['stim_col'], settings['include_probe_data'])
+    cvIndices = cm.get_fold_indices(data.shape[0], settings['nFolds'], rng=get_task_rng(seed, name, SEED_FOLDS))
+
+    test_folds, train_counts = dict(), dict()
+
+    for fold in range(1, settings['nFolds']+1):
+
+        test_folds[fold] = data[cvIndices == fold]
+        response, stim = cm.get_training_data(
+            data[cvIndices != fold],
+            mdl,
+            settings['train_trials'],
+            rng = get_task_rng(seed, name, SEED_FLATTEN, fold)
+            )
+
+        train_counts[fold] = cm.get_cell_counts(response, stim)
+
+    # Create log directory (or check that settings match if resuming)
+    log_path = batch_path / name
+
+    config = dict(
+        InputData = f"{ferret_name}.csv",
+        file_name = f"{ferret_name}.csv",
+        file_path = str(settings['store_path']),
+        data_hash = get_data_hash(data),
+        fitfunc = mdl['fitfunc'].__name__,
+        include_probe_data = settings['include_probe_data'],
+        nFolds = settings['nFolds'],
+        nParams = mdl['nParams'],
+        nRuns = settings['nRuns'],
+        seed = str(seed),
+        simfunc = mdl['simfunc'].__name__,
+        stim_col = mdl['stim_col'],
+        train_probe = mdl['train_probe'],
+        train_trials = settings['train_trials'],
+    )
+
+    if (log_path / 'config.txt').exists():
+        check_resume(log_path, config)
+    else:
+        log_path.mkdir(parents=True, exist_ok=True)
+        cm.write_config(log_path, config)
+
+    return dict(name=name, model=model, log_path=log_path, test_folds=test_folds, train_counts=train_counts)
+
+
+def finish_job(job, settings):
+    """
+    Combine checkpoints from all tasks for one ferret and model, and test
+    the best fitting model from each fold on held out data
+
+    Parameters:
+    ----------
+    job : dict
+        Job information (see prepare_job)
+    settings : dict
+        Batch settings
+
+    Returns:
+    --------
+    None
+    """
+
+    mdl = cm.models[job['model']]
+    fold_performance, parameters = [], []
+
+    for fold in range(1, settings['nFolds']+1):
+
+        param_i = [load_checkpoint(job['log_path'], fold, run) for run in range(1, settings['nRuns']+1)]
+        param_i = pd.DataFrame(param_i)
+        parameters.append(param_i)
+
+        Xfit = cm.get_best_parameters(param_i)
+        rng = get_task_rng(settings['seed'], job['name'], SEED_TEST, fold)
+
+        fold_performance.append( cm.test_model_performance(mdl['simfunc'], job['test_folds'][fold], Xfit, rng=rng, stim_cols=mdl['stim_cols']))
+
+    fold_performance = pd.DataFrame(fold_performance)
+    fold_performance['Fold'] = np.arange(1, settings['nFolds']+1)
+
+    fold_performance.to_csv( job['log_path'] / 'fold_performance.csv', index=False)
+    pd.concat(parameters).to_csv( job['log_path'] / 'param_contrast.csv', index=False)
+
+
+def run_batch(ferret_names, model_names, nFolds=20, nRuns=20, train_trials=10, include_probe_data=True, seed=0,
+              n_jobs=None, batch_path=None, log_dir=cm.log_root, store_path=cm.trial_store):
+    """
+    Fit models to data from multiple ferrets, running all folds and runs
+    in parallel
+
+    Parameters:
+    ----------
+    ferret_names : list
+        Full names of subjects (e.g. ["F1701_Pendleton"])
+    model_names : list
+        Names of models (keys in cf_model.models)
+    nFolds : int, optional
+        Number of cross-validation folds
+    nRuns : int, optional
+        Number of random starts for fitting within each fold
+    train_trials : int, optional
+        Number of trials sampled for each combination of sound angle in head and
+        world-centered space when training (see cf_model.flatten_sample_sizes)
+    include_probe_data : bool, optional
+        Whether to include probe trials
+    seed : int, optional
+        Seed for the batch, from which the seed for each task is derived
+    n_jobs : int, optional
+        Number of processes (defaults to number of CPUs)
+    batch_path : pathlib Path, optional
+        Directory of an existing batch to resume (a new batch is created if None)
+    log_dir : pathlib Path, optional
+        Directory in which to create new batches
+    store_path : pathlib Path, optional
+        Root directory of trial store
+
+    Notes:
+    ------
+    When resuming a batch, settings and data must match those of the original
+    batch (see check_resume), as checkpoints are matched to tasks using only 
+    the fold and run. Use get_batch_seed to recover the seed of a batch.
+
+    Returns:
+    --------
+    batch_path : pathlib Path
+        Directory containing results for each ferret and model
+    """
+
+    if batch_path is None:
+        dt = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        batch_path = Path(log_dir) / f"{dt}_Batch"
+
+    batch_path = Path(batch_path)
+
+    settings = dict(
+        nFolds = nFolds,
+        nRuns = nRuns,
+        train_trials = train_trials,
+        include_probe_data = include_probe_data,
+        seed = seed,
+        store_path = store_path
+    )
+
+    jobs = [prepare_job(f, m, batch_path, settings) for f in ferret_names for m in model_names]
+
+    # List tasks that haven't already been completed
+    tasks = []
+
+    for job in jobs:
+        for fold in range(1, nFolds+1):
+            for run in range(1, nRuns+1):
+
+                if get_checkpoint_path(job['log_path'], fold, run).exists():
+                    continue
+
+                tasks.append((
+                    job['model'],
+                    job['train_counts'][fold],
+                    seed, job['name'], fold, run,
+                    job['log_path']
+                ))
+
+    n_total = len(jobs) * nFolds * nRuns
+    print(f"Running {len(tasks)} of {n_total} tasks ({n_total - len(tasks)} already completed)")
+
+    # Fit models
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+
+        futures = {executor.submit(fit_task, *task[:-1]): task[-1] for task in tasks}
+
+        for count, future in enumerate(as_completed(futures), start=1):
+            save_checkpoint(futures[future], future.result())
+
+            if count % 100 == 0:
+                print(f"\t{count} / {len(tasks)} tasks completed")
+
+    # Combine results
+    for job in jobs:
+        finish_job(job, settings)
+
+    return batch_path
+
+
+def get_batch_seed(batch_path):
+    """ Seed used for an existing batch (from the config.txt of any job) """
+
+    config_files = sorted(Path(batch_path).glob('*_TestModel_*/config.txt'))
+
+    if len(config_files) == 0:
+        raise ValueError(f"No jobs found in {batch_path}")
+
+    return int(cm.read_config(config_files[0].parent)['seed'])
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Fit models to data from all ferrets in parallel')
+    parser.add_argument('--resume', type=Path, default=None, help='Directory of interrupted batch')
+    parser.add_argument('--n_jobs', type=int, default=None, help='Number of processes')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for random number generation (default: 0, or the seed of the batch being resumed)')
+    args = parser.parse_args()
+
+    if args.seed is None:
+        args.seed = 0 if args.resume is None else get_batch_seed(args.resume)
+
+    available = cfs.list_ferrets(cm.trial_store)
+    ferret_names = [f"F{x['num']}_{x['name']}" for x in ferrets]
+    ferret_names = [x for x in ferret_names if x in available]
+
+    batch_path = run_batch(
+        ferret_names,
+        list(cm.models),
+        seed = args.seed,
+        n_jobs = args.n_jobs,
+        batch_path = args.resume
+        )
+
+    print(f"Results saved to {batch_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+'''
+Model comparison using held-out data
+
+Every model (CF8 world and head-centred, and Alt01-03) is fitted to the data
+of every ferret with k-fold cross-validation, running each fold as a separate
+task on a process pool (as in cf_batch.py). Folds are the same for all models
+of each ferret, so that performance can be compared fold by fold.
+
+For each fold, the best of several random starts is used to calculate:
+    - the log-likelihood of held-out responses (test_LL)
+    - AIC and BIC, from the maximum log-likelihood of all trials in the
+      training folds (refitting each model to the same trials, whatever the
+      trials resampled to fit it for testing)
+    - the percentage of held-out responses matched by simulated responses
+      (as in fold_performance.csv)
+
+Models are then compared with the best model for each ferret (highest total
+held-out log-likelihood), using the mean difference in log-likelihood across
+paired folds, with bootstrap confidence intervals.
+
+Usage:
+    python Modelling/cf_compare.py
+    python Modelling/cf_compare.py --n_jobs 8 --seed 1
+
+Output (Modelling/logs/<datetime>_Compare):
+    folds.csv: results for each ferret, model and fold
+    comparison.csv: one row per ferret and model, with summary metrics and
+    paired differences from the best model
+
+Created:
+    2026-10-18
+'''
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import os, sys
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '..')))
+from Analysis import ferrets
+from Analysis import cf_store as cfs
+from Modelling import cf_batch as cbat
+from Modelling import cf_model as cm
+
+# Code for random numbers used to refit models to all trials in the training folds (see cf_batch.py)
+SEED_FIT_FOLDS = 4
+
+
+def prepare_ferret(ferret_name, model_names, settings):
+    """
+    Split data for one ferret into cross-validation folds, and collapse 
+    training and test data for each model into counts
+
+    Parameters:
+    ----------
+    ferret_name : str
+        Full name of subject (e.g. "F1701_Pendleton")
+    model_names : list
+        Names of models (keys in cf_model.models)
+    settings : dict
+        Comparison settings (nFolds, nRuns, train_trials, include_probe_data, seed, store_path)
+
+    Returns:
+    --------
+    tasks : list
+        Arguments for compare_task, for each model and fold
+    """
+
+    seed = settings['seed']
+    tasks = []
+
+    # Assign folds using the ferret only, so that folds are paired across models
+    cvIndices = None
+
+    for model in model_names:
+
+        mdl = cm.models[model]
+        job = f"{ferret_name}_TestModel_{model}"
+
+        data = cm.load_data(settings['store_path'], ferret_name, mdl['stim_col'], settings['include_probe_data'])
+
+        if cvIndices is None:
+            cvIndices = cm.get_fold_indices(data.shape[0], settings['nFolds'], rng=cbat.get_task_rng(seed, ferret_name, cbat.SEED_FOLDS))
+
+        for fold in range(1, settings['nFolds']+1):
+
+            test_fold = data[cvIndices == fold]
+            train_fold = data[cvIndices != fold]
+            response, stim = cm.get_training_data(
+                train_fold,
+                mdl,
+                settings['train_trials'],
+                rng = cbat.get_task_rng(seed, job, cbat.SEED_FLATTEN, fold)
+                )
+
+            tasks.append(dict(
+                ferret = ferret_name,
+                model = model,
+                fold = fold,
+                train_counts = cm.get_cell_counts(response, stim),
+                fold_counts = cm.get_cell_counts(train_fold['Response'].to_numpy(), train_fold[mdl['stim_cols']].to_numpy()),
+                test_response = test_fold['Response'].to_numpy(),
+                test_stim = test_fold[mdl['stim_cols']].to_numpy(),
+                nRuns = settings['nRuns'],
+                seed = seed,
+            ))
+
+    return tasks
+
+
+def compare_task(ferret, model, fold, train_counts, fold_counts, test_response, test_stim, nRuns, seed):
+    """
+    Fit a model to training data for one fold (best of several random starts),
+    and evaluate it on held out data (runs on worker process)
+
+    Notes:
+    ------
+    Models are fitted to trials resampled from the training folds (train_counts),
+    which differ in number between models (e.g. Alt models aren't trained on
+    probe trials). To compare models with AIC and BIC, each model is therefore
+    also refitted to all trials in the training folds (fold_counts; best of
+    the same number of random starts), and the criteria are calculated from
+    the maximum likelihood of those trials (fold_LL).
+
+    Returns:
+    --------
+    row : dict
+        Fitted parameters, likelihood on training and test data, information
+        criteria and percentage of test responses matched
+    """
+
+    mdl = cm.models[model]
+    job = f"{ferret}_TestModel_{model}"
+
+    fits = [
+        mdl['fitfunc'](None, None, rng=cbat.get_task_rng(seed, job, cbat.SEED_FIT, fold, run), counts=train_counts)
+        for run in range(1, nRuns+1)
+        ]
+
+    Xfit, _, train_NegLL = min(fits, key=lambda x: x[2])
+
+    test_counts = cm.get_cell_counts(test_response, test_stim)
+    test_NegLL, _ = cm.lik_counts(list(Xfit.values()), test_counts, mdl['value_func'])
+
+    refits = [
+        mdl['fitfunc'](None, None, rng=cbat.get_task_rng(seed, job, SEED_FIT_FOLDS, fold, run), counts=fold_counts)
+        for run in range(1, nRuns+1)
+        ]
+
+    _, _, fold_NegLL = min(refits, key=lambda x: x[2])
+
+    n_train = int(train_counts['n_trials'].sum())
+    n_fold = int(fold_counts['n_trials'].sum())
+    k = mdl['nParams']
+
+    predicted = mdl['simfunc'](Xfit, test_stim, rng=cbat.get_task_rng(seed, job, cbat.SEED_TEST, fold))
+
+    row = dict(ferret=ferret, model=model, fold=fold, nParams=k, n_train=n_train, n_fold=n_fold, n_test=test_response.size)
+    row.update(Xfit)
+    row.update(
+        train_LL = -train_NegLL,
+        test_LL = -test_NegLL,
+        fold_LL = -fold_NegLL,
+        AIC = 2 * k + 2 * fold_NegLL,
+        BIC = k * np.log(n_fold) + 2 * fold_NegLL,
+        pCorrect = np.mean(predicted == test_response) * 100
+    )
+
+    return row
+
+
+def compare_to_best(folds, metric='test_LL', nBoot=10000, ci=95, rng=None):
+    """
+    Summarize performance of each model, and compare with the best model for
+    each ferret using paired differences across folds
+
+    Parameters:
+    ----------
+    folds : pandas dataframe
+        Results for each ferret, model and fold (see compare_task)
+    metric : str, optional
+        Fold-wise metric to compare (higher is better)
+    nBoot : int, optional
+        Number of bootstrap resamples of folds
+    ci : float, optional
+        Width (%) of bootstrap confidence interval
+    rng : numpy random generator or int, optional
+        Generator (or seed) for resampling
+
+    Notes:
+    ------
+    Folds are resampled with replacement, using the same folds for all 
+    models of a ferret. Differences are model - best model, so are zero for 
+    the best model and negative otherwise.
+
+    Returns:
+    --------
+    comparison : pandas dataframe
+        One row per ferret and model, with totals (test_LL, n_test) and means 
+        (AIC, BIC, pCorrect) across folds, the best model, and the mean 
+        difference in metric from the best model with confidence intervals
+    """
+
+    rng = np.random.default_rng(rng)
+    ci_tail = (100 - ci) / 2
+
+    comparison = folds.groupby(['ferret', 'model']).agg(
+        nFolds = ('fold', 'size'),
+        nParams = ('nParams', 'first'),
+        n_test = ('n_test', 'sum'),
+        test_LL = ('test_LL', 'sum'),
+        AIC = ('AIC', 'mean'),
+        BIC = ('BIC', 'mean'),
+        pCorrect = ('pCorrect', 'mean'),
+        metric_total = (metric, 'sum'),
+    ).reset_index()
+
+    comparison['test_LL_per_trial'] = comparison['test_LL'] / comparison['n_test']
+
+    best = comparison.loc[comparison.groupby('ferret')['metric_total'].idxmax(), ['ferret', 'model']]
+    comparison = comparison.merge(best.rename(columns={'model': 'best_model'}), on='ferret')
+
+    results = []
+
+    for ferret, f_data in folds.groupby('ferret'):
+
+        values = f_data.pivot(index='fold', columns='model', values=metric)   # folds x models
+        best_model = comparison.loc[comparison['ferret'] == ferret, 'best_model'].iloc[0]
+
+        diff = values.sub(values[best_model], axis=0)
+        resampled = rng.integers(0, diff.shape[0], size=(nBoot, diff.shape[0]))
+        boot_mean = diff.to_numpy()[resampled].mean(axis=1)                      # resamples x models
+
+        results.append(pd.DataFrame({
+            'ferret': ferret,
+            'model': diff.columns,
+            'delta': diff.mean().to_numpy(),
+            'delta_ci_lower': np.percentile(boot_mean, ci_tail, axis=0),
+            'delta_ci_upper': np.percentile(boot_mean, 100 - ci_tail, axis=0),
+        }))
+
+    comparison = comparison.merge(pd.concat(results), on=['ferret', 'model'])
+    comparison = comparison.rename(columns={'delta': f"delta_{metric}", 'delta_ci_lower': f"delta_{metric}_ci_lower", 'delta_ci_upper': f"delta_{metric}_ci_upper"})
+
+    return comparison.drop(columns='metric_total').sort_values(by=['ferret', 'test_LL'], ascending=[True, False], ignore_index=True)
+
+
+def run_comparison(ferret_names, model_names=None, nFolds=20, nRuns=20, train_trials=10, include_probe_data=True, seed=0,
+                   n_jobs=None, log_dir=cm.log_root, store_path=cm.trial_store):
+    """
+    Fit and compare models for multiple ferrets, running all folds in parallel
+
+    Parameters:
+    ----------
+    ferret_names : list
+        Full names of subjects (e.g. ["F1701_Pendleton"])
+    model_names : list, optional
+        Names of models (keys in cf_model.models; defaults to all models)
+    nFolds : int, optional
+        Number of cross-validation folds
+    nRuns : int, optional
+        Number of random starts for fitting within each fold
+    train_trials : int, optional
+        Number of trials sampled for each combination of sound angle in head and
+        world-centered space when training (see cf_model.flatten_sample_sizes)
+    include_probe_data : bool, optional
+        Whether to include probe trials
+    seed : int, optional
+        Seed from which the seed for each task is derived
+    n_jobs : int, optional
+        Number of processes (defaults to number of CPUs)
+    log_dir : pathlib Path, optional
+        Directory in which to save results
+    store_path : pathlib Path, optional
+        Root directory of trial store
+
+    Returns:
+    --------
+    save_path : pathlib Path
+        Directory containing results (folds.csv and comparison.csv)
+    """
+
+    if model_names is None:
+        model_names = list(cm.models)
+
+    settings = dict(
+        nFolds = nFolds,
+        nRuns = nRuns,
+        train_trials = train_trials,
+        include_probe_data = include_probe_data,
+        seed = seed,
+        store_path = store_path
+    )
+
+    tasks = [task for ferret_name in ferret_names for task in prepare_ferret(ferret_name, model_names, settings)]
+    print(f"Running {len(tasks)} tasks ({len(ferret_names)} ferrets x {len(model_names)} models x {nFolds} folds)")
+
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [executor.submit(compare_task, **task) for task in tasks]
+        folds = pd.DataFrame([future.result() for future in futures])
+
+    comparison = compare_to_best(folds, rng=seed)
+
+    # Save results
+    dt = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    save_path = Path(log_dir) / f"{dt}_Compare"
+    save_path.mkdir(parents=True)
+
+    cm.write_config(save_path, dict(settings, seed=str(seed), store_path=str(store_path), models=','.join(model_names)))
+    folds.to_csv( save_path / 'folds.csv', index=False)
+    comparison.to_csv( save_path / 'comparison.csv', index=False)
+
+    return save_path
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Fit and compare all models for all ferrets in parallel')
+    parser.add_argument('--n_jobs', type=int, default=None, help='Number of processes')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for random number generation')
+    args = parser.parse_args()
+
+    available = cfs.list_ferrets(cm.trial_store)
+    ferret_names = [f"F{x['num']}_{x['name']}" for x in ferrets]
+    ferret_names = [x for x in ferret_names if x in available]
+
+    save_path = run_comparison(ferret_names, seed=args.seed, n_jobs=args.n_jobs)
+
+    comparison = pd.read_csv(save_path / 'comparison.csv')
+    print(comparison[['ferret', 'model', 'test_LL', 'BIC', 'pCorrect', 'delta_test_LL', 'delta_test_LL_ci_lower', 'delta_test_LL_ci_upper']].to_string(index=False))
+    print(f"Results saved to {save_path}")
+
+
+if __name__ == '__main__':
+    main()
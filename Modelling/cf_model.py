@@ -0,0 +1,1105 @@
+'''
+Fitting models of animal behavior
+
+Python version of the model fitting in Modelling/matlab (TestModel_CF8_*.m),
+in which the probability of responding at each spout is a cosine function of
+sound angle in one coordinate frame (world or head), passed through a softmax
+to choose between two actions.
+
+Models are fit using k-fold cross-validation, with multiple random starts
+within each fold. Results are logged in the same format as the matlab code
+(config.txt, param_contrast.csv and fold_performance.csv) so that they can be
+read by the existing plotting scripts (e.g. plot_matlab_model.py)
+
+Notes:
+------
+As in the matlab version, responses are converted into action indices, where
+action 1 is a response at spout 9 (Response = 1) and action 2 is a response at
+spout 3 (Response = 0). Models are fit to the probability of making action 1.
+
+Likelihoods are calculated from the number of trials and responses for each
+stimulus (sound angle, and platform angle where required), rather than for each
+trial. As sound and platform angles take discrete values, training data are
+collapsed into a few hundred cells, whatever the number of trials.
+
+Created:
+    2026-10-18: Ported from TestModel_CF8_FullAllo_Theta.m, fit_CF8_theta.m,
+    lik_CF8_Theta.m, fit_data_multiple_runs.m and flatten_sample_sizes.m
+Updated:
+    2026-10-18: Binomial likelihood over stimulus cells, with gradients, for
+    CF8 and Alt01-03 models (lik_Alt*.m)
+    2026-10-18: Fitting and simulation of Alt01-03 models (TestModel_Alt*.m),
+    in which the animal responds after rotating by a fixed offset relative to
+    the head, searching a grid of parameter values in one array operation
+'''
+
+from datetime import datetime
+import os, sys
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from scipy import optimize
+from scipy.special import expit
+
+sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '..')))
+from Analysis import ferrets
+from Analysis import cf_analysis as cfa
+from Analysis import cf_angles as cang
+from Analysis import cf_store as cfs
+
+
+trial_store = Path('Analysis/Main/Data/Trials')
+log_root = Path('Modelling/logs')
+
+
+def load_data(store_path, ferret_names, stim_col, include_probe_data=True):
+    """
+    Load formatted behavioral data for model fitting
+
+    Parameters:
+    ----------
+    store_path : pathlib Path
+        Root directory of trial store (see Analysis/cf_store.py)
+    ferret_names : str or list
+        Full name(s) of subjects (e.g. "F1701_Pendleton"), where data from
+        multiple subjects is combined
+    stim_col : str
+        Name of column containing predictor values (e.g. 'speaker_angle_world')
+    include_probe_data : bool, optional
+        Whether to include trials with probe sounds
+
+    Returns:
+    --------
+    data : pandas dataframe
+        Trials with stimulus values (theta_d) and responses as action indices
+    """
+
+    if isinstance(ferret_names, str):
+        ferret_names = [ferret_names]
+
+    columns = ['Speaker Location', 'Response', 'CenterSpoutRotation', 'not_probe',
+               'speaker_angle_world', 'speaker_angle_platform', 'Correct']
+
+    data = cfs.load_trials(store_path, ferrets=ferret_names, columns=columns)
+
+    if data.shape[0] == 0:
+        raise ValueError(f"No trials found for {ferret_names} in {store_path}")
+
+    # Convert responses into action indices (response 9 == action 1, response 3 = action 2)
+    data['Response'] = np.where(data['Response'] == 1, 1, 2).astype('int8')
+
+    data['theta_d'] = data[stim_col]
+
+    if not include_probe_data:
+        data = data[data['not_probe'] == 1]
+
+    return data.reset_index(drop=True)
+
+
+def flatten_sample_sizes(df, k, rng=None):
+    """
+    Samples equal numbers of sound angles in each combination of head and
+    world-centered space.
+
+    Equal sample sizes are important before model fitting as otherwise
+    the model will fit better to some combinations than others.
+
+    Trials are indexed by combination once and all samples are drawn as a 
+    single array of indices (see cf_analysis.draw_stratified_samples).
+
+    Parameters:
+    ----------
+    df : pandas dataframe
+        Trials with columns for sound angle in head and world-centered space
+    k : int
+        Required sample size, drawn with replacement (or min available without
+        replacement if zero; or all data if None / nan)
+    rng : numpy random generator or int, optional
+        Generator (or seed) for sampling
+
+    Returns:
+    --------
+    df : pandas dataframe
+        Subset of input trials (rows may be repeated if sampling with replacement)
+    """
+
+    if k is None or np.isnan(k):
+        return df
+
+    codes = df.groupby(['speaker_angle_world', 'speaker_angle_platform'], sort=True).ngroup().to_numpy()
+    df, codes = df[codes >= 0], codes[codes >= 0]
+
+    strata = cfa.index_strata(codes)
+
+    if k == 0:
+        k = strata[2].min()
+        replace = False
+    else:
+        replace = True
+
+    idx = cfa.draw_stratified_samples(codes, int(k), replace=replace, rng=rng, strata=strata)
+
+    return df.iloc[idx.ravel()]
+
+
+def get_choice_probability(q, coldness):
+    """
+    Probability of choosing action 1, given the value (q) of action 1 and
+    the value of action 2 (1-q), using a softmax function
+
+    Parameters:
+    ----------
+    q : numpy array
+        Values of action 1
+    coldness : float
+        Inverse temperature of softmax (also known as beta)
+
+    Notes:
+    ------
+    For two actions, the softmax reduces to a logistic function of the
+    difference in value between actions (q - (1-q))
+
+    Returns:
+    --------
+    p : numpy array
+        Probability of choosing action 1
+
+    >>> get_choice_probability(np.array([0.5]), coldness=10)
+    array([0.5])
+    """
+    return 1 / (1 + np.exp(-coldness * (2 * q - 1)))
+
+
+def cf8_activation(theta, vert_offset, horiz_offset, amplitude):
+    """
+    Value of action 1 (response at spout 9) as a cosine function of
+    sound angle in the coordinate frame of the model
+
+    Parameters:
+    ----------
+    theta : numpy array
+        Sound angles (degrees)
+    vert_offset : float
+        Vertical shift of the tuning curve (bias)
+    horiz_offset : float
+        Horizontal shift of the tuning curve (preferred angle; degrees)
+    amplitude : float
+        Spatial modulation of the tuning curve
+
+    Returns:
+    --------
+    q : numpy array
+        Value of action 1 for each sound angle
+    """
+    return vert_offset + np.cos(np.radians(theta - horiz_offset)) * amplitude
+
+
+def lik_CF8_theta(x, response, stim):
+    """
+    Negative log-likelihood of responses given model parameters
+
+    Parameters:
+    ----------
+    x : array-like
+        Model parameters (vert_offset, horiz_offset, amplitude, coldness)
+    response : numpy array
+        Action (1 or 2) on each trial
+    stim : numpy array
+        Sound angle on each trial, in the coordinate frame of the model
+
+    Returns:
+    --------
+    NegLL : float
+        Negative log-likelihood (model error, to be minimized)
+    """
+
+    vert_offset, horiz_offset, amplitude, coldness = x
+
+    q = cf8_activation(stim, vert_offset, horiz_offset, amplitude)
+    z = coldness * (2 * q - 1)                             # log-odds of action 1
+
+    z = np.where(response == 1, z, -z)                     # log-odds of chosen action
+
+    return np.sum(np.logaddexp(0, -z))
+
+
+def get_cell_counts(response, stim):
+    """
+    Collapse trials into the number of trials and responses for each unique stimulus
+
+    Parameters:
+    ----------
+    response : numpy array
+        Action (1 or 2) on each trial
+    stim : numpy array
+        Stimulus values on each trial (nTrials), or multiple values per trial
+        (nTrials x nFeatures, e.g. sound angle and platform angle)
+
+    Returns:
+    --------
+    counts : dict
+        Unique stimuli (stim), and number of trials (n_trials) and number of 
+        trials with action 1 (n_action1) for each
+
+    >>> counts = get_cell_counts(np.array([1, 2, 1, 1]), np.array([0, 0, 90, 0]))
+    >>> counts['stim'], counts['n_trials'], counts['n_action1']
+    (array([ 0, 90]), array([3, 1]), array([2, 1]))
+    """
+
+    stim = np.asarray(stim)
+    cells, cell_idx = np.unique(stim, axis=0, return_inverse=True)
+    cell_idx = cell_idx.ravel()
+
+    return dict(
+        stim = cells,
+        n_trials = np.bincount(cell_idx, minlength=cells.shape[0]),
+        n_action1 = np.bincount(cell_idx[np.asarray(response) == 1], minlength=cells.shape[0])
+    )
+
+
+def binomial_nll(z, counts, dz=None):
+    """
+    Negative log-likelihood of response counts, given the log-odds of action 1 for each stimulus
+
+    Parameters:
+    ----------
+    z : numpy array
+        Log-odds of action 1 for each stimulus (nCells), or for many models
+        at once (... x nCells)
+    counts : dict
+        Number of trials and trials with action 1 for each stimulus (see get_cell_counts)
+    dz : numpy array, optional
+        Derivatives of z with respect to model parameters (nParams x nCells)
+
+    Notes:
+    ------
+    The binomial coefficient is omitted, so that values are the same as the
+    sum of negative log-likelihoods over trials (as in lik_CF8_Theta.m)
+
+    Returns:
+    --------
+    NegLL : float or numpy array
+        Negative log-likelihood (for each model, if z has more than one dimension)
+    grad : numpy array
+        Gradient of negative log-likelihood with respect to model parameters 
+        (only returned if dz is given)
+    """
+
+    n_action1 = counts['n_action1']
+    n_action2 = counts['n_trials'] - n_action1
+
+    NegLL = np.sum(n_action1 * np.logaddexp(0, -z) + n_action2 * np.logaddexp(0, z), axis=-1)
+
+    if dz is None:
+        return NegLL
+
+    residual = counts['n_trials'] * expit(z) - n_action1         # d(NegLL) / dz
+
+    return NegLL, dz @ residual
+
+
+def cf8_value(params, stim):
+    """
+    Value of action 1 (see cf8_activation) and its derivatives with respect 
+    to vert_offset, horiz_offset and amplitude
+
+    Returns:
+    --------
+    q : numpy array
+        Value of action 1 for each stimulus
+    dq : numpy array
+        Derivatives of q (3 x nStim)
+    """
+
+    vert_offset, horiz_offset, amplitude = params
+    phase = np.radians(stim - horiz_offset)
+
+    q = vert_offset + np.cos(phase) * amplitude
+
+    dq = np.vstack((
+        np.ones_like(phase),
+        np.sin(phase) * amplitude * np.pi / 180,
+        np.cos(phase)
+    ))
+
+    return q, dq
+
+
+def get_response_port(stim, response_offset):
+    """
+    Clock index (0 to 12) of the response location for Alt models, after 
+    rotating sound angle relative to the head by response offset 
+
+    Parameters:
+    ----------
+    stim : numpy array
+        Sound angle relative to the platform (column 0) and platform angle 
+        (column 1) for each stimulus
+    response_offset : float or numpy array
+        Rotation made to respond (degrees); a column of offsets (nOffsets x 1)
+        gives response ports for every offset and stimulus (nOffsets x nStim)
+    """
+
+    return cang.world_to_clock(stim[:, 0] - response_offset + stim[:, 1])
+
+
+def alt01_value(params, stim):
+    """
+    Value of action 1 for the Alt01 (Guess) model: responses are guided if the
+    response location is a spout (9 = action 1, 3 = action 2), and guesses otherwise
+
+    Returns:
+    --------
+    q : numpy array
+        Value of action 1 for each stimulus
+    dq : numpy array
+        Derivatives of q with respect to response offset (zero, as q is a step function)
+    """
+
+    r_port = get_response_port(stim, params[0])
+    q = np.select([r_port == 9, r_port == 3], [1.0, 0.0], default=0.5)
+
+    return q, np.zeros((1,) + q.shape)
+
+
+def alt03_value(params, stim):
+    """
+    Value of action 1 for the Alt03 (Nearest) model, as the distance of the 
+    response location from spout 9, relative to the summed distance from 
+    spouts 9 and 3
+
+    Notes:
+    ------
+    As in lik_Alt03_Nearest.m, value increases with distance from spout 9 
+    (the response offset accounts for the direction of the effect)
+
+    Returns:
+    --------
+    q : numpy array
+        Value of action 1 for each stimulus
+    dq : numpy array
+        Derivatives of q with respect to response offset (1 x nStim)
+    """
+
+    r_port = get_response_port(stim, params[0])
+
+    dist9, dist3 = np.abs(9 - r_port), np.abs(3 - r_port)
+    q = dist9 / (dist9 + dist3)
+
+    dq_dr = (np.sign(r_port - 9) * dist3 - np.sign(r_port - 3) * dist9) / (dist9 + dist3) ** 2
+
+    return q, (dq_dr / 30)[np.newaxis]           # response port changes by 1/30 for every degree of offset
+
+
+def alt02_value(params, stim):
+    """
+    Value of action 1 for the Alt02 (Round) model, in which the value for
+    the Alt03 (Nearest) model is rounded to 0 or 1 (unless equidistant from 
+    both spouts)
+
+    Returns:
+    --------
+    q : numpy array
+        Value of action 1 for each stimulus
+    dq : numpy array
+        Derivatives of q with respect to response offset (zero, as q is a step function)
+    """
+
+    q, _ = alt03_value(params, stim)
+    q = np.select([q < 0.5, q > 0.5], [0.0, 1.0], default=q)
+
+    return q, np.zeros((1,) + q.shape)
+
+
+def lik_counts(x, counts, value_func):
+    """
+    Negative log-likelihood of response counts given model parameters, and 
+    its gradient
+
+    Parameters:
+    ----------
+    x : array-like
+        Model parameters, with coldness as the last parameter (e.g. 
+        vert_offset, horiz_offset, amplitude, coldness for CF8 models)
+    counts : dict
+        Number of trials and trials with action 1 for each stimulus (see get_cell_counts)
+    value_func : function
+        Returns value of action 1 for each stimulus, and its derivatives with 
+        respect to the remaining parameters (e.g. cf8_value)
+
+    Notes:
+    ------
+    Values are passed through the softmax used in lik_CF8_theta, for which 
+    the log-odds of action 1 are coldness * (2q - 1)
+
+    Returns:
+    --------
+    NegLL : float
+        Negative log-likelihood (model error, to be minimized)
+    grad : numpy array
+        Gradient of NegLL with respect to x
+    """
+
+    *params, coldness = x
+
+    q, dq = value_func(params, counts['stim'])
+
+    z = coldness * (2 * q - 1)
+    dz = np.vstack((2 * coldness * dq, 2 * q - 1))
+
+    return binomial_nll(z, counts, dz)
+
+
+# Parameter names, bounds and starting distributions (see fit_CF8_theta.m)
+CF8_PARAMS = pd.DataFrame(
+    [
+        ['vert_offset',  0.5,    1.0],
+        ['horiz_offset', -180.0, 180.0],
+        ['amplitude',    0.0,    0.5],
+        ['coldness',     0.0001, 20.0],
+    ],
+    columns = ['name', 'lower', 'upper']
+)
+
+
+def fit_CF8_theta(response, stim, rng=None, counts=None):
+    """
+    Fit model parameters to behavioral data from one random starting point
+
+    Parameters:
+    ----------
+    response : numpy array
+        Action (1 or 2) on each trial
+    stim : numpy array
+        Sound angle on each trial, in the coordinate frame of the model
+    rng : numpy random generator or int, optional
+        Generator (or seed) for initial parameter values
+    counts : dict, optional
+        Trials already collapsed into counts for each stimulus (see get_cell_counts),
+        in which case response and stim are not used
+
+    Returns:
+    --------
+    Xfit : dict
+        Fitted parameter values
+    X0 : dict
+        Initial parameter values
+    NegLL : float
+        Negative log-likelihood of fitted model
+    """
+
+    rng = np.random.default_rng(rng)
+
+    lower = CF8_PARAMS['lower'].to_numpy()
+    upper = CF8_PARAMS['upper'].to_numpy()
+
+    x0 = np.array([
+        rng.random() / 2 + 0.5,             # vert_offset
+        rng.random() * 360 - 180,           # horiz_offset
+        rng.random() / 2,                   # amplitude
+        rng.exponential(1)                  # coldness
+    ])
+    x0 = np.clip(x0, lower, upper)
+
+    if counts is None:
+        counts = get_cell_counts(response, stim)
+
+    res = optimize.minimize(lik_counts, x0, args=(counts, cf8_value), jac=True, method='L-BFGS-B', bounds=list(zip(lower, upper)))
+
+    names = CF8_PARAMS['name']
+
+    return dict(zip(names, res.x)), dict(zip(names, x0)), res.fun
+
+
+def simulate_CF8_theta(X, stim, rng=None):
+    """
+    Get model responses to stimuli
+
+    Parameters:
+    ----------
+    X : dict
+        Model parameters
+    stim : numpy array
+        Sound angle on each trial, in the coordinate frame of the model
+    rng : numpy random generator or int, optional
+        Generator (or seed) for drawing responses
+
+    Returns:
+    --------
+    response : numpy array
+        Action (1 or 2) on each trial
+    """
+
+    rng = np.random.default_rng(rng)
+
+    q = cf8_activation(stim, X['vert_offset'], X['horiz_offset'], X['amplitude'])
+    p = get_choice_probability(q, X['coldness'])
+
+    return np.where(rng.random(p.shape) < p, 1, 2)
+
+
+# Parameter names and bounds for Alt models (see fit_Alt01_Guess.m), and
+# values searched before local optimization
+ALT_PARAMS = pd.DataFrame(
+    [
+        ['response_offset', -180.0, 180.0],
+        ['coldness',        0.0001, 20.0],
+    ],
+    columns = ['name', 'lower', 'upper']
+)
+
+ALT_GRID = dict(
+    response_offset = np.arange(-180.0, 180.0),
+    coldness = np.geomspace(0.0001, 20.0, 40)
+)
+
+
+def lik_alt_grid(offsets, coldness, counts, value_func):
+    """
+    Negative log-likelihood of response counts for every combination of 
+    response offset and coldness, as one array operation
+
+    Parameters:
+    ----------
+    offsets : numpy array
+        Response offsets (degrees)
+    coldness : numpy array
+        Inverse temperatures of softmax
+    counts : dict
+        Number of trials and trials with action 1 for each stimulus (see get_cell_counts)
+    value_func : function
+        Value function of the model (e.g. alt01_value)
+
+    Returns:
+    --------
+    NegLL : numpy array
+        Negative log-likelihood (nOffsets x nColdness)
+    """
+
+    q, _ = value_func([np.asarray(offsets)[:, np.newaxis]], counts['stim'])        # offsets x stimuli
+
+    z = np.asarray(coldness)[np.newaxis, :, np.newaxis] * (2 * q[:, np.newaxis, :] - 1)
+
+    return binomial_nll(z, counts)
+
+
+def fit_alt(response, stim, value_func, rng=None, counts=None):
+    """
+    Fit parameters of an Alt model to behavioral data from one random starting point
+
+    Parameters:
+    ----------
+    response : numpy array
+        Action (1 or 2) on each trial
+    stim : numpy array
+        Sound angle relative to the platform and platform angle on each trial (nTrials x 2)
+    value_func : function
+        Value function of the model (e.g. alt01_value)
+    rng : numpy random generator or int, optional
+        Generator (or seed) for initial parameter values
+    counts : dict, optional
+        Trials already collapsed into counts for each stimulus (see get_cell_counts),
+        in which case response and stim are not used
+
+    Notes:
+    ------
+    For Alt01 and Alt02 models, the likelihood is a step function of the 
+    response offset, which can't be optimized from a random start (as in 
+    fit_Alt01_Guess.m). The likelihood is therefore evaluated for a grid of 
+    offsets and coldness values (ALT_GRID, plus the starting point), and 
+    the best values are refined by local optimization.
+
+    Returns:
+    --------
+    Xfit : dict
+        Fitted parameter values
+    X0 : dict
+        Initial parameter values
+    NegLL : float
+        Negative log-likelihood of fitted model
+    """
+
+    rng = np.random.default_rng(rng)
+
+    lower = ALT_PARAMS['lower'].to_numpy()
+    upper = ALT_PARAMS['upper'].to_numpy()
+
+    x0 = np.array([
+        rng.random() * 360 - 180,           # response_offset
+        rng.exponential(1)                  # coldness
+    ])
+    x0 = np.clip(x0, lower, upper)
+
+    if counts is None:
+        counts = get_cell_counts(response, stim)
+
+    # Search grid
+    offsets = np.append(ALT_GRID['response_offset'], x0[0])
+    coldness = np.append(ALT_GRID['coldness'], x0[1])
+
+    grid_NegLL = lik_alt_grid(offsets, coldness, counts, value_func)
+    (i, j) = np.unravel_index(np.argmin(grid_NegLL), grid_NegLL.shape)
+
+    # Refine
+    res = optimize.minimize(lik_counts, [offsets[i], coldness[j]], args=(counts, value_func), jac=True, method='L-BFGS-B', bounds=list(zip(lower, upper)))
+
+    if res.fun <= grid_NegLL[i, j]:
+        Xfit, NegLL = res.x, res.fun
+    else:
+        Xfit, NegLL = np.array([offsets[i], coldness[j]]), grid_NegLL[i, j]
+
+    names = ALT_PARAMS['name']
+
+    return dict(zip(names, Xfit)), dict(zip(names, x0)), NegLL
+
+
+def simulate_alt(X, stim, value_func, rng=None):
+    """
+    Get responses of an Alt model to stimuli
+
+    Parameters:
+    ----------
+    X : dict
+        Model parameters (response_offset, coldness)
+    stim : numpy array
+        Sound angle relative to the platform and platform angle on each trial (nTrials x 2)
+    value_func : function
+        Value function of the model (e.g. alt01_value)
+    rng : numpy random generator or int, optional
+        Generator (or seed) for drawing responses
+
+    Returns:
+    --------
+    response : numpy array
+        Action (1 or 2) on each trial
+    """
+
+    rng = np.random.default_rng(rng)
+
+    q, _ = value_func([X['response_offset']], stim)
+    p = get_choice_probability(q, X['coldness'])
+
+    return np.where(rng.random(p.shape) < p, 1, 2)
+
+
+def fit_Alt01_guess(response, stim, rng=None, counts=None):
+    """ Fit Alt01 (Guess) model (see fit_alt and alt01_value) """
+    return fit_alt(response, stim, alt01_value, rng=rng, counts=counts)
+
+
+def fit_Alt02_round(response, stim, rng=None, counts=None):
+    """ Fit Alt02 (Round) model (see fit_alt and alt02_value) """
+    return fit_alt(response, stim, alt02_value, rng=rng, counts=counts)
+
+
+def fit_Alt03_nearest(response, stim, rng=None, counts=None):
+    """ Fit Alt03 (Nearest) model (see fit_alt and alt03_value) """
+    return fit_alt(response, stim, alt03_value, rng=rng, counts=counts)
+
+
+def simulate_Alt01_guess(X, stim, rng=None):
+    """ Get responses of Alt01 (Guess) model (see simulate_alt) """
+    return simulate_alt(X, stim, alt01_value, rng=rng)
+
+
+def simulate_Alt02_round(X, stim, rng=None):
+    """ Get responses of Alt02 (Round) model (see simulate_alt) """
+    return simulate_alt(X, stim, alt02_value, rng=rng)
+
+
+def simulate_Alt03_nearest(X, stim, rng=None):
+    """ Get responses of Alt03 (Nearest) model (see simulate_alt) """
+    return simulate_alt(X, stim, alt03_value, rng=rng)
+
+
+def fit_data_multiple_runs(fitfunc, nRuns, response, stim, rng=None):
+    """
+    Fit the data many times to see how reliable the resulting parameters are,
+    and if/how they depend on starting values
+
+    Parameters:
+    ----------
+    fitfunc : function
+        Fitting function (e.g. fit_CF8_theta)
+    nRuns : int
+        Number of times to rerun fitting on same data
+    response : numpy array
+        Action (1 or 2) on each trial
+    stim : numpy array
+        Stimulus values on each trial
+    rng : numpy random generator or int, optional
+        Generator (or seed) for initial parameter values
+
+    Returns:
+    --------
+    parameters : pandas dataframe
+        Initial (_X0) and fitted (_Xfit) parameters, and negative log-likelihood
+        for each run
+    """
+
+    rng = np.random.default_rng(rng)
+    parameters = []
+
+    counts = get_cell_counts(response, stim)       # Collapse trials once for all runs
+
+    for run in range(1, nRuns+1):
+
+        Xfit, X0, NegLL = fitfunc(response, stim, rng=rng, counts=counts)
+
+        parameters.append(
+            format_run_parameters(Xfit, X0, NegLL, run)
+        )
+
+    return pd.DataFrame(parameters)
+
+
+def format_run_parameters(Xfit, X0, NegLL, run):
+    """
+    Format the results of one fitting run as a row of param_contrast.csv
+
+    Returns:
+    --------
+    row : dict
+        Initial (_X0) and fitted (_Xfit) parameters, run number and negative
+        log-likelihood, in the column order used by the matlab code
+    """
+
+    row = {f"{k}_X0": v for (k, v) in X0.items()}
+    row['Run'] = run
+    row.update({f"{k}_Xfit": v for (k, v) in Xfit.items()})
+    row['NegLogLik'] = NegLL
+
+    return row
+
+
+def get_best_parameters(parameters):
+    """
+    Get fitted parameters with minimum negative log-likelihood
+
+    Parameters:
+    ----------
+    parameters : pandas dataframe
+        Results of multiple runs (see fit_data_multiple_runs)
+
+    Returns:
+    --------
+    Xfit : dict
+        Best fitting parameters (without _Xfit suffix)
+    """
+
+    best = parameters.loc[parameters['NegLogLik'].idxmin()]
+
+    return {k.replace('_Xfit', ''): v for (k, v) in best.items() if k.endswith('_Xfit')}
+
+
+def test_model_performance(simfunc, test_fold, X, rng=None, stim_cols='theta_d'):
+    """
+    Runs simulation with fitted parameters and then measure how many
+    responses match those of the animal
+
+    Parameters:
+    ----------
+    simfunc : function
+        Simulation function (e.g. simulate_CF8_theta)
+    test_fold : pandas dataframe
+        Held out data on which to test performance
+    X : dict
+        Model parameters
+    rng : numpy random generator or int, optional
+        Generator (or seed) for simulated responses
+    stim_cols : str or list, optional
+        Column(s) of test_fold containing stimulus values for the model
+
+    Returns:
+    --------
+    S : dict
+        Number of trials, number of trials matched and percentage matched
+    """
+
+    predicted_response = simfunc(X, test_fold[stim_cols].to_numpy(), rng=rng)
+    correct = predicted_response == test_fold['Response'].to_numpy()
+
+    return dict(
+        nCorrect = int(correct.sum()),
+        nTrials = correct.size,
+        pCorrect = correct.mean() * 100
+    )
+
+
+def get_fold_indices(n, nFolds, rng=None):
+    """
+    Randomly assign trials to cross-validation folds of (near) equal size
+
+    Parameters:
+    ----------
+    n : int
+        Number of trials
+    nFolds : int
+        Number of folds
+    rng : numpy random generator or int, optional
+        Generator (or seed) for assignment
+
+    Returns:
+    --------
+    cvIndices : numpy array
+        Fold (1 to nFolds) for each trial
+    """
+
+    rng = np.random.default_rng(rng)
+
+    return rng.permutation(np.arange(n) % nFolds) + 1
+
+
+def create_log(config, model_name, root=log_root):
+    """
+    Create a directory for model results and store configuration information
+    ahead of model fitting
+
+    Parameters:
+    ----------
+    config : dict
+        Information about model runtime values
+    model_name : str
+        Name of model (e.g. 'TestModel_CF8_FullAllo_Theta')
+    root : pathlib Path, optional
+        Directory in which to create log directory
+
+    Returns:
+    --------
+    log_path : pathlib Path
+        Directory for results, named with datetime and model
+        (e.g. 2021-08-25_12-48-00_TestModel_CF8_FullAllo_Theta)
+    """
+
+    dt = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    log_path = Path(root) / f"{dt}_{model_name}"
+
+    count = 1
+    while log_path.exists():                        # Avoid overwriting results started within the same second
+        count += 1
+        log_path = Path(root) / f"{dt}_{model_name}_{count}"
+
+    log_path.mkdir(parents=True)
+    write_config(log_path, config)
+
+    return log_path
+
+
+def format_config(config):
+    """
+    Format configuration values as written to config.txt (booleans as 0 or 1,
+    and numbers with six decimal places, as in the matlab code)
+
+    >>> format_config(dict(nFolds=20, include_probe_data=True, seed='0'))
+    {'nFolds': '20.000000', 'include_probe_data': '1', 'seed': '0'}
+    """
+
+    formatted = dict()
+
+    for (key, value) in config.items():
+
+        if isinstance(value, bool):
+            value = int(value)
+        elif isinstance(value, (int, float)):
+            value = f"{value:f}"
+
+        formatted[key] = str(value)
+
+    return formatted
+
+
+def write_config(log_path, config):
+    """
+    Write configuration information to config.txt, in the same format as
+    the matlab code (tab-separated keys and values)
+
+    Parameters:
+    ----------
+    log_path : pathlib Path
+        Directory for results
+    config : dict
+        Information about model runtime values
+
+    Returns:
+    --------
+    None
+    """
+
+    with open(log_path / 'config.txt', 'w') as f:
+        for (key, value) in format_config(config).items():
+            f.write(f"{key}\t{value}\n")
+
+
+def read_config(log_path):
+    """ Read config.txt as a dictionary of strings (as written by write_config) """
+
+    with open(log_path / 'config.txt') as f:
+        rows = [line.rstrip('\n').split('\t', 1) for line in f if '\t' in line]
+
+    return {key: value for (key, value) in rows}
+
+
+# Model definitions (name used for logging, predictor, columns passed to the model, whether probe
+# trials are used for training, and functions for fitting, simulation and calculating values)
+ALT_STIM = ['theta_d', 'CenterSpoutRotation']
+
+models = dict(
+    CF8_FullAllo_Theta = dict(stim_col='speaker_angle_world', stim_cols='theta_d', train_probe=True, fitfunc=fit_CF8_theta, simfunc=simulate_CF8_theta, value_func=cf8_value, nParams=4),
+    CF8_HeadCentred_Theta = dict(stim_col='speaker_angle_platform', stim_cols='theta_d', train_probe=True, fitfunc=fit_CF8_theta, simfunc=simulate_CF8_theta, value_func=cf8_value, nParams=4),
+    Alt01_Guess = dict(stim_col='speaker_angle_platform', stim_cols=ALT_STIM, train_probe=False, fitfunc=fit_Alt01_guess, simfunc=simulate_Alt01_guess, value_func=alt01_value, nParams=2),
+    Alt02_Round = dict(stim_col='speaker_angle_platform', stim_cols=ALT_STIM, train_probe=False, fitfunc=fit_Alt02_round, simfunc=simulate_Alt02_round, value_func=alt02_value, nParams=2),
+    Alt03_Nearest = dict(stim_col='speaker_angle_platform', stim_cols=ALT_STIM, train_probe=False, fitfunc=fit_Alt03_nearest, simfunc=simulate_Alt03_nearest, value_func=alt03_value, nParams=2),
+)
+
+
+def get_training_data(train_folds, mdl, train_trials, rng=None):
+    """
+    Select trials for training a model (removing probe trials if required by
+    the model, and balancing sample sizes), as responses and stimulus values
+
+    Parameters:
+    ----------
+    train_folds : pandas dataframe
+        Trials not held out for testing
+    mdl : dict
+        Model definition (see models)
+    train_trials : int
+        Number of trials sampled for each combination of sound angle in head 
+        and world-centered space (see flatten_sample_sizes)
+    rng : numpy random generator or int, optional
+        Generator (or seed) for sampling
+
+    Returns:
+    --------
+    response : numpy array
+        Action (1 or 2) on each trial
+    stim : numpy array
+        Stimulus values on each trial
+    """
+
+    if not mdl['train_probe']:
+        train_folds = train_folds[train_folds['not_probe'] == 1]
+
+    train_folds = flatten_sample_sizes(train_folds, train_trials, rng=rng)
+
+    return train_folds['Response'].to_numpy(), train_folds[mdl['stim_cols']].to_numpy()
+
+
+def test_model(ferret_names, model='CF8_FullAllo_Theta', nFolds=20, nRuns=20, train_trials=10, include_probe_data=True, seed=None, store_path=trial_store, log_dir=log_root):
+    """
+    Fit model to animal behavior using k-fold cross-validation
+
+    Parameters:
+    ----------
+    ferret_names : str or list
+        Full name(s) of subjects (e.g. "F1701_Pendleton")
+    model : str, optional
+        Name of model (key in models)
+    nFolds : int, optional
+        Number of cross-validation folds
+    nRuns : int, optional
+        Number of random starts for fitting within each fold
+    train_trials : int, optional
+        Number of trials sampled for each combination of sound angle in head and
+        world-centered space when training (see flatten_sample_sizes)
+    include_probe_data : bool, optional
+        Whether to include probe trials
+    seed : int, optional
+        Seed for random number generator (for reproducible results)
+    store_path : pathlib Path, optional
+        Root directory of trial store
+    log_dir : pathlib Path, optional
+        Directory in which to save results
+
+    Output:
+    --------
+    fold_performance.csv: performance predicting animal behavior on each fold
+    param_contrast.csv: negative log-likelihood values for each model fitted (nRuns * nFolds)
+    config.txt: information about fitting parameters
+
+    Returns:
+    --------
+    log_path : pathlib Path
+        Directory containing results
+    """
+
+    if isinstance(ferret_names, str):
+        ferret_names = [ferret_names]
+
+    mdl = models[model]
+    stim_col = mdl['stim_col']
+    rng = np.random.default_rng(seed)
+
+    data = load_data(store_path, ferret_names, stim_col, include_probe_data)
+
+    # Split data into training and testing subsets
+    cvIndices = get_fold_indices(data.shape[0], nFolds, rng=rng)
+
+    # Log config file and start recording results
+    input_data = ','.join([f"{x}.csv" for x in ferret_names])
+
+    config = dict(
+        InputData = input_data,
+        file_name = input_data,
+        file_path = str(store_path),
+        fitfunc = mdl['fitfunc'].__name__,
+        include_probe_data = include_probe_data,
+        nFolds = nFolds,
+        nParams = mdl['nParams'],
+        nRuns = nRuns,
+        seed = str(seed),
+        simfunc = mdl['simfunc'].__name__,
+        stim_col = stim_col,
+        train_probe = mdl['train_probe'],
+        train_trials = train_trials,
+    )
+
+    log_path = create_log(config, f"TestModel_{model}", root=log_dir)
+
+    fold_performance, parameters = [], []
+
+    for fold in range(1, nFolds+1):
+
+        test_fold = data[cvIndices == fold]
+        train_folds = data[cvIndices != fold]
+
+        response, stim = get_training_data(train_folds, mdl, train_trials, rng=rng)
+
+        param_i = fit_data_multiple_runs(mdl['fitfunc'], nRuns, response, stim, rng=rng)
+
+        param_i['Fold'] = fold
+        parameters.append(param_i)
+
+        Xfit = get_best_parameters(param_i)
+        fold_performance.append( test_model_performance(mdl['simfunc'], test_fold, Xfit, rng=rng, stim_cols=mdl['stim_cols']))
+
+    fold_performance = pd.DataFrame(fold_performance)
+    fold_performance['Fold'] = np.arange(1, nFolds+1)
+
+    fold_performance.to_csv( log_path / 'fold_performance.csv', index=False)
+    pd.concat(parameters).to_csv( log_path / 'param_contrast.csv', index=False)
+
+    return log_path
+
+
+def main():
+
+    available = cfs.list_ferrets(trial_store)
+
+    for ferret in ferrets:
+
+        ferret_name = f"F{ferret['num']}_{ferret['name']}"
+
+        if ferret_name not in available:
+            print(f"{ferret_name}: No formatted data")
+            continue
+
+        for model in models:
+            log_path = test_model(ferret_name, model=model)
+
+            print(f"{ferret_name}: {model} saved to {log_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,410 @@
+'''
+Index of model fitting results
+
+Results of model fitting are saved in a directory for each ferret and model
+(e.g. logs/CF8_FullAllo_Theta/2021-08-25_12-48_TestModel_CF8_FullAllo_Theta),
+containing config.txt, param_contrast.csv and fold_performance.csv. Rather
+than reading every directory whenever a figure is drawn, results are read once
+and stored in an SQLite database, with one row per result directory (runs),
+fitted parameters for every fold and run in long format (parameters), and
+performance on held-out data for every fold (folds).
+
+The index is updated incrementally: directories are only read again if the
+size or modification time of their files changes, and directories that no
+longer exist are removed.
+
+Tables:
+    runs - one row per result directory (keyed by path), with ferret,
+        predictor, model, run datetime and best negative log-likelihood
+    parameters - initial (X0) and fitted (Xfit) value of each parameter,
+        for each fold and fitting run
+    folds - performance predicting held-out data on each fold
+
+Usage:
+    python Modelling/cf_results.py      # Update index for matlab and python logs
+
+Created:
+    2026-10-18
+
+'''
+
+from contextlib import closing
+from datetime import datetime
+import json
+import os, sys
+from pathlib import Path
+import re
+import sqlite3
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '..')))
+from Modelling import cf_simulate as csim
+
+
+INDEX_PATH = Path('Modelling/logs/results.sqlite')
+INDEX_VERSION = 1           # Increment to rebuild index if the tables change
+
+LOG_ROOTS = (Path('Modelling/matlab/logs'), Path('Modelling/logs'))
+RESULT_FILES = ('config.txt', 'param_contrast.csv', 'fold_performance.csv')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_dir TEXT PRIMARY KEY,
+    root TEXT,
+    run_group TEXT,
+    model TEXT,
+    run_dt TEXT,
+    input_data TEXT,
+    ferret INTEGER,
+    predictor TEXT,
+    nFolds INTEGER,
+    nRuns INTEGER,
+    nParams INTEGER,
+    best_NegLL REAL,
+    mean_pCorrect REAL,
+    config TEXT,
+    signature TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_ferret ON runs (root, run_group, ferret, predictor);
+CREATE INDEX IF NOT EXISTS runs_dt ON runs (run_dt);
+
+CREATE TABLE IF NOT EXISTS parameters (
+    run_dir TEXT,
+    Fold INTEGER,
+    Run INTEGER,
+    param TEXT,
+    X0 REAL,
+    Xfit REAL,
+    NegLogLik REAL
+);
+CREATE INDEX IF NOT EXISTS parameters_run ON parameters (run_dir);
+
+CREATE TABLE IF NOT EXISTS folds (
+    run_dir TEXT,
+    Fold INTEGER,
+    nCorrect INTEGER,
+    nTrials INTEGER,
+    pCorrect REAL
+);
+CREATE INDEX IF NOT EXISTS folds_run ON folds (run_dir);
+"""
+
+
+def connect(index_path=INDEX_PATH):
+    """
+    Open the index, creating tables if required (or rebuilding them if the
+    index was created by an earlier version of this module)
+    """
+
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+
+    con = sqlite3.connect(index_path)
+
+    if con.execute('PRAGMA user_version').fetchone()[0] != INDEX_VERSION:
+        con.executescript('DROP TABLE IF EXISTS runs; DROP TABLE IF EXISTS parameters; DROP TABLE IF EXISTS folds;')
+        con.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+
+    con.executescript(SCHEMA)
+
+    return con
+
+
+def get_run_datetime(run_dir):
+    """
+    Get the datetime at which fitting started from the name of a result directory
+    (or the batch directory containing it)
+
+    >>> get_run_datetime(Path('logs/2021-08-25_12-48_TestModel_CF8_FullAllo_Theta'))
+    datetime.datetime(2021, 8, 25, 12, 48)
+    >>> get_run_datetime(Path('logs/2026-10-18_12-00-00_Batch/F1701_Pendleton_TestModel_Alt01_Guess'))
+    datetime.datetime(2026, 10, 18, 12, 0)
+    """
+
+    for part in (run_dir.name,) + tuple(x.name for x in run_dir.parents):
+
+        match = re.match(r'(\d{4}-\d{2}-\d{2}_\d{2}-\d{2})(-\d{2})?', part)
+
+        if match is not None:
+            return datetime.strptime(match.group(1) + (match.group(2) or '-00'), '%Y-%m-%d_%H-%M-%S')
+
+    return None
+
+
+def get_signature(run_dir):
+    """ Size and modification time of result files, to identify directories that have changed """
+
+    stats = [(run_dir / x).stat() for x in RESULT_FILES]
+
+    return json.dumps([(x.st_size, x.st_mtime_ns) for x in stats])
+
+
+def read_run(run_dir, root):
+    """
+    Read results from one directory
+
+    Parameters:
+    ----------
+    run_dir : pathlib Path
+        Directory containing results for one ferret and model
+    root : pathlib Path
+        Directory being indexed
+
+    Returns:
+    --------
+    run : dict
+        Row of runs table
+    parameters : pandas dataframe
+        Initial and fitted values of each parameter (long format)
+    folds : pandas dataframe
+        Performance on each fold
+    """
+
+    config = csim.load_config(run_dir)
+    contrast = pd.read_csv(run_dir / 'param_contrast.csv')
+    folds = pd.read_csv(run_dir / 'fold_performance.csv')
+
+    # Reshape parameters so that models with different parameters share columns
+    param_names = [x.replace('_Xfit', '') for x in contrast.columns if x.endswith('_Xfit')]
+
+    parameters = pd.concat([
+        pd.DataFrame({
+            'Fold': contrast['Fold'],
+            'Run': contrast['Run'],
+            'param': name,
+            'X0': contrast.get(f"{name}_X0"),
+            'Xfit': contrast[f"{name}_Xfit"],
+            'NegLogLik': contrast['NegLogLik'],
+        })
+        for name in param_names
+    ])
+
+    run_dt = get_run_datetime(run_dir)
+
+    run = dict(
+        run_dir = str(run_dir),
+        root = str(root),
+        run_group = run_dir.parent.relative_to(root).as_posix(),
+        model = run_dir.name.split('_TestModel_')[-1],
+        run_dt = run_dt.isoformat(sep=' ') if run_dt is not None else None,
+        input_data = config.get('InputData'),
+        ferret = int(config['InputData'][1:5]),
+        predictor = config.get('stim_col'),
+        nFolds = config.get('nFolds'),
+        nRuns = config.get('nRuns'),
+        nParams = config.get('nParams'),
+        best_NegLL = float(contrast['NegLogLik'].min()),
+        mean_pCorrect = float(folds['pCorrect'].mean()),
+        config = json.dumps(config, default=str),
+        signature = get_signature(run_dir)
+    )
+
+    return run, parameters, folds[['Fold', 'nCorrect', 'nTrials', 'pCorrect']]
+
+
+def update_index(root, index_path=INDEX_PATH):
+    """
+    Add new or changed result directories under a directory to the index
+
+    Parameters:
+    ----------
+    root : pathlib Path
+        Directory containing result directories (searched recursively, e.g. Modelling/matlab/logs)
+    index_path : pathlib Path, optional
+        SQLite database
+
+    Notes:
+    ------
+    Result directories are named *_TestModel_* and contain config.txt,
+    param_contrast.csv and fold_performance.csv (incomplete directories are
+    ignored).
+
+    Returns:
+    --------
+    summary : dict
+        Number of directories added or updated, unchanged and removed
+    """
+
+    root = Path(root)
+    summary = dict(updated=0, unchanged=0, removed=0)
+
+    with closing(connect(index_path)) as con, con:
+
+        known = dict(con.execute("SELECT run_dir, signature FROM runs WHERE root = ?", [str(root)]))
+        found = []
+
+        for run_dir in sorted(root.rglob('*_TestModel_*')):
+
+            if not all((run_dir / x).exists() for x in RESULT_FILES):
+                continue
+
+            found.append(str(run_dir))
+
+            if known.get(str(run_dir)) == get_signature(run_dir):
+                summary['unchanged'] += 1
+                continue
+
+            run, parameters, folds = read_run(run_dir, root)
+
+            for table in ('runs', 'parameters', 'folds'):
+                con.execute(f"DELETE FROM {table} WHERE run_dir = ?", [str(run_dir)])
+
+            columns = list(run.keys())
+            con.execute(
+                f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [run[x] for x in columns]
+            )
+
+            parameters.assign(run_dir=str(run_dir)).to_sql('parameters', con, if_exists='append', index=False)
+            folds.assign(run_dir=str(run_dir)).to_sql('folds', con, if_exists='append', index=False)
+
+            summary['updated'] += 1
+
+        missing = [(x,) for x in set(known) - set(found)]
+
+        for table in ('runs', 'parameters', 'folds'):
+            con.executemany(f"DELETE FROM {table} WHERE run_dir = ?", missing)
+
+        summary['removed'] = len(missing)
+
+    return summary
+
+
+def query(sql, params=(), index_path=INDEX_PATH):
+    """ Run a query on the index and return the result as a dataframe """
+
+    with closing(connect(index_path)) as con:
+        return pd.read_sql_query(sql, con, params=params)
+
+
+def select_runs(root=None, group=None, ferrets=None, predictors=None, models=None, after=None, before=None):
+    """
+    Create SQL conditions selecting result directories
+
+    Parameters:
+    ----------
+    root : pathlib Path, optional
+        Directory indexed (as passed to update_index)
+    group : str, optional
+        Subdirectory of root containing results (e.g. 'CF8_FullAllo_Theta_Recoded')
+    ferrets : list, optional
+        Subject numbers (e.g. [1701, 1703])
+    predictors : list, optional
+        Predictors of models (e.g. ['speaker_angle_world'])
+    models : list, optional
+        Model names (e.g. ['CF8_FullAllo_Theta', 'Alt01_Guess'])
+    after, before : datetime or str, optional
+        Range of run datetimes
+
+    Returns:
+    --------
+    where : str
+        SQL conditions on runs table (aliased as r)
+    params : list
+        Values for placeholders in conditions
+    """
+
+    conditions, params = [], []
+
+    for column, value in (('root', root), ('run_group', group)):
+        if value is not None:
+            conditions.append(f"r.{column} = ?")
+            params.append(str(Path(value)) if column == 'root' else str(value))
+
+    for column, values in (('ferret', ferrets), ('predictor', predictors), ('model', models)):
+        if values is not None:
+            values = list(values)
+            conditions.append(f"r.{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+
+    for op, value in (('>=', after), ('<', before)):
+        if value is not None:
+            conditions.append(f"r.run_dt {op} ?")
+            params.append(str(pd.Timestamp(value)))
+
+    where = " WHERE " + " AND ".join(conditions) if len(conditions) > 0 else ""
+
+    return where, params
+
+
+def load_runs(index_path=INDEX_PATH, **selection):
+    """
+    Get one row per result directory, ordered by ferret, predictor and best
+    negative log-likelihood (see select_runs for selection criteria)
+    """
+
+    where, params = select_runs(**selection)
+
+    runs = query(f"SELECT * FROM runs r{where} ORDER BY r.ferret, r.predictor, r.best_NegLL", params, index_path)
+    runs['run_dt'] = pd.to_datetime(runs['run_dt'])
+
+    return runs
+
+
+def load_parameters(index_path=INDEX_PATH, best_only=False, **selection):
+    """
+    Get fitted parameters for each fold and run of selected result directories
+
+    Parameters:
+    ----------
+    index_path : pathlib Path, optional
+        SQLite database
+    best_only : bool, optional
+        Whether to return only the runs with minimum negative log-likelihood
+        for each result directory
+    selection : optional
+        Selection criteria (see select_runs)
+
+    Returns:
+    --------
+    parameters : pandas dataframe
+        One row per fold and run, with a column for each fitted parameter,
+        negative log-likelihood (NegLogLik), Ferret and predictor
+    """
+
+    where, params = select_runs(**selection)
+
+    sql = f"""
+        SELECT p.run_dir, p.Fold, p.Run, p.param, p.Xfit, p.NegLogLik, r.ferret AS Ferret, r.predictor
+        FROM parameters p JOIN runs r ON p.run_dir = r.run_dir{where}
+    """
+
+    if best_only:
+        sql += (" AND" if where else " WHERE") + " p.NegLogLik = r.best_NegLL"
+
+    long = query(sql, params, index_path)
+
+    parameters = long.set_index(['run_dir', 'Ferret', 'predictor', 'Fold', 'Run', 'NegLogLik', 'param'])['Xfit'].unstack('param')
+    parameters.columns.name = None
+
+    return parameters.reset_index()
+
+
+def load_fold_performance(index_path=INDEX_PATH, **selection):
+    """
+    Get performance predicting held-out data on each fold of selected result
+    directories (see select_runs for selection criteria), with Ferret and predictor
+    """
+
+    where, params = select_runs(**selection)
+
+    sql = f"""
+        SELECT f.run_dir, f.Fold, f.nCorrect, f.nTrials, f.pCorrect, r.ferret AS Ferret, r.predictor
+        FROM folds f JOIN runs r ON f.run_dir = r.run_dir{where}
+        ORDER BY f.run_dir, f.Fold
+    """
+
+    return query(sql, params, index_path)
+
+
+def main():
+
+    for root in LOG_ROOTS:
+        if root.exists():
+            summary = update_index(root)
+            print(f"{root}: {summary['updated']} updated, {summary['unchanged']} unchanged, {summary['removed']} removed")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,9 +8,12 @@ These models are also orthogonal in that they can only consider
 sound angle in one coordinate system but not both.
 
 Stephen Town - 13 Dec 2020
+
+Updated:
+    2026-10-18: Softmax and response simulation operate on arrays of stimuli
+    2026-10-18: Exact (analytic) response probabilities and percent correct by default
 '''
 
-import math
 import os, sys
 
 import matplotlib.pyplot as plt
@@ -18,8 +21,9 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 
-sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../Analysis')))
-import cf_behavior as cf
+sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '..')))
+from Analysis import cf_angles as cang
+from Analysis import cf_behavior as cf
 
 
 def softmax(z, beta=1, idx=None):
@@ -29,7 +33,8 @@ def softmax(z, beta=1, idx=None):
     Parameters:
     ----------
     z : list or numpy array
-        Input vector (e.g. activations)
+        Input vector (e.g. activations), or array with one row per stimulus
+        and one column per action
     beta : float, optional
         Inverse temperature (coldness)
     idx : logical array or int, optional
@@ -42,21 +47,25 @@ def softmax(z, beta=1, idx=None):
         Tip: If you want to maintain scale between z and p (e.g. [1, 2] -> [1/3 2/3])
         set coldness to 1/sqrt(2) (e.g. 2 ** -0.5)
 
+        Activations are shifted by their maximum before taking exponents
+        (log-sum-exp), so that high coldness values don't overflow
+
     >>> softmax([1, 2], beta=0)
-    [0.5, 0.5]
+    array([0.5, 0.5])
 
     Returns:
     --------
-    p : float, list or numpy array
-        Probabilities of values in z
-    """    
+    p : float or numpy array
+        Probabilities of values in z (along the last axis)
+    """
 
-    z = [math.exp(zi*beta) for zi in z]    
+    z = np.asarray(z, dtype=float) * beta
+    z = np.exp(z - z.max(axis=-1, keepdims=True))
 
-    if idx is None:
-        p = [(zi / sum(z))  for zi in z]
-    else:
-        p = z[idx] / sum(z)
+    p = z / z.sum(axis=-1, keepdims=True)
+
+    if idx is not None:
+        p = p[..., idx]
 
     return p
 
@@ -70,11 +79,12 @@ def choose(p, n, rng=None):
     Parameters:
     ----------
     p : list or numpy array
-        Probabilities of making one of several actions
+        Probabilities of making one of several actions, or array with one
+        row of probabilities per stimulus
     n : int
         Number of draws to make
-    rng : numpy random number generator, optional
-        Generator object to pass through experiment (or create if not initialized: None)
+    rng : numpy random number generator or int, optional
+        Generator object to pass through experiment (or seed for new generator)
 
     Notes:
     ------
@@ -89,14 +99,12 @@ def choose(p, n, rng=None):
     Returns:
     --------
     aCount : numpy array
-        Counts of instances of each action
+        Counts of instances of each action (with the same shape as p)
     rng : numpy random number generator, optional
         Generator object to pass through rest of simulation
     """
 
-    if rng is None:
-        rng = np.random.default_rng()
-        print('Creating random number generator"""  """')
+    rng = np.random.default_rng(rng)
 
     aCount = rng.multinomial(n, p)
 
@@ -281,15 +289,7 @@ def draw_pivot_table(ax, df, row_var, col_var):
     """
 
     # Wrap to have both ±180°
-    extra_f = df[df['speaker_angle_world'] == -180]
-    extra_f.loc[:, 'speaker_angle_world'] = 180
-    
-    df = pd.concat([df, extra_f])
-
-    extra_g = df[df['speaker_angle_platform'] == -180]
-    extra_g.loc[:, 'speaker_angle_platform'] = 180
-        
-    df = pd.concat([df, extra_g])
+    df = cang.duplicate_wrapped_values(df, ['speaker_angle_world', 'speaker_angle_platform'])
 
     
     piv = pd.pivot_table(df, values='response_P', index=[row_var], columns=[col_var])
@@ -313,91 +313,167 @@ def draw_pivot_table(ax, df, row_var, col_var):
     return None
 
 
-def get_percent_correct(df, coldness=1, task_var='speaker_angle_world', task_map=None, nIterations=1000, generator=None):
+def response_probability(activation, coldness=1):
+    """
+    Probability of responding at each spout for many stimuli at once
+
+    Parameters:
+    ----------
+    activation : pandas series or numpy array
+        Activation for going to spout 9 (West / Left) for each stimulus
+    coldness : float, optional
+        Inverse temperature of softmax
+
+    >>> response_probability([0.5, 1], coldness=0)
+    array([[0.5, 0.5],
+           [0.5, 0.5]])
+
+    Returns:
+    --------
+    p : numpy array
+        Probability of responding at [spout 3, spout 9] for each stimulus (nStim x 2)
+    """
+
+    activation = np.asarray(activation, dtype=float)
+
+    z = np.column_stack((1-activation, activation))    # Note here that the "1-x" could be problematic but I don't know what else would be appropriate
+    
+    return softmax(z, beta=coldness)
+
+
+def simulate_responses(activation, coldness=1, nIterations=1000, generator=None):
+    """
+    Simulate responses to many stimuli at once
+
+    Parameters:
+    ----------
+    activation : pandas series or numpy array
+        Activation for going to spout 9 (West / Left) for each stimulus
+    coldness : float, optional
+        Inverse temperature of softmax
+    nIterations : int, optional
+        Number of trials simulated for each stimulus
+    generator : numpy random number generator, optional
+        Generator object to pass through experiment
+
+    Returns:
+    --------
+    response_count : numpy array
+        Number of responses to [spout 3, spout 9] for each stimulus (nStim x 2)
+    generator : numpy random number generator
+        Generator object to pass through rest of simulation
     """
-    Description
+
+    p = response_probability(activation, coldness)
+
+    return choose(p, n=nIterations, rng=generator)
+
+
+def get_percent_correct(df, coldness=1, task_var='speaker_angle_world', task_map=None, nIterations=1000, generator=None, simulate=False):
+    """
+    Performance of a model for each platform angle
     
     Parameters:
     ----------
     df : pandas dataframe
         Dataframe giving speaker locations and response probabilities for a specific model
+    coldness : float, optional
+        Inverse temperature of softmax
+    task_var : str, optional
+        Coordinate frame in which the task is defined
     task_map : pandas dataframe
         Dataframe giving the speaker location and correct response location 
         using angular notation, as well as whether logical value indicating
         how increasing response probabilities should be treated (respP = 1 == always True)
+    nIterations : int, optional
+        Number of trials for each stimulus
+    generator : numpy random number generator, optional
+        Generator object to pass through experiment (only used if simulate=True)
+    simulate : bool, optional
+        Whether to simulate responses (Monte Carlo) rather than calculate 
+        expected performance
     
+    Notes:
+    ------
+    By default, nCorrect is the expected number of trials correct, and 
+    pCorrect_var is the binomial variance of percent correct for the number
+    of trials given. With simulate=True, nCorrect is the number of trials 
+    correct in one simulated experiment (and pCorrect_var is the variance 
+    expected across experiments).
+
     Returns:
     --------
     results : pandas dataframe
         Results dataframe containing number of trials correct
+    generator : numpy random number generator
+        Generator object to pass through rest of simulation
     """
 
     if task_map is None:
         task_map = pd.DataFrame([[-180, 3, 0],[0, 9, 1]], columns=[task_var,'Response','Binary'])
 
-    # Filter for test stimuli
-    test_locations = task_map[task_var].unique()
-    df = df[df[task_var].isin(test_locations)]
-
-    results = []
-
-    # For each stimulus
-    for platform, pData in df.groupby(by='CenterSpoutRotation'):      
-
-        nTrials, nCorrect = 0, 0      
+    # Filter for test stimuli and identify the correct response for each
+    df = df.merge(task_map[[task_var, 'Binary']], on=task_var, how='inner')
 
-        for _, row in pData.iterrows():
-            
-            z = [1-row['response_activation'], row['response_activation']]    # Note here that the "1-x" could be problematic but I don't know what else would be appropriate
-            p = softmax(z, beta=coldness)           
+    stim_idx = np.arange(df.shape[0])
+    p_correct = response_probability(df['response_activation'], coldness)[stim_idx, df['Binary'].to_numpy()]
 
-            response_count, generator = choose(p, n=nIterations, rng=generator)
-
-            idx = task_map[ task_map[task_var] == row[task_var]]['Binary'].to_numpy()
+    if simulate:
+        response_count, generator = simulate_responses(df['response_activation'], coldness, nIterations, generator)
+        nCorrect = response_count[stim_idx, df['Binary'].to_numpy()]
+    else:
+        nCorrect = p_correct * nIterations
 
-            nCorrect += response_count[idx]
-            nTrials += nIterations
-            
-        results.append(
-            dict(
-                CenterSpoutRotation = platform,
-                nCorrect = nCorrect,
-                nTrials = nTrials   
-            ))    
+    df = df.assign(
+        nCorrect = nCorrect,
+        nTrials = nIterations,
+        var_correct = nIterations * p_correct * (1 - p_correct)
+    )
 
-    results = pd.DataFrame(results)
+    results = df.groupby(by='CenterSpoutRotation')[['nCorrect','nTrials','var_correct']].sum().reset_index()
     results['pCorrect'] = results['nCorrect'] / results['nTrials'] * 100
+    results['pCorrect_var'] = results.pop('var_correct') / results['nTrials'] ** 2 * 100 ** 2
     
     return results, generator
 
 
-def get_response_probability(df, coldness=1, nIterations=1000, generator=None):
+def get_response_probability(df, coldness=1, nIterations=1000, generator=None, simulate=False):
     """
-    Description
+    Proportion of responses to spout 9 (West / Left) for each stimulus
     
     Parameters:
     ----------
     df : pandas dataframe
         Dataframe giving speaker locations and response probabilities for a specific model
-    
+    coldness : float, optional
+        Inverse temperature of softmax
+    nIterations : int, optional
+        Number of trials for each stimulus
+    generator : numpy random number generator, optional
+        Generator object to pass through experiment (only used if simulate=True)
+    simulate : bool, optional
+        Whether to simulate responses (Monte Carlo) rather than calculate 
+        response probabilities exactly
+
     Returns:
     --------
     results : pandas dataframe
-        Results dataframe with response proportions added
+        Results dataframe with response proportions (response_P) and 
+        binomial variance of the proportion for nIterations trials (response_var)
+        added
+    generator : numpy random number generator
+        Generator object to pass through rest of simulation
     """
 
-    def sim_trial(activation, generator=None):
-
-        z = [1-activation, activation]    # Note here that the "1-x" could be problematic but I don't know what else would be appropriate
-        p = softmax(z, beta=coldness)           
+    p_response = response_probability(df['response_activation'], coldness)[:, 1]
 
-        response_count, generator = choose(p, n=nIterations, rng=generator)
-        p_response = response_count[1] / nIterations
-        
-        return p_response
+    if simulate:
+        response_count, generator = simulate_responses(df['response_activation'], coldness, nIterations, generator)
+        df['response_P'] = response_count[:, 1] / nIterations
+    else:
+        df['response_P'] = p_response
 
-    
-    df['response_P'] = df['response_activation'].apply(sim_trial, **dict(generator=generator))
+    df['response_var'] = p_response * (1 - p_response) / nIterations
     
     return df, generator
 
@@ -0,0 +1,261 @@
+'''
+Parameter sweeps for coordinate-frame simulations
+
+Rather than running simulation scripts with one set of coefficients at a time,
+response probabilities are computed for many sets of CF8 parameters
+(vert_offset, horiz_offset, amplitude and coldness) at once, for every
+combination of platform angle and speaker location, and for models based on
+sound angle in the world and relative to the head.
+
+Results are stored as a cube with dimensions:
+    parameter set x predictor x platform angle x speaker location
+
+Usage:
+    python Modelling/cf_sweep.py
+
+Created:
+    2026-10-18
+'''
+
+import os, sys
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '..')))
+from Modelling import cf_model as cm
+from Modelling import cf_simulate as csim
+
+
+PARAM_NAMES = list(cm.CF8_PARAMS['name'])
+PREDICTORS = ('speaker_angle_world', 'speaker_angle_platform')
+
+
+def make_grid(**values):
+    """
+    Create a table with all combinations of parameter values
+
+    Parameters:
+    ----------
+    **values : list or numpy array
+        Values for each parameter (vert_offset, horiz_offset, amplitude and coldness)
+
+    >>> make_grid(vert_offset=[0.5], horiz_offset=[0, 90], amplitude=[0.3], coldness=[2]).shape
+    (2, 4)
+
+    Returns:
+    --------
+    params : pandas dataframe
+        Parameter sets (rows) for each parameter (columns)
+    """
+
+    missing = set(PARAM_NAMES) - set(values)
+    if len(missing) > 0:
+        raise ValueError(f"No values given for {sorted(missing)}")
+
+    index = pd.MultiIndex.from_product([values[x] for x in PARAM_NAMES], names=PARAM_NAMES)
+
+    return index.to_frame(index=False)
+
+
+def sample_latin_hypercube(n, bounds=cm.CF8_PARAMS, rng=None):
+    """
+    Sample parameter sets that evenly cover the range of each parameter
+
+    Parameters:
+    ----------
+    n : int
+        Number of parameter sets
+    bounds : pandas dataframe, optional
+        Name, lower and upper bound of each parameter
+    rng : numpy random generator or int, optional
+        Generator (or seed) for sampling
+
+    Notes:
+    ------
+    The range of each parameter is divided into n equal intervals, with one
+    value drawn from each interval. Intervals are then shuffled independently
+    for each parameter.
+
+    Returns:
+    --------
+    params : pandas dataframe
+        Parameter sets (rows) for each parameter (columns)
+    """
+
+    rng = np.random.default_rng(rng)
+    nParams = bounds.shape[0]
+
+    u = (rng.permuted(np.tile(np.arange(n), (nParams, 1)), axis=1) + rng.random((nParams, n))) / n
+
+    lower = bounds['lower'].to_numpy()[:, None]
+    upper = bounds['upper'].to_numpy()[:, None]
+
+    return pd.DataFrame((lower + u * (upper - lower)).T, columns=bounds['name'].to_list())
+
+
+def get_stimulus_grid(stim=None):
+    """
+    Arrange sound angles for all stimuli as arrays of platform angle x speaker location
+
+    Parameters:
+    ----------
+    stim : pandas dataframe, optional
+        Stimuli (as created by cf_simulate.create_stimuli)
+
+    Returns:
+    --------
+    grid : dict
+        Platform angles, speaker locations and sound angles in each coordinate frame
+    """
+
+    if stim is None:
+        stim = csim.create_stimuli()
+
+    grid = dict()
+
+    for predictor in PREDICTORS:
+        piv = stim.pivot(index='CenterSpoutRotation', columns='Speaker Location', values=predictor)
+        grid[predictor] = piv.to_numpy()
+
+    grid['platform'] = piv.index.to_numpy()
+    grid['speaker'] = piv.columns.to_numpy()
+
+    return grid
+
+
+def run_sweep(params, predictors=PREDICTORS, nIterations=None, rng=None, block_size=4096):
+    """
+    Compute response probabilities for many parameter sets
+
+    Parameters:
+    ----------
+    params : pandas dataframe
+        Parameter sets (e.g. from make_grid or sample_latin_hypercube)
+    predictors : tuple, optional
+        Columns with sound angles that each model is based on
+    nIterations : int, optional
+        Number of trials to simulate for each stimulus (if None, only
+        response probabilities are returned)
+    rng : numpy random generator or int, optional
+        Generator (or seed) for simulating responses
+    block_size : int, optional
+        Maximum number of parameter sets evaluated at once (to limit memory use)
+
+    Returns:
+    --------
+    sweep : dict
+        Arrays describing the sweep, including:
+        p_response - probability of responding at spout 9 (params x predictor x platform x speaker)
+        n_response - number of simulated responses at spout 9 (if nIterations given)
+    """
+
+    grid = get_stimulus_grid()
+    theta = np.stack([grid[x] for x in predictors])                     # predictor x platform x speaker
+
+    X = params[PARAM_NAMES].to_numpy(dtype=float)
+    p_response = np.empty((X.shape[0],) + theta.shape, dtype='float32')
+
+    for start in range(0, X.shape[0], block_size):
+
+        x = X[start:start+block_size, :, None, None, None]
+
+        q = cm.cf8_activation(theta, x[:,0], x[:,1], x[:,2])
+        p_response[start:start+block_size] = cm.get_choice_probability(q, x[:,3])
+
+    sweep = dict(
+        params = X,
+        param_names = np.array(PARAM_NAMES),
+        predictors = np.array(predictors),
+        platform = grid['platform'],
+        speaker = grid['speaker'],
+        speaker_angle_world = grid['speaker_angle_world'],
+        speaker_angle_platform = grid['speaker_angle_platform'],
+        p_response = p_response
+    )
+
+    if nIterations is not None:
+        rng = np.random.default_rng(rng)
+
+        sweep['nIterations'] = np.array(nIterations)
+        sweep['n_response'] = rng.binomial(nIterations, p_response).astype('int32')
+
+    return sweep
+
+
+def get_percent_correct(sweep, task_var='speaker_angle_world', task_map=None, simulated=False):
+    """
+    Performance of each model on the task, at each platform angle
+
+    Parameters:
+    ----------
+    sweep : dict
+        Results of parameter sweep (see run_sweep)
+    task_var : str, optional
+        Coordinate frame in which the task is defined
+    task_map : pandas dataframe, optional
+        Sound angles tested and whether the correct response is spout 9 (Binary = 1)
+        or spout 3 (Binary = 0), as in cf_simulate.get_percent_correct
+    simulated : bool, optional
+        Whether to use simulated responses (otherwise expected performance
+        is calculated from response probabilities)
+
+    Returns:
+    --------
+    pCorrect : numpy array
+        Percent correct (params x predictor x platform)
+    """
+
+    if task_map is None:
+        task_map = pd.DataFrame([[-180, 3, 0],[0, 9, 1]], columns=[task_var,'Response','Binary'])
+
+    correct = pd.Series(task_map['Binary'].to_numpy(), index=task_map[task_var])
+    correct = pd.DataFrame(sweep[task_var]).stack().map(correct).unstack().to_numpy()    # platform x speaker (nan if not tested)
+
+    if simulated:
+        p_response = sweep['n_response'] / sweep['nIterations']
+    else:
+        p_response = sweep['p_response']
+
+    tested = ~np.isnan(correct)
+    p_correct = np.where(correct == 1, p_response, 1 - p_response)
+
+    return np.sum(p_correct * tested, axis=-1) / tested.sum(axis=-1) * 100
+
+
+def save_sweep(sweep, file_path):
+    """ Save results of parameter sweep as a compressed numpy archive """
+
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    np.savez_compressed(file_path, **sweep)
+
+
+def load_sweep(file_path):
+    """ Load results of parameter sweep saved using save_sweep """
+
+    with np.load(file_path) as f:
+        return {k: f[k] for k in f.files}
+
+
+def main():
+
+    params = make_grid(
+        vert_offset = np.linspace(0.5, 1, 6),
+        horiz_offset = np.arange(-180, 180, 30),
+        amplitude = np.linspace(0, 0.5, 6),
+        coldness = [0.5, 1, 2, 5, 10, 20]
+    )
+
+    sweep = run_sweep(params, nIterations=1000, rng=0)
+
+    save_path = cm.log_root / 'sweeps' / 'CF8_grid.npz'
+    save_sweep(sweep, save_path)
+
+    print(f"{params.shape[0]} parameter sets saved to {save_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+'''
+Spatial tuning of behavior in each session
+
+The probability of responding at spout 9 (Response = 1) is modelled as a
+logistic function of sound angle, with sine and cosine regressors:
+
+    logit(p) = b0 + b1 * sin(theta) + b2 * cos(theta)
+             = bias + amplitude * sin(theta + shift)
+
+where bias, amplitude and shift are the parameters illustrated in
+circular_model_curves.py and circular_fit_demo.py, and the preferred angle
+(at which responses are most likely) is 90° - shift.
+
+Each session (or sliding window of consecutive sessions) is a separate
+3-parameter logistic regression. Trials are collapsed into the number of
+trials and responses at each sound angle, and all sessions are fitted together
+with iteratively reweighted least squares (IRLS), in which each Newton step
+solves a stack of 3 x 3 systems. Standard errors are taken from the inverse of
+the Fisher information at the fitted values, and propagated to amplitude and
+shift with the delta method.
+
+Usage:
+    python Modelling/cf_tuning.py
+    python Modelling/cf_tuning.py --stim_col speaker_angle_world --window 5
+
+Output (Modelling/logs/<datetime>_Tuning):
+    session_fits.csv: one row per ferret and session (or window), with
+    parameters and standard errors
+
+Created:
+    2026-10-18
+'''
+
+import argparse
+from datetime import datetime
+import os, sys
+
+import numpy as np
+import pandas as pd
+from scipy.special import expit
+
+sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '..')))
+from Analysis import ferrets
+from Analysis import cf_angles as cang
+from Analysis import cf_store as cfs
+from Modelling import cf_model as cm
+
+
+def get_design(theta):
+    """
+    Regressors for the logistic model at each sound angle
+
+    Parameters:
+    ----------
+    theta : numpy array
+        Sound angles (degrees)
+
+    Returns:
+    --------
+    X : numpy array
+        Design matrix (nAngles x 3) with columns 1, sin(theta) and cos(theta)
+
+    >>> get_design(np.array([0, 90])).round(6)
+    array([[1., 0., 1.],
+           [1., 1., 0.]])
+    """
+
+    radians = np.deg2rad(theta)
+
+    return np.column_stack([np.ones_like(radians), np.sin(radians), np.cos(radians)])
+
+
+def fit_circular_logistic(n_trials, n_resp, theta, max_iter=100, tol=1e-8, ridge=0.0):
+    """
+    Fit logistic regression with sine and cosine regressors to many groups at once
+
+    Parameters:
+    ----------
+    n_trials : numpy array
+        Number of trials at each sound angle for each group (nGroups x nAngles)
+    n_resp : numpy array
+        Number of responses (Response = 1) at each sound angle for each group
+    theta : numpy array
+        Sound angles (degrees; nAngles)
+    max_iter : int, optional
+        Maximum number of Newton steps
+    tol : float, optional
+        Convergence criterion (largest change in any coefficient)
+    ridge : float, optional
+        L2 penalty on the sine and cosine coefficients, which keeps estimates
+        finite when responses are perfectly separated by sound angle
+
+    Notes:
+    ------
+    Steps that increase the (penalized) negative log-likelihood of a group are
+    halved until they don't, so that each group converges independently.
+
+    Coefficients can't all be estimated for groups in which sound angles tested
+    lie on one axis through the head (e.g. only 0 and -180°, as in many single
+    sessions), which are not identified. Without a penalty, coefficients also
+    grow without limit when responses are perfectly predicted by sound angle
+    at some angles (separated), and should be ignored.
+
+    Returns:
+    --------
+    fit : dict
+        Coefficients (beta; nGroups x 3), their covariance (cov; nGroups x 3 x 3),
+        negative log-likelihood (nll), and whether each group converged, was
+        identified and was separated
+    """
+
+    n_trials = np.asarray(n_trials, dtype=float)
+    n_resp = np.asarray(n_resp, dtype=float)
+
+    X = get_design(theta)
+    penalty = ridge * np.diag([0.0, 1.0, 1.0])
+
+    # Penalized negative log-likelihood for selected groups (response = action 1, see cf_model.binomial_nll)
+    def objective(beta, rows):
+        counts = dict(n_trials=n_trials[rows], n_action1=n_resp[rows])
+        return cm.binomial_nll(beta @ X.T, counts) + 0.5 * np.einsum('gi,ij,gj->g', beta, penalty, beta)
+
+    beta = np.zeros((n_trials.shape[0], 3))
+    loss = objective(beta, slice(None))
+    converged = np.zeros(n_trials.shape[0], dtype=bool)
+
+    for _ in range(max_iter):
+
+        active = np.flatnonzero(~converged)
+        if active.size == 0:
+            break
+
+        p = expit(beta[active] @ X.T)
+        w = n_trials[active] * p * (1 - p)
+
+        grad = (n_resp[active] - n_trials[active] * p) @ X - beta[active] @ penalty
+        info = np.einsum('gk,ki,kj->gij', w, X, X) + penalty
+        step = np.einsum('gij,gj->gi', np.linalg.pinv(info, hermitian=True), grad)
+
+        # Halve steps that don't improve the fit
+        new_beta = beta[active] + step
+        new_loss = objective(new_beta, active)
+
+        for _halving in range(30):
+            worse = new_loss > loss[active] + 1e-12
+            if not worse.any():
+                break
+            step[worse] /= 2
+            new_beta[worse] = beta[active][worse] + step[worse]
+            new_loss[worse] = objective(new_beta[worse], active[worse])
+
+        beta[active] = new_beta
+        loss[active] = new_loss
+        converged[active] = np.abs(step).max(axis=1) < tol
+
+    # Covariance from Fisher information at fitted values
+    p = expit(beta @ X.T)
+    info = np.einsum('gk,ki,kj->gij', n_trials * p * (1 - p), X, X) + penalty
+
+    tested = n_trials > 0
+    extreme = np.minimum(p, 1 - p) < 1e-6
+
+    return dict(
+        beta = beta,
+        cov = np.linalg.pinv(info, hermitian=True),
+        nll = cm.binomial_nll(beta @ X.T, dict(n_trials=n_trials, n_action1=n_resp)),
+        converged = converged,
+        identified = np.linalg.matrix_rank(np.einsum('gk,ki,kj->gij', tested, X, X), hermitian=True) == 3,
+        separated = np.any(tested & extreme, axis=1)
+    )
+
+
+def get_tuning(beta, cov):
+    """
+    Convert coefficients of the sine and cosine regressors into amplitude and shift
+
+    Parameters:
+    ----------
+    beta : numpy array
+        Coefficients (nGroups x 3; bias, sine and cosine)
+    cov : numpy array
+        Covariance of coefficients (nGroups x 3 x 3)
+
+    Returns:
+    --------
+    tuning : pandas dataframe
+        Bias, amplitude, shift and preferred angle (degrees), with standard
+        errors (delta method)
+
+    >>> tuning = get_tuning(np.array([[0.5, 0., 2.]]), np.zeros((1, 3, 3)))
+    >>> tuning[['bias', 'amplitude', 'shift', 'preferred_angle']].round(6).values.tolist()
+    [[0.5, 2.0, 90.0, 0.0]]
+    """
+
+    (b0, b1, b2) = beta.T
+    amplitude = np.hypot(b1, b2)
+
+    # Gradients of amplitude and shift (radians) with respect to coefficients
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d_amplitude = np.column_stack([np.zeros_like(b0), b1 / amplitude, b2 / amplitude])
+        d_shift = np.column_stack([np.zeros_like(b0), -b2 / amplitude**2, b1 / amplitude**2])
+
+        se = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+        amplitude_se = np.sqrt(np.einsum('gi,gij,gj->g', d_amplitude, cov, d_amplitude))
+        shift_se = np.rad2deg(np.sqrt(np.einsum('gi,gij,gj->g', d_shift, cov, d_shift)))
+
+    shift = np.rad2deg(np.arctan2(b2, b1))
+
+    return pd.DataFrame(dict(
+        bias = b0,
+        bias_se = se[:, 0],
+        beta_sin = b1,
+        beta_sin_se = se[:, 1],
+        beta_cos = b2,
+        beta_cos_se = se[:, 2],
+        amplitude = amplitude,
+        amplitude_se = amplitude_se,
+        shift = shift,
+        shift_se = shift_se,
+        preferred_angle = cang.wrap_to_180(90 - shift),
+        preferred_angle_se = shift_se
+    ))
+
+
+def count_session_responses(trials, stim_col, window=1):
+    """
+    Count trials and responses at each sound angle in each session (or sliding
+    window of consecutive sessions) for each ferret
+
+    Parameters:
+    ----------
+    trials : pandas dataframe
+        Formatted trials (e.g. from cf_store.load_trials), with ferret,
+        SessionDate, Response and sound angle
+    stim_col : str
+        Column containing sound angle (e.g. 'speaker_angle_platform')
+    window : int, optional
+        Number of consecutive sessions combined in each fit
+
+    Returns:
+    --------
+    sessions : pandas dataframe
+        Ferret, SessionDate (last session in window) and FirstSession (first
+        session in window) for each group
+    theta : numpy array
+        Sound angles (degrees)
+    n_trials, n_resp : numpy array
+        Number of trials and responses (Response = 1) for each group and sound
+        angle (nGroups x nAngles)
+    """
+
+    keys = ['ferret', 'SessionDate', stim_col]
+    responded = (trials['Response'] == 1).astype(int)
+
+    counts = (
+        trials[keys]
+        .assign(nTrials=1, nResp=responded)
+        .groupby(keys, observed=True)[['nTrials', 'nResp']]
+        .sum()
+        .unstack(stim_col, fill_value=0)
+        .sort_index()
+        )
+
+    theta = counts['nTrials'].columns.to_numpy()
+    session_date = counts.index.get_level_values('SessionDate')
+    by_ferret = counts.groupby(level='ferret', observed=True)
+
+    # Sum counts over sliding windows within each ferret
+    if window > 1:
+        total = by_ferret.cumsum()
+        counts = total - total.groupby(level='ferret', observed=True).shift(window, fill_value=0)
+
+        first_session = by_ferret.cumcount().to_numpy() - (window - 1)
+        is_complete = first_session >= 0
+
+        first_date = session_date[np.maximum(np.arange(len(session_date)) - (window - 1), 0)]
+        counts, first_date = counts[is_complete], first_date[is_complete]
+    else:
+        first_date = session_date
+
+    sessions = counts.index.to_frame(index=False)
+    sessions['FirstSession'] = first_date
+
+    return sessions, theta, counts['nTrials'].to_numpy(), counts['nResp'].to_numpy()
+
+
+def fit_sessions(trials, stim_col='speaker_angle_platform', window=1, ridge=0.0):
+    """
+    Fit spatial tuning of behavior in every session (or window of sessions)
+
+    Parameters:
+    ----------
+    trials : pandas dataframe
+        Formatted trials for one or more ferrets
+    stim_col : str, optional
+        Column containing sound angle ('speaker_angle_platform' or 'speaker_angle_world')
+    window : int, optional
+        Number of consecutive sessions combined in each fit
+    ridge : float, optional
+        L2 penalty on sine and cosine coefficients (see fit_circular_logistic)
+
+    Returns:
+    --------
+    fits : pandas dataframe
+        One row per ferret and session (or window), with number of trials,
+        parameters, standard errors, negative log-likelihood and whether the
+        fit converged and was separated (see fit_circular_logistic).
+        Parameters are missing for sessions that are not identified.
+    """
+
+    sessions, theta, n_trials, n_resp = count_session_responses(trials, stim_col, window)
+
+    fit = fit_circular_logistic(n_trials, n_resp, theta, ridge=ridge)
+
+    tuning = get_tuning(fit['beta'], fit['cov'])
+    tuning[~fit['identified']] = np.nan
+
+    fits = pd.concat([sessions, tuning], axis=1)
+    fits.insert(3, 'nTrials', n_trials.sum(axis=1))
+    fits.insert(4, 'nAngles', (n_trials > 0).sum(axis=1))
+    fits['NegLogLik'] = fit['nll']
+    fits['converged'] = fit['converged']
+    fits['identified'] = fit['identified']
+    fits['separated'] = fit['separated']
+
+    return fits
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Fit spatial tuning of behavior in each session')
+    parser.add_argument('--stim_col', default='speaker_angle_platform', help='Column containing sound angle')
+    parser.add_argument('--window', type=int, default=1, help='Number of consecutive sessions in each fit')
+    parser.add_argument('--ridge', type=float, default=0.0, help='L2 penalty on sine and cosine coefficients')
+    parser.add_argument('--exclude_probe', action='store_true', help='Exclude probe trials')
+    args = parser.parse_args()
+
+    available = cfs.list_ferrets(cm.trial_store)
+    ferret_names = [f"F{x['num']}_{x['name']}" for x in ferrets]
+    ferret_names = [x for x in ferret_names if x in available]
+
+    columns = ['SessionDate', 'Response', 'not_probe', args.stim_col]
+    trials = cfs.load_trials(cm.trial_store, ferrets=ferret_names, columns=columns)
+
+    if args.exclude_probe:
+        trials = trials[trials['not_probe'] == 1]
+
+    start = datetime.now()
+    fits = fit_sessions(trials, stim_col=args.stim_col, window=args.window, ridge=args.ridge)
+    print(f"Fitted {fits.shape[0]} sessions in {(datetime.now() - start).total_seconds():.2f} s "
+          f"({(~fits['identified']).sum()} not identified, {fits['separated'].sum()} separated)")
+
+    # Save results
+    dt = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    save_path = cm.log_root / f"{dt}_Tuning"
+    save_path.mkdir(parents=True)
+
+    cm.write_config(save_path, dict(vars(args), ferrets=','.join(ferret_names)))
+    fits.to_csv( save_path / 'session_fits.csv', index=False)
+
+    is_valid = fits['identified'] & ~fits['separated']
+    print(fits[is_valid].groupby('ferret', observed=True)[['nTrials', 'bias', 'amplitude', 'preferred_angle']].median().to_string())
+    print(f"Results saved to {save_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,7 @@ import numpy as np
 import pandas as pd
 
 sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../../..')))
-from Analysis import cf_behavior as cb
+from Analysis import cf_angles as cang
 from Analysis import cf_plot as cfp
 from Modelling import cf_simulate as csim
 
@@ -42,10 +42,9 @@ def main():
 
     df['response_angle_platform'] = df['speaker_angle_platform'] - 90
     
-    df['response_angle_world'] = df['response_angle_platform'] + df['CenterSpoutRotation']
-    df['response_angle_world'] = df['response_angle_world'].apply(cb.wrap_to_180)
+    df['response_angle_world'] = cang.platform_to_world(df['response_angle_platform'], df['CenterSpoutRotation'])
     
-    df['Response'] = [(i-180) / -30 for i in df['response_angle_world']]
+    df['Response'] = cang.world_to_clock(df['response_angle_world'])
 
     def go_to_nearest_spout(x):
         return round(x / -90 )
@@ -4,6 +4,9 @@ Simulate performance of world-centered localization in which the probability of
 
 Output is a matplotlib figure saved to disk
 
+Performance and response probabilities are calculated exactly (rather than 
+simulated), so the figure is the same every time it's drawn
+
 """
 import os, sys
 
@@ -12,7 +15,7 @@ import numpy as np
 import pandas as pd
 
 sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../../..')))
-from Analysis import cf_behavior as cb
+from Analysis import cf_angles as cang
 from Analysis import cf_plot as cfp
 from Modelling import cf_simulate as csim
 
@@ -20,7 +23,6 @@ from Modelling import cf_simulate as csim
 def main():
 
     plt.style.use('seaborn')
-    rng = np.random.default_rng()
 
     nIterations = 1000
     color = 'r'
@@ -43,13 +45,12 @@ def main():
 
     df['response_angle_platform'] = df['speaker_angle_platform'] - 90
     
-    df['response_angle_world'] = df['response_angle_platform'] + df['CenterSpoutRotation']
-    df['response_angle_world'] = df['response_angle_world'].apply(cb.wrap_to_180)
+    df['response_angle_world'] = cang.platform_to_world(df['response_angle_platform'], df['CenterSpoutRotation'])
     
-    df['Response'] = [(i-180) / -30 for i in df['response_angle_world']]
+    df['Response'] = cang.world_to_clock(df['response_angle_world'])
 
     df['response_activation'] = df['response_angle_world'] - 90
-    df['response_activation'] = np.abs(df['response_activation'].apply(cb.wrap_to_180)) / 180
+    df['response_activation'] = np.abs(cang.wrap_to_180(df['response_activation'])) / 180
 
     # NB: Here, response activation is an inverse, normalised distance from the west response spout. I.e.:
     #   - if the target is the west spout (min distance), the activation is 1    
@@ -58,19 +59,18 @@ def main():
     # The value is symmetric on either side of the vector (equator) between east and west spouts
 
 
-    cw_out, rng = csim.get_percent_correct(
+    cw_out, _ = csim.get_percent_correct(
             df, 
             coldness = 1,
             task_var = 'speaker_angle_world', 
             task_map = task_map,
-            generator = rng
+            nIterations = nIterations
             )
 
-    df, rng = csim.get_response_probability(
+    df, _ = csim.get_response_probability(
         df, 
         coldness=1,
-        nIterations=nIterations, 
-        generator=rng
+        nIterations=nIterations
         )
 
 
@@ -14,6 +14,8 @@ the paper as Supplementary Table 1)
 Version History
     - 2021-08-29: Created
     - 2021-08-31: Split out functionality to plot_model_parameters.py, plot_validation_performance.py
+    - 2026-10-18: Heatmaps show exact response probabilities rather than simulated responses
+    - 2026-10-18: Load results from index of model results (cf_results.py)
 """
 
 import os, sys
@@ -29,6 +31,7 @@ sns.set_theme(style="whitegrid")
 sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../..')))
 from Analysis import ferrets
 from Analysis import cf_plot as cfp
+from Modelling import cf_results as cres
 from Modelling import cf_simulate as csim
 
 
@@ -45,47 +48,30 @@ def draw_curve(ax, coefs, color='k'):
 
 def get_models(file_path):
     """    
-    Get performance predicting held-out animal behavior for each fold 
-    of cross-validation
+    Get fitted parameters for each fold and run of cross-validation, from
+    the index of model results (see cf_results.py)
 
    Parameters:
    ----------
    file_path : pathlib posix path
        Directory containing multiple subdirectories, each of which contains
-       results files from a single model of one ferret
+       results files from a single model of one ferret (must be within an 
+       indexed directory)
    
    Returns:
    --------
-   ~ : pandas dataframe
-       Dataframe containing performance and ferret identifier
+   best_models : pandas dataframe
+       Parameters of the run with minimum negative log likelihood for each model
+   all_mdls : pandas dataframe
+       Parameters of all runs, with ferret identifier and predictor
    """
 
-    best_models, all_mdls = [], []
+    selection = dict(root=file_path.parent, group=file_path.name)
 
-    for model_dir in file_path.glob('*_TestModel_*'):
-
-        # Load data
-        config = csim.load_config(model_dir)        
-        df = pd.read_csv( model_dir / 'param_contrast.csv')
-        
-        # Format for later use
-        df['Ferret'] = int(config['InputData'][1:5])
-        df['predictor'] = config['stim_col']
-        
-        for x in df.columns:
-            df.rename({x:x.replace('_Xfit','')}, axis=1, inplace=True)
-
-        initial_columns = [x for x in df.columns if 'X0' in x]
-        df.drop(initial_columns, axis=1, inplace=True)
-
-        # Take all outcomes for scatter
-        all_mdls.append(df)
-        
-        # Take the model with minimum negative log likelihood for simulation
-        df = df[df['NegLogLik'] == df['NegLogLik'].min()]         
-        best_models.append(df)
+    best_models = cres.load_parameters(best_only=True, **selection)
+    all_mdls = cres.load_parameters(**selection)
     
-    return pd.concat(best_models), pd.concat(all_mdls)
+    return best_models, all_mdls
 
 
 class panel():
@@ -112,6 +98,7 @@ class panel():
 def main():
 
     root_dir = Path('Modelling/matlab/logs/')
+    cres.update_index(root_dir)                                             # Read any new or changed results
     
     bm1, _ = get_models( root_dir / 'CF8_FullAllo_Theta_Recoded')
     bm2, _ = get_models( root_dir / 'CF8_HeadCentred_Theta_Recoded')
@@ -133,9 +120,7 @@ def main():
         Sponge    = panel(1905, fig, 16.6),
     )
 
-    # Plot model outcomes and fold performance
-    rng = np.random.default_rng()       
-
+    # Plot model outcomes and fold performance (using exact response probabilities)
     for ferret in ferrets:         
 
         ferret['panel'] = panels[ferret['name']]
@@ -155,11 +140,10 @@ def main():
             theta = mdl_sim[ mdl_info['predictor']]            
             mdl_sim['response_activation'] = csim.run_mdl( theta, mdl_info)      
 
-            mdl_sim, rng = csim.get_response_probability(
+            mdl_sim, _ = csim.get_response_probability(
                 mdl_sim, 
                 coldness = mdl_info['coldness'],
-                nIterations = 1000, 
-                generator = rng
+                nIterations = 1000
                 )
 
             ax = ferret['panel'].axs[mdl_info['predictor']]
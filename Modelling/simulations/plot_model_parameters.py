@@ -13,6 +13,7 @@ the loss function that is straightforward to identify.
 
 Version History
     - 2021-08-31: Branched from plot_matlab_model.py
+    - 2026-10-18: Load results from index of model results (cf_results.py)
 """
 
 import os, sys
@@ -25,7 +26,7 @@ from pathlib import Path
 sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../..')))
 from Analysis import ferrets
 from Analysis import cf_plot as cfp
-from Modelling import cf_simulate as csim
+from Modelling import cf_results as cres
 
 plt.style.use('seaborn')
 
@@ -68,51 +69,29 @@ def plot_param_contrasts(file_path, axs):
 
 def get_models(file_path):
     """    
-    Get performance predicting held-out animal behavior for each fold 
-    of cross-validation
+    Get fitted parameters for each fold and run of cross-validation, from
+    the index of model results (see cf_results.py)
 
     Parameters:
     ----------
     file_path : pathlib posix path
         Directory containing multiple subdirectories, each of which contains
-        results files from a single model of one ferret
+        results files from a single model of one ferret (must be within an 
+        indexed directory)
 
     Returns:
     --------
     best_mdls : pandas dataframe
-        Dataframe containing performance of best model across folds for each ferret
+        Parameters of the run with minimum negative log likelihood for each model
     all_mdls : pandas dataframe
-        Dataframe containing performance of all models for each ferret
+        Parameters of all runs, with ferret identifier and predictor
     """
 
-    best_models, all_mdls = [], []
+    selection = dict(root=file_path.parent, group=file_path.name)
 
-    for model_dir in file_path.glob('*_TestModel_*'):
-
-        # Load data
-        config = csim.load_config(model_dir)        
-        df = pd.read_csv( model_dir / 'param_contrast.csv')
-        
-        # Format for later use
-        df['Ferret'] = int(config['InputData'][1:5])
-        df['predictor'] = config['stim_col']
-        
-        for x in df.columns:
-            df.rename({x:x.replace('_Xfit','')}, axis=1, inplace=True)
-
-        initial_columns = [x for x in df.columns if 'X0' in x]
-        df.drop(initial_columns, axis=1, inplace=True)
-
-        # Take all outcomes for scatter
-        all_mdls.append(df)
-        
-        # Take the model with minimum negative log likelihood for simulation
-        df = df[df['NegLogLik'] == df['NegLogLik'].min()]         
-        best_models.append(df)
+    best_models = cres.load_parameters(best_only=True, **selection)
+    all_mdls = cres.load_parameters(**selection)
     
-    best_models = pd.concat(best_models)
-    all_mdls = pd.concat(all_mdls)
-
     return best_models, all_mdls
 
 
@@ -177,6 +156,7 @@ def main():
 
     # Load data
     root_dir = Path('Modelling/matlab/logs/')
+    cres.update_index(root_dir)                                             # Read any new or changed results
     
     _, am1 = get_models( root_dir / 'CF8_FullAllo_Theta_Recoded')
     _, am2 = get_models( root_dir / 'CF8_HeadCentred_Theta_Recoded')
@@ -11,6 +11,7 @@ and interquartile range across folds.
 
 Version History
     - 2021-08-31: Branched from plot_matlab_model.py
+    - 2026-10-18: Load results from index of model results (cf_results.py)
 """
 
 import os, sys
@@ -25,19 +26,20 @@ plt.style.use('seaborn')
 sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../..')))
 from Analysis import ferrets
 from Analysis import cf_plot as cfp
-from Modelling import cf_simulate as csim
+from Modelling import cf_results as cres
 
 
 def get_fold_performance(file_path):
     """    
     Get performance predicting held-out animal behavior for each fold 
-    of cross-validation
+    of cross-validation, from the index of model results (see cf_results.py)
 
    Parameters:
    ----------
    file_path : pathlib posix path
        Directory containing multiple subdirectories, each of which contains
-       results files from a single model of one ferret
+       results files from a single model of one ferret (must be within an 
+       indexed directory)
    
    Returns:
    --------
@@ -45,20 +47,7 @@ def get_fold_performance(file_path):
        Dataframe containing performance and ferret identifier
    """
 
-    fold_performance = []
-
-    for model_dir in file_path.glob('*_TestModel_*'):
-
-        config = csim.load_config(model_dir)
-        
-        pf = pd.read_csv( model_dir / 'fold_performance.csv')
-        
-        pf['Ferret'] = int(config['InputData'][1:5])
-        pf['predictor'] = config['stim_col']
-
-        fold_performance.append(pf)
-    
-    return pd.concat(fold_performance)
+    return cres.load_fold_performance(root=file_path.parent, group=file_path.name)
 
 
 class panel():
@@ -115,6 +104,7 @@ class panel():
 def main():
 
     root_dir = Path('Modelling/matlab/logs/')
+    cres.update_index(root_dir)                                             # Read any new or changed results
     
     fold_performance = pd.concat([                                          # Get performance predicting behavior for each ferret
         get_fold_performance( root_dir / 'CF8_FullAllo_Theta'),
@@ -12,7 +12,10 @@ Stephen Town - October 2020
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import os
+import os, sys
+
+sys.path.insert(0, os.path.abspath( os.path.join(os.path.dirname(__file__), '../..')))
+from Analysis import cf_tracking as cft
 
 # Settings
 fS = 48848.125  # Sample rate of stimulus device (Hz)
@@ -27,17 +30,11 @@ files = {
 
 def select_frames_around_start_time(bd, ft, window_samps):
 
-    new_ft = []
-
-    for rIdx, row in bd.iterrows():
-
-        start_time = row['StartTime'] + tWindow[0]
-        start_samp = np.round(start_time * fS)
-        frame_idx = ft['TDT_Sample'].between(start_samp, start_samp + window_samps[0])
+    start_samp = np.round((bd['StartTime'].to_numpy() + tWindow[0]) * fS)
 
-        new_ft.append(ft.loc[frame_idx])
+    new_ft, _ = cft.extract_windows(ft, 'TDT_Sample', start_samp, start_samp + window_samps[0], include_upper=True)
 
-    return pd.concat(new_ft)
+    return new_ft
 
 
 def visualize_frame_times(ft, new_ft):